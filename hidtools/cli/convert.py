@@ -0,0 +1,84 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import argparse
+import io
+import sys
+import hidtools.recording
+import logging
+logging.basicConfig(format='%(levelname)s: %(name)s: %(message)s',
+                    level=logging.INFO)
+base_logger = logging.getLogger('hid')
+logger = logging.getLogger('hid.convert')
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description='Convert a HID recording between the text and binary format')
+    parser.add_argument('recording', metavar='recording.hid',
+                        type=argparse.FileType('rb'), help='Path to device recording')
+    parser.add_argument('output', metavar='output-file',
+                        type=str, help='The file to write to, - for stdout')
+    parser.add_argument('--format', choices=['text', 'binary'], default=None,
+                        help='The output format (default: the other format)')
+    parser.add_argument('--no-annotations', action='store_true', default=False,
+                        help='Do not write the decoded reports as comments')
+    parser.add_argument('--verbose', action='store_true',
+                        default=False, help='Show debugging information')
+    args = parser.parse_args(argv[1:])
+    if args.verbose:
+        base_logger.setLevel(logging.DEBUG)
+
+    with args.recording as f:
+        devices = None
+        if f.seekable():
+            # a text recording may describe devices after the first events,
+            # collect them in a first pass
+            first = hidtools.recording.open_recording(hidtools.recording.decompress(f))
+            devices = first.read_devices()
+            if isinstance(first, hidtools.recording.TextRecordingReader):
+                # the wrapper would close the file once garbage collected
+                first.file.detach()
+            f.seek(0)
+
+        reader = hidtools.recording.open_recording(hidtools.recording.decompress(f))
+        binary = isinstance(reader, hidtools.recording.TextRecordingReader)
+        if args.format is not None:
+            binary = args.format == 'binary'
+
+        if args.output == '-':
+            output = sys.stdout.buffer
+        else:
+            output = hidtools.recording.open_recording_file(args.output, 'wb')
+
+        with output:
+            if binary:
+                writer = hidtools.recording.BinaryRecordingWriter(output)
+                hidtools.recording.convert(reader, writer, devices)
+            else:
+                text = io.TextIOWrapper(output, encoding='utf-8')
+                writer = hidtools.recording.TextRecordingWriter(text, not args.no_annotations)
+                try:
+                    hidtools.recording.convert(reader, writer, devices)
+                finally:
+                    text.flush()
+                    text.detach()
+
+
+if __name__ == '__main__':
+    main()
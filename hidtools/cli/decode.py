@@ -19,11 +19,13 @@
 
 
 import argparse
+import io
 import os
 import re
 import sys
 import hidtools.hid
 import hidtools.hidraw
+import hidtools.recording
 import logging
 logging.basicConfig(format='%(levelname)s: %(name)s: %(message)s',
                     level=logging.INFO)
@@ -65,7 +67,11 @@ def open_hidraw(path):
 def open_binary(path):
     # This will misidentify a few files (e.g. UTF-16) as binary but for the
     # inputs we need to accept it doesn't matter
-    with open(path, 'rb') as fd:
+    with hidtools.recording.open_recording_file(path) as fd:
+        if hidtools.recording.is_binary_recording(fd):
+            logger.debug('{path} is a binary recording'.format(**locals()))
+            reader = hidtools.recording.BinaryRecordingReader(fd)
+            return [d.report_descriptor for i, d in sorted(reader.devices.items())]
         data = fd.read(4096)
         if b'\0' in data:
             logger.debug('{path} is a binary file'.format(**locals()))
@@ -103,10 +109,10 @@ def open_report_descriptor(path):
     if rdesc is not None:
         return rdesc
 
-    with open(path, 'r') as fd:
+    with io.TextIOWrapper(hidtools.recording.open_recording_file(path), encoding='utf-8') as fd:
         logger.debug('Opening {path} as text file'.format(**locals()))
-        lines = fd.readlines()
-        rdesc = interpret_file_hidrecorder(lines)
+        # iterate instead of reading all lines, recordings can be large
+        rdesc = interpret_file_hidrecorder(fd)
         if rdesc is not None:
             return rdesc
 
@@ -123,11 +129,15 @@ def main(argv=sys.argv):
                             help='The file to record to (default: stdout)')
         parser.add_argument('--verbose', action='store_true',
                             default=False, help='Show debugging information')
+        parser.add_argument('--cache', action='store_true',
+                            default=False, help='Use the report descriptor cache')
         args = parser.parse_args(argv[1:])
         # argparse gives us a list size 1 for nargs 1
         output = args.output[0]
         if args.verbose:
             base_logger.setLevel(logging.DEBUG)
+        if args.cache:
+            hidtools.hid.ReportDescriptor.cache = hidtools.hid.PersistentReportDescriptorCache()
         for path in args.report_descriptor:
             rdescs = open_report_descriptor(path)
             for rdesc in rdescs:
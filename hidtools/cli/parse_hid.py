@@ -19,8 +19,10 @@
 #
 
 import argparse
+import io
 import sys
 import hidtools.hid
+import hidtools.recording
 from parse import parse as _parse
 
 
@@ -49,7 +51,7 @@ def get_report(time, report, rdesc):
             # the `-1` below is to make a better visual effect
             indent_2nd_line = slash - 1
 
-    indent = '\n{" " * indent_2nd_line}'.format(**locals())
+    indent = '\n' + ' ' * indent_2nd_line
 
     return indent.join(output.split('\n'))
 
@@ -58,6 +60,10 @@ def parse_event(line, rdesc_object):
     e, time, size, report = line.split(' ', 3)
     report = [int(item, 16) for item in report.split(' ')]
     assert int(size) == len(report)
+    return format_event(time, report, rdesc_object)
+
+
+def format_event(time, report, rdesc_object):
     rdesc = rdesc_object.get(report[0], len(report))
     if rdesc is None:
         return None
@@ -109,18 +115,67 @@ def parse_hid(f_in, f_out, print_events=True):
             f_out.write(line)
 
 
+def parse_binary(reader, f_out, print_events=True, events=None):
+    """
+    Same as :func:`parse_hid` but for a
+    :class:`hidtools.recording.BinaryRecordingReader` or
+    :class:`hidtools.recording.Recording`. If ``events`` is given, only
+    those events are printed instead of all events in ``reader``.
+    """
+    for idx, device in sorted(reader.devices.items()):
+        rdesc_object = device.report_descriptor
+        rdesc_object.dump(f_out)
+        if rdesc_object.win8:
+            f_out.write("**** win 8 certified ****\n")
+
+    if not print_events:
+        return
+
+    if events is None:
+        events = reader
+
+    for event in events:
+        sec, usec = divmod(event.timestamp // 1000, 1000000)
+        time = '{sec:06d}.{usec:06d}'.format(**locals())
+        rdesc_object = reader.devices[event.device].report_descriptor
+        output = format_event(time, list(event.data), rdesc_object)
+        if output:
+            f_out.write(output)
+            f_out.write("\n")
+
+
 def main():
     parser = argparse.ArgumentParser(description='Parse a HID recording and display it in human-readable format')
     parser.add_argument('recording', metavar='recording.hid', nargs='?',
                         help='Path to device recording (stdin if missing)',
-                        type=argparse.FileType('r'), default=sys.stdin)
+                        type=argparse.FileType('rb'), default=sys.stdin.buffer)
     parser.add_argument('--report-descriptor-only', action='store_true',
                         help='Only print the Report Descriptor',
                         default=False)
+    parser.add_argument('--start', type=float, default=None, metavar='SECONDS',
+                        help='Only print the events from this timestamp on')
+    parser.add_argument('--end', type=float, default=None, metavar='SECONDS',
+                        help='Only print the events before this timestamp')
     args = parser.parse_args()
     with args.recording as f:
         try:
-            parse_hid(f, sys.stdout, not args.report_descriptor_only)
+            if args.start is not None or args.end is not None:
+                if f is sys.stdin.buffer:
+                    parser.error('--start and --end require a recording file')
+                start = None if args.start is None else int(args.start * 1000000000)
+                end = None if args.end is None else int(args.end * 1000000000)
+                with hidtools.recording.Recording(f.name) as recording:
+                    parse_binary(recording, sys.stdout, not args.report_descriptor_only,
+                                 recording.between(start, end))
+                return
+
+            f = hidtools.recording.decompress(f)
+            if hidtools.recording.is_binary_recording(f):
+                reader = hidtools.recording.BinaryRecordingReader(f)
+                parse_binary(reader, sys.stdout, not args.report_descriptor_only)
+            else:
+                f = io.TextIOWrapper(f, encoding='utf-8')
+                parse_hid(f, sys.stdout, not args.report_descriptor_only)
         except KeyboardInterrupt:
             pass
         except BrokenPipeError:
@@ -18,30 +18,34 @@
 #
 
 import select
+import signal
 import argparse
+import heapq
+import io
 import sys
 import os
+import time
 
+import hidtools.hidraw
 from hidtools.hidraw import HidrawDevice
+from hidtools.recording import BinaryRecordingWriter, RecordingEvent, TextRecordingWriter
+from hidtools.recording import compression_for_path, open_recording_file
 
 
 def list_devices():
     outfile = sys.stdout if os.isatty(sys.stdout.fileno()) else sys.stderr
     devices = {}
-    for fname in os.listdir('/dev/'):
-        if not fname.startswith('hidraw'):
-            continue
-
-        with open('/dev/{fname}'.format(**locals())) as f:
-            d = HidrawDevice(f)
-            devices[int(fname[6:])] = d.name
+    # only the names are needed, don't open and parse every device
+    for info in hidtools.hidraw.list_devices():
+        devices[int(info.devnode[len('/dev/hidraw'):])] = info
 
     if not devices:
         print('No devices found', file=sys.stderr)
         sys.exit(1)
 
     print('Available devices:', file=outfile)
-    for num, name in sorted(devices.items()):
+    for num, info in sorted(devices.items()):
+        name = info.name
         print('/dev/hidraw{num}:	{name}'.format(**locals()), file=outfile)
 
     lo = min(devices.keys())
@@ -51,65 +55,188 @@ def list_devices():
           end='', flush=True, file=outfile)
     try:
         num = int(sys.stdin.readline())
-        if num < lo or num > hi:
-            raise ValueError
-        return '/dev/hidraw{num}'.format(**locals())
-    except ValueError:
+        return devices[num]
+    except (ValueError, KeyError):
         print('Invalid device', file=sys.stderr)
         sys.exit(1)
 
 
+def open_output(path, binary):
+    if path == '-':
+        return sys.stdout.buffer if binary else sys.stdout
+    output = open_recording_file(path, 'wb')
+    if binary:
+        return output
+    return io.TextIOWrapper(output, encoding='utf-8')
+
+
+class Recorder(object):
+    """
+    Records the events of one or more :class:`HidrawDevice` into a single
+    recording. The devices' file descriptors must be nonblocking, the
+    devices that are ready are read one report at a time in turn until
+    ``EAGAIN``, so the timestamps of simultaneous reports interleave, and
+    the events of all devices are written in timestamp order.
+
+    :param list devices: the devices, in the order of their index in the
+        recording
+    :param writer: the :class:`hidtools.recording.TextRecordingWriter` or
+        :class:`hidtools.recording.BinaryRecordingWriter`
+    :param output: the file ``writer`` writes to
+    :param float flush_interval: flush the output at most every this many
+        seconds, 0 flushes after every batch of events
+    """
+    def __init__(self, devices, writer, output, flush_interval=0):
+        self.writer = writer
+        self.output = output
+        self.flush_interval = max(0, flush_interval)
+        self.devices = {}
+        self.epoll = select.epoll()
+        for idx, device in enumerate(devices):
+            fd = device.device.fileno()
+            self.epoll.register(fd, select.EPOLLIN)
+            self.devices[fd] = (idx, device)
+        self._is_first_event = True
+        self._last_flush = time.monotonic()
+        self._pending = False
+
+    def write_header(self):
+        self.writer.write_header([d.recording_device(idx) for idx, d in self.devices.values()])
+        self.output.flush()
+
+    def poll(self, timeout=None):
+        """
+        Wait for at most ``timeout`` seconds for events and record them.
+        Buffered events are flushed after at most ``flush_interval``, even
+        if no other events arrive.
+
+        :param float timeout: the timeout in seconds or ``None`` to wait
+            until an event arrives or the output is due to be flushed
+        :returns: the number of devices that were ready
+        """
+        timeout = -1 if timeout is None else timeout
+        if self._pending and self.flush_interval:
+            due = max(0, self._last_flush + self.flush_interval - time.monotonic())
+            timeout = due if timeout < 0 else min(timeout, due)
+
+        ready = [self.devices[fd] for fd, event in self.epoll.poll(timeout)]
+        pending = [device for idx, device in ready]
+        while pending:
+            for device in list(pending):
+                if not self._read_one(device):
+                    pending.remove(device)
+                    continue
+
+                # the devices not read yet must use the same time offset
+                if self._is_first_event and device.time_offset is not None:
+                    self._is_first_event = False
+                    for _, d in self.devices.values():
+                        d.time_offset = device.time_offset
+
+        # each device's events are in order, merge them into a single
+        # timeline
+        writer = self.writer
+        batches = [[RecordingEvent(idx, e.timestamp, bytes(e.bytes)) for e in device.new_events()]
+                   for idx, device in ready]
+        for e in heapq.merge(*batches, key=lambda e: e.timestamp):
+            writer.write_event(e)
+
+        for idx, device in ready:
+            dropped = device.new_drops()
+            if dropped:
+                writer.write_comment('{dropped} reports dropped from device {idx}, the ring buffer is full'.format(**locals()))
+        self._pending = self._pending or bool(ready)
+
+        now = time.monotonic()
+        if self._pending and now - self._last_flush >= self.flush_interval:
+            self.output.flush()
+            self._last_flush = now
+            self._pending = False
+
+        return len(ready)
+
+    def _read_one(self, device):
+        # read a single report, False once the device has none left
+        if device.ring_buffer is not None:
+            return device.capture(1) > 0
+        last = device.events[-1] if device.events else None
+        device.read_events(1)
+        return bool(device.events) and device.events[-1] is not last
+
+    def close(self):
+        self.epoll.close()
+
+
+def _terminate(signum, frame):
+    # stop like on ctrl+c so the output is completed
+    raise KeyboardInterrupt
+
+
 def main():
     parser = argparse.ArgumentParser(description='Record a HID device')
     parser.add_argument('device', metavar='/dev/hidrawX',
                         nargs="*", type=argparse.FileType('r'),
                         help='Path to the hidraw device node')
     parser.add_argument('--output', metavar='output-file',
-                        nargs=1, default=[sys.stdout],
-                        type=argparse.FileType('w'),
+                        nargs=1, default=['-'], type=str,
                         help='The file to record to (default: stdout)')
+    parser.add_argument('--format', choices=['text', 'binary'], default='text',
+                        help='The recording format (default: text)')
+    parser.add_argument('--ring-buffer', metavar='N', type=int, default=0,
+                        help='Capture into a preallocated buffer of N reports per device')
+    parser.add_argument('--flush-interval', metavar='seconds', type=float, default=None,
+                        help='Flush the output at most every this many seconds (default: after every event batch, every second for compressed output)')
+    parser.add_argument('--no-annotations', action='store_true', default=False,
+                        help='Do not write the decoded reports as comments')
     args = parser.parse_args()
 
-    devices = {}
-    last_index = -1
-    poll = select.poll()
-    is_first_event = True
-
     # argparse always gives us a list for nargs 1
-    output = args.output[0]
+    binary = args.format == 'binary'
+    output = open_output(args.output[0], binary)
+    if binary:
+        writer = BinaryRecordingWriter(output)
+    else:
+        writer = TextRecordingWriter(output, annotate=not args.no_annotations)
+    flush_interval = args.flush_interval
+    if flush_interval is None:
+        # flushing a compressed stream ends the current block, flushing
+        # after every event batch would ruin the compression ratio
+        flush_interval = 1 if compression_for_path(args.output[0]) else 0
+
+    signal.signal(signal.SIGTERM, _terminate)
 
     try:
-        if not args.device:
-            args.device = [open(list_devices())]
-
-        for idx, fd in enumerate(args.device):
-            device = HidrawDevice(fd)
-            if len(args.device) > 1:
-                print('D: {idx}'.format(**locals()), file=output)
-            device.dump(output)
-            poll.register(fd, select.POLLIN)
-            devices[fd.fileno()] = (idx, device)
-
-        if len(devices) == 1:
-            last_index = 0
-
+        if args.device:
+            selected = [(fd, None) for fd in args.device]
+        else:
+            # the selected device was already enumerated, don't query it
+            # again
+            info = list_devices()
+            selected = [(open(info.devnode), info)]
+
+        devices = []
+        for fd, info in selected:
+            # events are written out as they arrive, no need to keep them
+            device = HidrawDevice(fd, retain_events=0, info=info)
+            if args.ring_buffer > 0:
+                device.enable_capture(args.ring_buffer)
+            # each ready device is drained until EAGAIN
+            os.set_blocking(fd.fileno(), False)
+            devices.append(device)
+
+        recorder = Recorder(devices, writer, output, flush_interval)
+        recorder.write_header()
         while True:
-            events = poll.poll()
-            for fd, event in events:
-                idx, device = devices[fd]
-                device.read_events()
-                if last_index != idx:
-                    print('D: {idx}'.format(**locals()), file=output)
-                    last_index = idx
-                device.dump(output)
-
-                if is_first_event:
-                    is_first_event = False
-                    for idx, d in devices.values():
-                        d.time_offset = device.time_offset
+            recorder.poll()
 
     except KeyboardInterrupt:
         pass
+    finally:
+        if args.output[0] == '-':
+            output.flush()
+        else:
+            # compressed streams are only complete once closed
+            output.close()
 
 
 if __name__ == '__main__':
@@ -22,8 +22,9 @@ from datetime import datetime, timedelta
 import argparse
 import sys
 import time
+import hidtools.hid
 import hidtools.uhid
-from parse import parse, findall
+from hidtools.recording import Recording, open_recording, open_recording_file
 
 import logging
 logging.basicConfig(format='%(levelname)s: %(name)s: %(message)s',
@@ -33,46 +34,28 @@ logger = logging.getLogger('hid.replay')
 
 
 class HIDReplay(object):
-    def __init__(self, filename):
+    def __init__(self, filename, start=None, end=None):
         self._devices = {}
         self.filename = filename
+        self.start = start
+        self.end = end
         self.replayed_count = 0
-        with open(filename) as f:
-            idx = 0
-            for line in f:
-                line = line.strip()
-                if line.startswith('D:'):
-                    r = parse('D: {idx:d}', line)
-                    assert r is not None
-                    idx = r['idx']
-                    continue
-                if idx not in self._devices:
-                    self._devices[idx] = hidtools.uhid.UHIDDevice()
-                dev = self._devices[idx]
-                if line.startswith('N:'):
-                    r = parse('N: {name}', line)
-                    assert r is not None
-                    dev.name = r['name']
-                elif line.startswith('I:'):
-                    r = parse('I: {bus:x} {vid:x} {pid:x}', line)
-                    assert r is not None
-                    dev.info = [r['bus'], r['vid'], r['pid']]
-                elif line.startswith('P:'):
-                    r = parse('P: {phys}', line)
-                    if r is not None:
-                        dev.phys = r['phys']
-                elif line.startswith('R:'):
-                    r = parse('R: {length:d} {desc}', line)
-                    assert r is not None
-                    length = r['length']
-                    dev.rdesc = r['desc']
-                    assert len(dev.rdesc) == length
+        with open_recording_file(filename) as f:
+            # devices may be described after the first events
+            for idx, d in open_recording(f).read_devices().items():
+                dev = hidtools.uhid.UHIDDevice()
+                dev.name = d.name
+                dev.info = [d.bustype, d.vendor_id, d.product_id]
+                if d.phys is not None:
+                    dev.phys = d.phys
+                dev.rdesc = d.rdesc
+                self._devices[idx] = dev
 
         for d in self._devices.values():
             d.create_kernel_device()
 
-        while not self.ready:
-            hidtools.uhid.UHIDDevice.dispatch(1000)
+        for d in self._devices.values():
+            d.wait_ready(require=('evdev',))
 
     @property
     def ready(self):
@@ -91,48 +74,41 @@ class HIDReplay(object):
     def inject_events(self, wait_max_seconds=2):
         t = None
         timestamp_offset = 0
-        with open(self.filename) as f:
-            idx = 0
-            dev = None
-            if idx in self._devices:
-                dev = self._devices[idx]
-            for l in f:
-                if l.startswith('D:'):
-                    r = parse('D: {idx:d}', l)
-                    assert r is not None
-                    dev = self._devices[r['idx']]
-                elif l.startswith('E:'):
-                    r = parse('E: {sec:d}.{usec:d} {len:2d}{data}', l)
-                    assert r is not None
-                    length = r['len']
-                    timestamp = r['sec'] + r['usec'] / 1000000
-                    r_ = findall(' {:S}', r['data'])
-                    data = [int(x[0], 16) for x in r_]
-                    assert len(data) == int(length)
-                    now = datetime.today()
-                    if t is None:
-                        t = now
-                        timestamp_offset = timestamp
-                    target_time = t + timedelta(seconds=timestamp - timestamp_offset)
-                    sleep = 0
-                    if target_time > now:
-                        sleep = target_time - now
-                        sleep = sleep.seconds + sleep.microseconds / 1000000
-                    if sleep < 0.01:
-                        pass
-                    elif sleep < wait_max_seconds:
-                        time.sleep(sleep)
-                    else:
-                        t = now
-                        timestamp_offset = timestamp
-                        time.sleep(wait_max_seconds)
-                    dev.call_input_event(data)
+        if self.start is None and self.end is None:
+            recording = open_recording_file(self.filename)
+            events = open_recording(recording)
+        else:
+            recording = Recording(self.filename)
+            events = recording.between(self.start, self.end)
+        with recording:
+            for event in events:
+                dev = self._devices[event.device]
+                timestamp = event.timestamp / 1000000000
+                now = datetime.today()
+                if t is None:
+                    t = now
+                    timestamp_offset = timestamp
+                target_time = t + timedelta(seconds=timestamp - timestamp_offset)
+                sleep = 0
+                if target_time > now:
+                    sleep = target_time - now
+                    sleep = sleep.seconds + sleep.microseconds / 1000000
+                if sleep < 0.01:
+                    pass
+                elif sleep < wait_max_seconds:
+                    time.sleep(sleep)
+                else:
+                    t = now
+                    timestamp_offset = timestamp
+                    time.sleep(wait_max_seconds)
+                dev.call_input_event(event.data)
         self.replayed_count += 1
 
     def replay_one_sequence(self):
         count = self.replayed_count
         re = '' if count == 0 else 're'
-        print('Hit enter to {re}start replaying the events'.format(**locals()), end=        sys.stdin.readline()
+        print('Hit enter to {re}start replaying the events'.format(**locals()), end='', flush=True)
+        sys.stdin.readline()
         self.inject_events()
 
         while count == self.replayed_count:
@@ -145,12 +121,22 @@ def main():
                         type=str, help='Path to device recording')
     parser.add_argument('--verbose', action='store_true',
                         default=False, help='Show debugging information')
+    parser.add_argument('--cache', action='store_true',
+                        default=False, help='Use the report descriptor cache')
+    parser.add_argument('--start', type=float, default=None, metavar='SECONDS',
+                        help='Only replay the events from this timestamp on')
+    parser.add_argument('--end', type=float, default=None, metavar='SECONDS',
+                        help='Only replay the events before this timestamp')
     args = parser.parse_args()
     if args.verbose:
         base_logger.setLevel(logging.DEBUG)
+    if args.cache:
+        hidtools.hid.ReportDescriptor.cache = hidtools.hid.PersistentReportDescriptorCache()
 
     try:
-        with HIDReplay(args.recording) as replay:
+        start = None if args.start is None else int(args.start * 1000000000)
+        end = None if args.end is None else int(args.end * 1000000000)
+        with HIDReplay(args.recording, start, end) as replay:
             while True:
                 replay.replay_one_sequence()
     except PermissionError:
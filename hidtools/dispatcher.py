@@ -0,0 +1,216 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Dispatchers call a function whenever a file descriptor becomes readable.
+A :class:`hidtools.uhid.UHIDDevice` registers its ``/dev/uhid`` file
+descriptor and a udev monitor with a dispatcher. Devices sharing a
+dispatcher form a group that is independent of other groups. ::
+
+    # pumped by the caller, like UHIDDevice.dispatch()
+    dispatcher = SelectorDispatcher()
+    device = MyDevice(dispatcher=dispatcher)
+    device.create_kernel_device()
+    device.wait_ready()
+
+    # driven by an asyncio event loop
+    device = MyDevice(dispatcher=AsyncioDispatcher(loop))
+
+    # driven by a background thread, callbacks are called in that thread
+    device = MyDevice(dispatcher=ThreadDispatcher())
+"""
+
+import abc
+import asyncio
+import os
+import selectors
+import threading
+
+import logging
+logger = logging.getLogger('hidtools.dispatcher')
+
+
+class Dispatcher(abc.ABC):
+    """
+    The interface of all dispatchers.
+    """
+    @abc.abstractmethod
+    def add_reader(self, fd, callback):
+        """
+        Call ``callback()`` whenever ``fd`` is readable.
+
+        :param int fd: the file descriptor
+        :param callback: a function without arguments
+        """
+
+    @abc.abstractmethod
+    def remove_reader(self, fd):
+        """
+        Stop watching ``fd``, this does nothing if ``fd`` is not watched.
+        Once this returns, the callback for ``fd`` is not running and
+        is not called anymore.
+
+        :param int fd: the file descriptor
+        """
+
+    @abc.abstractmethod
+    def dispatch(self, timeout=None):
+        """
+        Wait for at most ``timeout`` milliseconds for any file descriptor
+        to become readable and call the respective callbacks. Only
+        dispatchers pumped by the caller implement this.
+
+        :param int timeout: the timeout in milliseconds or ``None`` to
+            wait forever
+        :returns: the number of file descriptors data was available on
+        """
+
+    def close(self):
+        """
+        Release the dispatcher's resources.
+        """
+        pass
+
+
+class SelectorDispatcher(Dispatcher):
+    """
+    A dispatcher based on :mod:`selectors`, i.e. ``epoll`` on Linux. The
+    caller must call :meth:`dispatch` regularly.
+    """
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+
+    def add_reader(self, fd, callback):
+        self._selector.register(fd, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fd):
+        try:
+            self._selector.unregister(fd)
+        except KeyError:
+            pass
+
+    def _select(self, timeout):
+        if timeout is not None:
+            timeout = timeout / 1000
+        return self._selector.select(timeout)
+
+    def _call(self, events):
+        fds = self._selector.get_map()
+        for key, mask in events:
+            # an earlier callback may have removed this fd
+            if fds.get(key.fd) is key:
+                key.data()
+
+    def dispatch(self, timeout=None):
+        events = self._select(timeout)
+        self._call(events)
+        return len(events)
+
+    def close(self):
+        self._selector.close()
+
+
+class AsyncioDispatcher(Dispatcher):
+    """
+    A dispatcher that uses ``loop.add_reader()``. The callbacks are called
+    by the running :mod:`asyncio` event loop, :meth:`dispatch` is not
+    supported.
+
+    :param loop: the event loop or ``None`` for the current one
+    """
+    def __init__(self, loop=None):
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+
+    def add_reader(self, fd, callback):
+        self.loop.add_reader(fd, callback)
+
+    def remove_reader(self, fd):
+        self.loop.remove_reader(fd)
+
+    def dispatch(self, timeout=None):
+        raise RuntimeError('Events are dispatched by the asyncio event loop')
+
+
+class ThreadDispatcher(SelectorDispatcher):
+    """
+    A :class:`SelectorDispatcher` that dispatches in a background thread,
+    the callbacks are called from that thread. :meth:`dispatch` is not
+    supported, call :meth:`close` to stop the thread.
+
+    The callbacks are called with a lock held that :meth:`remove_reader`
+    takes as well, so it waits for a running callback to finish. Do not
+    call :meth:`remove_reader` while holding a lock a callback waits for.
+    """
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._running = True
+        self._wakeup_fds = os.pipe()
+        for fd in self._wakeup_fds:
+            os.set_blocking(fd, False)
+        super().add_reader(self._wakeup_fds[0], self._drain_wakeup)
+        self._thread = threading.Thread(target=self._run, name='hidtools-dispatcher',
+                                        daemon=True)
+        self._thread.start()
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_fds[1], b'\0')
+        except BlockingIOError:
+            pass
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_fds[0], 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _run(self):
+        while self._running:
+            events = self._select(None)
+            with self._lock:
+                try:
+                    self._call(events)
+                except Exception:
+                    logger.exception('Exception in dispatcher callback')
+
+    def add_reader(self, fd, callback):
+        super().add_reader(fd, callback)
+        # make the thread pick up the new fd
+        self._wakeup()
+
+    def remove_reader(self, fd):
+        with self._lock:
+            super().remove_reader(fd)
+        self._wakeup()
+
+    def dispatch(self, timeout=None):
+        raise RuntimeError('Events are dispatched by the background thread')
+
+    def close(self):
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        for fd in self._wakeup_fds:
+            os.close(fd)
+        super().close()
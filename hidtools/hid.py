@@ -18,10 +18,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import copy
+import hashlib
+import marshal
+import os
 import sys
+import tempfile
+import threading
+from collections import namedtuple, OrderedDict
 from hidtools.hut import HUT
-from hidtools.util import twos_comp, to_twos_comp
+from hidtools.util import cache_dir, is_private, make_private_dir, twos_comp, to_twos_comp
 from parse import parse as _parse
 import logging
 logger = logging.getLogger('hidtools.hid')
@@ -130,6 +135,72 @@ class RangeError(Exception):
         return 'Value {self.value} is outside range {min}, {max} for {self.field.usage_name}'.format(**locals())
 
 
+class HidFieldLayout(namedtuple('HidFieldLayout',
+                                ['byte_offset', 'shift', 'size', 'count',
+                                 'mask', 'signed', 'shifts'])):
+    """
+    The precomputed bit layout of one :class:`HidField` within its
+    :class:`HidReport`, see :attr:`HidReport.layout`. This is an immutable
+    tuple.
+
+    .. attribute:: byte_offset
+
+        The index of the byte holding the field's first bit
+
+    .. attribute:: shift
+
+        The bit offset of the field's first bit within that byte
+
+    .. attribute:: size
+
+        The size of each element in bits
+
+    .. attribute:: count
+
+        The number of elements of this field
+
+    .. attribute:: mask
+
+        The bit mask for one element, i.e. ``(1 << size) - 1``
+
+    .. attribute:: signed
+
+        ``True`` if the values are two's complement numbers
+
+    .. attribute:: shifts
+
+        A tuple with the absolute bit offset within the report for each
+        element
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_field(cls, field):
+        start = field.start
+        size = field.size
+        count = field.count
+        return cls(start >> 3,
+                   start & 0x7,
+                   size,
+                   count,
+                   (1 << size) - 1,
+                   field.logical_min < 0 and size > 1,
+                   tuple(start + size * i for i in range(count)))
+
+
+_missing = object()
+
+
+def _numpy_dtype(numpy, size, signed):
+    """The smallest NumPy integer type to hold a ``size``-bit value"""
+    for bits in (8, 16, 32):
+        if size <= bits:
+            break
+    else:
+        bits = 64
+    return numpy.dtype('{}int{}'.format('' if signed else 'u', bits))
+
+
 class _HidRDescItem(object):
     """Represents one item in the Report Descriptor. This is a variable-sized
     element with one header byte and 0, 1, 2, 4 payload bytes.
@@ -191,21 +262,25 @@ class _HidRDescItem(object):
         self.raw_value = raw_values
         self.hid = hid
         self.value = value
-        try:
-            self.item = inv_hid[self.hid]
-        except KeyError:
+        if hid not in inv_hid:
             error = 'error while parsing {hid:02x}'.format(**locals())
             raise KeyError(error)
 
-        if self.item in ("Logical Minimum",
-                         "Physical Minimum",
-                         # "Logical Maximum",
-                         # "Physical Maximum",
-                         ):
+        if hid in self._SIGNED_TAGS:
             self._twos_comp()
-        if self.item == "Unit Exponent" and self.value > 7:
+        elif hid == self._UNIT_EXPONENT and self.value > 7:
             self.value -= 16
 
+    # Only the minimums are signed, see the HID spec 6.2.2.7
+    _SIGNED_TAGS = (hid_items['Global']['Logical Minimum'],
+                    hid_items['Global']['Physical Minimum'])
+    _UNIT_EXPONENT = hid_items['Global']['Unit Exponent']
+
+    @property
+    def item(self):
+        """The hid item as string (e.g. "Usage Page")"""
+        return inv_hid[self.hid]
+
     def _twos_comp(self):
         self.value = twos_comp(self.value, (self.size - 1) * 8)
         return self.value
@@ -231,13 +306,13 @@ class _HidRDescItem(object):
 
     def __repr__(self):
         data = ['{i:02x}'.format(**locals()) for i in self.bytes]
-        return '{" ".join(data)}'.format(**locals())
+        return ' '.join(data)
 
     def _get_raw_values(self):
         """The raw values as comma-separated hex numbers"""
         data = str(self)
         # prefix each individual value by "0x" and insert "," in between
-        data = '0x{data.replace(" ", ", 0x")},'.format(**locals())
+        data = '0x{},'.format(data.replace(" ", ", 0x"))
         return data
 
     def get_human_descr(self, indent):
@@ -260,21 +335,21 @@ class _HidRDescItem(object):
                     "Report Size",
                     "Report Count",
                     "Unit Exponent"):
-            descr += ' ({str(value)})'.format(**locals())
+            descr += ' ({value})'.format(**locals())
         elif item == "Collection":
-            descr += ' ({INV_COLLECTIONS[value].capitalize()})'.format(**locals())
+            descr += ' ({})'.format(INV_COLLECTIONS[value].capitalize())
             indent += 1
         elif item == "End Collection":
             indent -= 1
         elif item == "Usage Page":
             try:
-                descr += ' ({HUT[value].page_name})'.format(**locals())
+                descr += ' ({})'.format(HUT[value].page_name)
             except KeyError:
                 descr += ' (Vendor Usage Page 0x{value:02x})'.format(**locals())
         elif item == "Usage":
             usage = value | up
             try:
-                descr += ' ({HUT[up >> 16][value]})'.format(**locals())
+                descr += ' ({})'.format(HUT[up >> 16][value])
             except KeyError:
                 if (up >> 16) == HUT.usage_page_from_name('Sensor').page_id:
                     mod = (usage & 0xF000) >> 8
@@ -282,7 +357,7 @@ class _HidRDescItem(object):
                     mod_descr = sensor_mods[mod]
                     page_id = (usage & 0xFF00) >> 16
                     try:
-                        descr += ' ({HUT[page_id][usage & 0xFF]}  | {mod_descr})'.format(**locals())
+                        descr += ' ({}  | {})'.format(HUT[page_id][usage & 0xFF], mod_descr)
                     except KeyError:
                         descr += ' (Unknown Usage 0x{value:02x})'.format(**locals())
                 else:
@@ -350,24 +425,23 @@ class _HidRDescItem(object):
         return ' ' * eff_indent + descr, indent
 
     @classmethod
-    def _one_item_from_bytes(cls, rdesc):
+    def _one_item_from_bytes(cls, rdesc, offset=0):
         """
-        Parses a single (the first) item from the given report descriptor.
+        Parses a single item from the given report descriptor, starting at
+        ``offset``. The descriptor is indexed in place, no copy of the
+        remaining bytes is made.
 
         :param rdesc: a series of bytes representing the report descriptor
+        :param int offset: the index of the item's header byte in ``rdesc``
 
-        :returns: a single _HidRDescItem from the first ``item.size`` bytes
-                of the descriptor
-
-        .. note:: ``item.index_in_report`` is always 0 when using this function
+        :returns: a single _HidRDescItem from the ``item.size`` bytes
+                starting at ``offset``
         """
-        idx = 0
-        header = rdesc[idx]
-        if header == 0 and idx == len(rdesc) - 1:
+        header = rdesc[offset]
+        if header == 0 and offset == len(rdesc) - 1:
             # some devices present a trailing 0, skipping it
             return None
 
-        index_in_report = 0  # always zero, oh well
         size = header & 0x3
         if size == 3:
             size = 4
@@ -375,49 +449,44 @@ class _HidRDescItem(object):
         if hid == 0:
             raise ParseError('Unexpected HID type 0 in {header:02x}'.format(**locals()))
 
-        value = 0
-        raw_values = []
+        start = offset + 1
+        end = start + size
+        if end > len(rdesc):
+            raise ParseError('Truncated item {header:02x} at offset {offset}'.format(**locals()))
 
-        idx += 1
-        if size >= 1:
-            v = rdesc[idx]
-            idx += 1
-            raw_values.append(v)
-            value |= v
-        if size >= 2:
-            v = rdesc[idx]
-            idx += 1
-            raw_values.append(v)
-            value |= v << 8
-        if size >= 4:
-            v = rdesc[idx]
-            idx += 1
-            raw_values.append(v)
-            value |= v << 16
-            v = rdesc[idx]
-            idx += 1
-            raw_values.append(v)
-            value |= v << 24
+        raw_values = list(rdesc[start:end])
+        value = int.from_bytes(raw_values, 'little')
 
-        return _HidRDescItem(index_in_report, hid, value, raw_values)
+        return _HidRDescItem(offset, hid, value, raw_values)
 
     @classmethod
     def from_bytes(cls, rdesc):
         """
         Parses a series of bytes into items.
 
-        :param list rdesc: a series of bytes that are a HID report
-                descriptor
+        The descriptor is walked with a single cursor, each item only
+        looks at its own header and payload bytes, so parsing is linear in
+        the descriptor size.
+
+        :param rdesc: a series of bytes that are a HID report
+                descriptor. This may be a list of integers or any object
+                supporting the buffer protocol, e.g. ``bytes``,
+                ``bytearray``, :class:`array.array` or :class:`memoryview`.
 
         :returns: a list of items representing this report descriptor
         """
+        try:
+            rdesc = memoryview(rdesc).cast('B')
+        except TypeError:
+            # not a buffer, e.g. a list of ints, index it as-is
+            pass
+
         items = []
         idx = 0
         while idx < len(rdesc):
-            item = _HidRDescItem._one_item_from_bytes(rdesc[idx:])
+            item = _HidRDescItem._one_item_from_bytes(rdesc, idx)
             if item is None:
                 break
-            item.index_in_report = idx
             items.append(item)
             idx += item.size
 
@@ -532,7 +601,7 @@ class _HidRDescItem(object):
 
         bit_size = 0
         if value is not None:
-            bit_size = len('{value + 1:x}'.format(**locals())) * 4
+            bit_size = len('{:x}'.format(value + 1)) * 4
         else:
             value = 0
         tag = hid_items[hid_type[name]][name]
@@ -598,27 +667,27 @@ class _HidRDescItem(object):
         descr, indent = self.get_human_descr(indent)
 
         descr += " " * (35 - len(descr))
-        dump_file.write('{line} // {descr} {str(offset)}\n'.format(**locals()))
+        dump_file.write('{line} // {descr} {offset}\n'.format(**locals()))
         return indent
 
     def dump_rdesc_lsusb(self, indent, dump_file):
         """
         Format the hid item in a lsusb -v format.
         """
-        item = self.item()
+        item = self.item
         up = self.usage_page
         value = self.value
         data = "none"
         if item != "End Collection":
             data = " ["
             for v in self.raw_value:
-                data += ' 0x{v & 0xff:02x}'.format(**locals())
+                data += ' 0x{:02x}'.format(v & 0xff)
             data += ' ] {value}'.format(**locals())
-        dump_file.write('            Item({hid_type[item]:6s}): {item}, data={data}\n'.format(**locals()))
+        dump_file.write('            Item({:6s}): {item}, data={data}\n'.format(hid_type[item], **locals()))
         if item == "Usage":
             try:
                 page_id = up >> 16
-                dump_file.write('                 {HUT[page_id][value]}\n'.format(**locals()))
+                dump_file.write('                 {}\n'.format(HUT[page_id][value]))
             except KeyError:
                 pass
 
@@ -656,6 +725,15 @@ class HidField(object):
     .. attribute:: count
 
         Report Count for this HID field
+
+    .. attribute:: is_contact_meta
+
+        ``True`` if this field is one of the multitouch Contact Id, Contact
+        Max or Contact Count fields. These are exempt from the logical
+        range check in :meth:`fill_values`.
+
+    The usage and usage page names are looked up in the HID Usage Tables
+    once, when :attr:`usage` and :attr:`usage_page` are set.
     """
     def __init__(self,
                  report_ID,
@@ -688,24 +766,71 @@ class HidField(object):
         """
         Return a full copy of this HIDField.
         """
-        c = copy.copy(self)
+        # same as copy.copy() but without the generic __reduce_ex__ dance,
+        # the parser copies one field per report element
+        c = self.__class__.__new__(self.__class__)
+        c.__dict__.update(self.__dict__)
         if self.usages is not None:
             c.usages = self.usages[:]
         return c
 
-    def _usage_name(self, usage):
+    @property
+    def usage(self):
+        """
+        The 32-bit Usage for this field
+        """
+        return self._usage
+
+    @usage.setter
+    def usage(self, usage):
+        self._usage = usage
+        self._usage_name = self._lookup_usage_name(usage)
+        self.is_contact_meta = self._usage_name in ['Contact Id', 'Contact Max', 'Contact Count']
+
+    @property
+    def usages(self):
+        """
+        The list of 32-bit Usages for array fields or ``None``
+        """
+        return self._usages
+
+    @usages.setter
+    def usages(self, usages):
+        self._usages = usages
+        self._usage_names = None
+
+    @property
+    def usage_page(self):
+        """
+        The 32-bit Usage Page for this field, i.e. the Usage Page in the
+        upper 16 bits
+        """
+        return self._usage_page
+
+    @usage_page.setter
+    def usage_page(self, usage_page):
+        self._usage_page = usage_page
+        try:
+            self._usage_page_name = HUT[usage_page >> 16].page_name
+        except KeyError:
+            self._usage_page_name = ''
+
+    @staticmethod
+    def _lookup_usage_name(usage):
         usage_page = usage >> 16
         value = usage & 0x0000FFFF
-        if usage_page in HUT:
-            if HUT[usage_page].page_name == "Button":
-                name = 'B{str(value)}'.format(**locals())
-            else:
-                try:
-                    name = HUT[usage_page][value]
-                except KeyError:
-                    name = '0x{usage:04x}'.format(**locals())
+        try:
+            page = HUT[usage_page]
+        except KeyError:
+            return '0x{usage:04x}'.format(**locals())
+
+        if page.page_name == "Button":
+            name = 'B{value}'.format(**locals())
         else:
-            name = '0x{usage:04x}'.format(**locals())
+            try:
+                name = page[value]
+            except KeyError:
+                name = '0x{usage:04x}'.format(**locals())
         return name
 
     @property
@@ -713,14 +838,16 @@ class HidField(object):
         """
         The Usage name for this field (e.g. "Wheel").
         """
-        return self._usage_name(self.usage)
+        return self._usage_name
 
     def get_usage_name(self, index):
         """
         Return the Usage name for this field at the given index. Use this
         function when the HID field has multiple Usages.
         """
-        return self._usage_name(self.usages[index])
+        if self._usage_names is None:
+            self._usage_names = [self._lookup_usage_name(u) for u in self._usages]
+        return self._usage_names[index]
 
     @property
     def physical_name(self):
@@ -840,7 +967,7 @@ class HidField(object):
 
         for idx in range(self.count):
             v = data[idx]
-            if self.usage_name not in ['Contact Id', 'Contact Max', 'Contact Count']:
+            if not self.is_contact_meta:
                 if v < self.logical_min or v > self.logical_max:
                     raise RangeError(self, v)
             if self.logical_min < 0:
@@ -866,13 +993,7 @@ class HidField(object):
         """
         The Usage Page name for this field, e.g. "Generic Desktop"
         """
-        usage_page_name = ''
-        usage_page = self.usage_page >> 16
-        try:
-            usage_page_name = HUT[usage_page].page_name
-        except KeyError:
-            pass
-        return usage_page_name
+        return self._usage_page_name
 
     @classmethod
     def getHidFields(cls,
@@ -971,10 +1092,26 @@ class HidReport(object):
         self.report_ID = report_ID
         self.application = application
         self._application_name = None
+        self._layout = None
+        self._encoder = None
         self._bitsize = 0
         if self.numbered:
             self._bitsize = 8
 
+    def _copy(self):
+        """
+        Return a copy of this report that shares the fields and the
+        layout but not the per-call state of :meth:`format_report` and
+        :attr:`encoder`.
+        """
+        c = self.__class__.__new__(self.__class__)
+        c.__dict__.update(self.__dict__)
+        c.fields = self.fields[:]
+        c._encoder = None
+        c.__dict__.pop('prev_seen_usages', None)
+        c.__dict__.pop('prev_collection', None)
+        return c
+
     def append(self, field):
         """
         Add a :class:`HidField` to this report
@@ -984,6 +1121,8 @@ class HidReport(object):
         self.fields.append(field)
         field.start = self._bitsize
         self._bitsize += field.size
+        self._layout = None
+        self._encoder = None
 
     def extend(self, fields):
         """
@@ -996,6 +1135,8 @@ class HidReport(object):
         for f in fields:
             f.start = self._bitsize
             self._bitsize += f.size * f.count
+        self._layout = None
+        self._encoder = None
 
     @property
     def application_name(self):
@@ -1030,73 +1171,141 @@ class HidReport(object):
         """
         return self._bitsize >> 3
 
+    @property
+    def layout(self):
+        """
+        A tuple of :class:`HidFieldLayout`, one for each field in
+        :attr:`fields`, in the same order. The layout is computed once and
+        reused until the report is modified.
+        """
+        if self._layout is None:
+            self._layout = tuple(HidFieldLayout.from_field(f) for f in self.fields)
+        return self._layout
+
     def __iter__(self):
         return iter(self.fields)
 
-    def _fix_xy_usage_for_mt_devices(self, usage):
-        if usage not in self.prev_seen_usages:
-            return usage
-
-        # multitouch devices might have 2 X for CX, TX
-        if usage == 'X' and ('Y' not in self.prev_seen_usages or
-                             'CY' in self.prev_seen_usages):
-            usage = 'CX'
+    def decode(self, data):
+        """
+        Extract the values of all fields from the HID Report provided as a
+        list of 8-bit integers or a bytes-like object. ::
 
-        # multitouch devices might have 2 Y for CY, TY
-        if usage == 'Y' and ('X' not in self.prev_seen_usages or
-                             'CX' in self.prev_seen_usages):
-            usage = 'CY'
+            for field, values in zip(report.fields, report.decode(data)):
+                ...
 
-        return usage
+        This is equivalent to calling :meth:`HidField.get_values` for each
+        field in :attr:`fields` but uses the precomputed :attr:`layout`.
 
-    def _format_one_event(self, data, global_data, hidInputItem, r_out):
+        :param data: the bytes that are this report
+        :returns: a list with one list of values for each field
         """
-        Fill in the report array ``r_out`` with the data for this input
-        item. ``r_out`` is modified in place with the values from ``data``
-        or ``global_data`` (as fallback) that apply to this input item.
+        if len(data) < self.size:
+            # short reports need the per-field fallback for missing bytes
+            return [f.get_values(data) for f in self.fields]
 
-        :param object data: an object with attributes matching the HID usage names
-            in this report. Where an attribute is undefined, the
-            `global_data` is used instead.
-        :param object global_data: an object with attributes matching the
-            HID usage names, used whenever the `data` doesn't have an
-            attribute defined.
-        :param HidField hidInputItem: the input item of this report to set
-        :param list r_out: the integer array of values for this report,
-            modified in-place.
+        report = int.from_bytes(data, 'little')
+        values = []
+        for _, _, size, _, mask, signed, shifts in self.layout:
+            v = [(report >> shift) & mask for shift in shifts]
+            if signed:
+                sign_bit = 1 << (size - 1)
+                v = [x - ((x & sign_bit) << 1) for x in v]
+            values.append(v)
+        return values
+
+    def decode_batch(self, data):
         """
-        if hidInputItem.is_const:
-            return
+        Decode many reports of this HidReport at once into NumPy arrays.
+        This requires the optional :mod:`numpy` module. ::
 
-        usage = hidInputItem.usage_name
+            reports = numpy.frombuffer(recording, dtype=numpy.uint8).reshape(-1, report.size)
+            columns = report.decode_batch(reports)
+            x = columns[4][:, 0]
 
-        usage = self._fix_xy_usage_for_mt_devices(usage)
+        ``data`` is either a 2-dimensional ``uint8`` array with one report
+        per row or a bytes-like object with the reports concatenated, each
+        :attr:`size` bytes long. For numbered reports, every report must
+        have this report's ID.
 
-        if (self.prev_collection is not None and
-           self.prev_collection != hidInputItem.collection and
-           usage in self.prev_seen_usages):
-            if len(data) > 0:
-                data.pop(0)
-            self.prev_seen_usages.clear()
+        The return value is a list with one entry for each field in
+        :attr:`fields`, in the same order. Each entry is an array of shape
+        ``(N, count)`` with one column for each Usage of the field,
+        sign-extended where the field's logical minimum is negative.
+        Const fields and fields wider than 57 bits are ``None``.
 
-        value = 0
-        # Match the HID usage with our attributes, so
-        # Contact Count -> contactcount, etc.
-        field = usage.replace(' ', '').lower()
+        :param data: the ``N`` reports to decode
+        :returns: a list of arrays, one for each field
+        """
+        import numpy
 
-        if len(data) > 0 and hasattr(data[0], field):
-            value = getattr(data[0], field)
-        elif global_data is not None and hasattr(global_data, field):
-            value = getattr(global_data, field)
+        if isinstance(data, numpy.ndarray):
+            reports = data
+        else:
+            reports = numpy.frombuffer(data, dtype=numpy.uint8)
+        if reports.ndim == 1:
+            reports = reports.reshape(-1, self.size)
+        if reports.ndim != 2 or reports.dtype != numpy.uint8:
+            raise ValueError('Expected a 2-dimensional uint8 array of reports')
+        width = reports.shape[1]
+        if width < self.size:
+            raise ValueError('Reports of {width} bytes are shorter than {self.size}'.format(**locals()))
+        if self.numbered and numpy.any(reports[:, 0] != self.report_ID):
+            raise ValueError('Reports must all have Report ID {self.report_ID}'.format(**locals()))
+
+        columns = []
+        for field, (_, _, size, count, mask, signed, shifts) in zip(self.fields, self.layout):
+            if field.is_const or size > 57:
+                columns.append(None)
+                continue
 
-        try:
-            value[0]
-        except TypeError:
-            value = [value]
+            shifts = numpy.array(shifts, dtype=numpy.uint64)
+            first_byte = shifts >> numpy.uint64(3)
+            nbytes = int(((shifts & numpy.uint64(7)) + numpy.uint64(size + 7)).max()) >> 3
+            idx = (first_byte[:, None] + numpy.arange(nbytes, dtype=numpy.uint64)).astype(numpy.intp)
+            beyond = idx >= width
+
+            chunks = reports[:, numpy.minimum(idx, width - 1)].astype(numpy.uint64)
+            if beyond.any():
+                # bytes past the end of the report are zero, like decode()
+                chunks[:, beyond] = 0
+            chunks <<= numpy.arange(0, nbytes * 8, 8, dtype=numpy.uint64)
+            values = numpy.bitwise_or.reduce(chunks, axis=2)
+            values >>= shifts & numpy.uint64(7)
+            values &= numpy.uint64(mask)
+
+            if signed:
+                values = values.astype(numpy.int64)
+                values -= (values & (1 << (size - 1))) << 1
+            columns.append(values.astype(_numpy_dtype(numpy, size, signed)))
+
+        return columns
+
+    @staticmethod
+    def _fix_xy_usage_for_mt_devices(usage, prev_seen_usages):
+        if usage not in prev_seen_usages:
+            return usage
 
-        hidInputItem.fill_values(r_out, value)
-        self.prev_collection = hidInputItem.collection
-        self.prev_seen_usages.append(usage)
+        # multitouch devices might have 2 X for CX, TX
+        if usage == 'X' and ('Y' not in prev_seen_usages or
+                             'CY' in prev_seen_usages):
+            usage = 'CX'
+
+        # multitouch devices might have 2 Y for CY, TY
+        if usage == 'Y' and ('X' not in prev_seen_usages or
+                             'CX' in prev_seen_usages):
+            usage = 'CY'
+
+        return usage
+
+    @property
+    def encoder(self):
+        """
+        The :class:`HidReportEncoder` for this report. The encoder is
+        compiled once and reused until the report is modified.
+        """
+        if self._encoder is None:
+            self._encoder = HidReportEncoder(self)
+        return self._encoder
 
     def create_report(self, data, global_data):
         """
@@ -1115,22 +1324,11 @@ class HidReport(object):
 
         The HidReport will create the report according to the device's
         report descriptor.
-        """
-        self.prev_seen_usages = []
-        self.prev_collection = None
-        r = [0] * self.size
-
-        if self.numbered:
-            r[0] = self.report_ID
-
-        for item in self:
-            self._format_one_event(data, global_data, item, r)
 
-        if len(data) > 0:
-            # remove the last item we just processed
-            data.pop(0)
-
-        return r
+        This is a wrapper around :attr:`encoder`, use the encoder directly
+        to avoid converting the report into a list.
+        """
+        return list(self.encoder.encode(data, global_data))
 
     def format_report(self, data, split_lines=True):
         """
@@ -1164,7 +1362,7 @@ class HidReport(object):
             if not report_item.is_array:
                 value_format = "{:d}"
                 if report_item.size > 1:
-                    value_format = '{{:{str(len(str(1 << report_item.size)) + 1)}d}}'.format(**locals())
+                    value_format = '{{:{}d}}'.format(len(str(1 << report_item.size)) + 1)
                 if isinstance(values[0], str):
                     value_format = "{}"
                 if report_item.usage_page_name == 'Button':
@@ -1176,7 +1374,8 @@ class HidReport(object):
                         sep = ''
                         usage = ''
                 else:
-                    usage_name = self._fix_xy_usage_for_mt_devices(report_item.usage_name)
+                    usage_name = self._fix_xy_usage_for_mt_devices(report_item.usage_name,
+                                                                   self.prev_seen_usages)
                     usage = ' {usage_name}:'.format(**locals())
 
                 # if we don't get a key error this is a duplicate in
@@ -1195,7 +1394,7 @@ class HidReport(object):
                    prev.usage == report_item.usage):
                     sep = ","
                     usage = ""
-                output += '{sep}{usage} {value_format.format(values[0])} '.format(**locals())
+                output += '{sep}{usage} {} '.format(value_format.format(values[0]), **locals())
             else:
                 usage_page_name = report_item.usage_page_name
                 if not usage_page_name:
@@ -1218,12 +1417,447 @@ class HidReport(object):
                             if "no event indicated" in usage.lower():
                                 usage = ''
                         usages.append('\'{usage}\''.format(**locals()))
-                output += '{sep}{usage_page_name} [{", ".join(usages)}] '.format(**locals())
+                output += '{sep}{usage_page_name} [{}] '.format(', '.join(usages), **locals())
             sep = '|'
             prev = report_item
         return output
 
 
+class HidReportEncoder(object):
+    """
+    A compiled encoder for one :class:`HidReport`, see
+    :attr:`HidReport.encoder`.
+
+    All the per-field work of :meth:`HidReport.create_report` that does not
+    depend on the data is done once when the encoder is created: the
+    attribute names matching the fields' usages, the X/Y to CX/CY renaming
+    for multitouch devices and the collection boundaries where the next
+    data object is used. Encoding a report then only looks up the
+    attributes and packs the values. ::
+
+        encoder = rdesc.input_reports[1].encoder
+        for frame in frames:
+            uhid_device.call_input_event(encoder.encode(frame, global_data))
+
+    :param HidReport report: the report to encode
+    """
+    def __init__(self, report):
+        self.report = report
+        self._size = report.size
+        self._buffer = bytearray(self._size)
+        self._initial = report.report_ID if report.numbered else 0
+
+        steps = []
+        prev_seen_usages = []
+        prev_collection = None
+        for field in report:
+            if field.is_const:
+                continue
+
+            usage = str(field.usage_name)
+            usage = report._fix_xy_usage_for_mt_devices(usage, prev_seen_usages)
+
+            # a usage repeated in a new collection belongs to the next
+            # data object
+            next_data = (prev_collection is not None and
+                         prev_collection != field.collection and
+                         usage in prev_seen_usages)
+            if next_data:
+                prev_seen_usages.clear()
+
+            # Match the HID usage with our attributes, so
+            # Contact Count -> contactcount, etc.
+            attr = usage.replace(' ', '').lower()
+            check_range = not field.is_contact_meta
+            signed = field.logical_min < 0
+            shifts = tuple(field.start + field.size * i for i in range(field.count))
+
+            steps.append((next_data, attr, field, field.count, shifts,
+                          (1 << field.size) - 1, signed, check_range,
+                          field.logical_min, field.logical_max))
+
+            prev_collection = field.collection
+            prev_seen_usages.append(usage)
+
+        self._steps = tuple(steps)
+
+    def encode(self, data, global_data=None):
+        """
+        Fill the report with the values from the list of data objects, see
+        :meth:`HidReport.create_report`. The data objects used for this
+        report are removed from the front of ``data``.
+
+        The returned :class:`bytearray` is reused by the next call to
+        :meth:`encode`, copy it if it needs to be kept.
+
+        :param list data: a list of objects with attributes matching the
+            HID usage names in this report
+        :param object global_data: an object with attributes matching the
+            HID usage names, used whenever the ``data`` doesn't have an
+            attribute defined.
+        :returns: a :class:`bytearray` with the report
+        """
+        report = self._initial
+        idx = 0
+        ndata = len(data)
+        missing = _missing
+
+        for (next_data, attr, field, count, shifts, mask,
+             signed, check_range, logical_min, logical_max) in self._steps:
+            if next_data and idx < ndata:
+                idx += 1
+
+            value = missing
+            if idx < ndata:
+                value = getattr(data[idx], attr, missing)
+            if value is missing:
+                if global_data is not None:
+                    value = getattr(global_data, attr, 0)
+                else:
+                    value = 0
+
+            try:
+                value[0]
+            except TypeError:
+                value = [value]
+
+            if len(value) != count:
+                raise Exception("-EINVAL")
+
+            for v, shift in zip(value, shifts):
+                if check_range and (v < logical_min or v > logical_max):
+                    raise RangeError(field, v)
+                if not signed and v > mask:
+                    raise Exception('_set_value(): value {v} is larger than size {field.size}'.format(**locals()))
+                report |= (v & mask) << shift
+
+        if idx < ndata:
+            # remove the last item we just processed
+            idx += 1
+        if idx:
+            del data[:idx]
+
+        self._buffer[:] = report.to_bytes(self._size, 'little')
+        return self._buffer
+
+
+class ReportDescriptorCache(object):
+    """
+    A bounded LRU cache of parsed :class:`ReportDescriptor` objects, keyed
+    by a hash of the report descriptor bytes. To enable it, assign it to
+    :attr:`ReportDescriptor.cache`::
+
+        ReportDescriptor.cache = ReportDescriptorCache(maxsize=512)
+        rdesc = ReportDescriptor.from_bytes(data)  # parsed
+        rdesc = ReportDescriptor.from_bytes(data)  # from the cache
+
+    Each lookup returns a copy of the cached descriptor with its own
+    reports, so callers do not share the state of
+    :meth:`HidReport.format_report` or :attr:`HidReport.encoder`. The
+    :class:`HidField` objects and the layouts are shared between all copies
+    and must be treated as read-only.
+
+    :param int maxsize: the maximum number of descriptors kept
+    :param on_evict: a callable invoked as ``on_evict(key, rdesc)`` for each
+        descriptor dropped from the cache, or ``None``
+
+    .. attribute:: hits
+
+        The number of lookups that returned a cached descriptor
+
+    .. attribute:: misses
+
+        The number of lookups that did not find a cached descriptor
+
+    .. attribute:: evictions
+
+        The number of descriptors dropped because the cache was full
+    """
+    CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+    def __init__(self, maxsize=128, on_evict=None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(rdesc):
+        """
+        Return the cache key for the given report descriptor bytes.
+
+        :param rdesc: the report descriptor as list of 8-bit integers or
+            a bytes-like object
+        """
+        return hashlib.blake2b(bytes(rdesc), digest_size=16).digest()
+
+    def get(self, key):
+        """
+        Return the cached descriptor for the given key or ``None``
+        """
+        with self._lock:
+            try:
+                rdesc = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return rdesc
+
+    def put(self, key, rdesc):
+        """
+        Add a descriptor to the cache, evicting the least recently used
+        descriptor if the cache is full.
+        """
+        evicted = []
+        with self._lock:
+            self._entries[key] = rdesc
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False))
+                self.evictions += 1
+        if self.on_evict is not None:
+            for old_key, old_rdesc in evicted:
+                self.on_evict(old_key, old_rdesc)
+
+    def clear(self):
+        """
+        Drop all descriptors and reset the statistics. ``on_evict`` is not
+        called for the dropped descriptors.
+        """
+        with self._lock:
+            self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cache_info(self):
+        """
+        Return the cache statistics, in the style of
+        :func:`functools.lru_cache`.
+
+        :return: a named tuple of ``(hits, misses, evictions, maxsize, currsize)``
+        """
+        return self.CacheInfo(self.hits, self.misses, self.evictions,
+                              self.maxsize, len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+class PersistentReportDescriptorCache(ReportDescriptorCache):
+    """
+    A :class:`ReportDescriptorCache` that also stores the report
+    descriptors in a cache directory so they can be reused by other
+    processes. ::
+
+        ReportDescriptor.cache = PersistentReportDescriptorCache()
+
+    Descriptors are looked up in memory first, then in the cache directory.
+    A cache file holds the parse result, i.e. the items, reports, fields
+    and field layouts, as :mod:`marshal` data of plain numbers, strings,
+    lists and dicts. Loading a file rebuilds the descriptor without parsing
+    it, no code is stored or run. Each file is named after the descriptor's
+    hash and records that hash and the cache format, files that do not
+    match are ignored.
+
+    The cache directory and its files must be owned by the current user
+    and must not be writable by anyone else, otherwise they are neither
+    read nor written. Running as root on a user's cache directory thus
+    ignores the cache instead of leaving root-owned files behind.
+
+    The cache format is a hash of the parser's source code, it is part of
+    the directory name, so files written by other versions of hid-tools
+    are ignored.
+
+    :param str directory: the cache directory, defaults to
+        ``$XDG_CACHE_HOME/hid-tools``
+    :param int maxsize: the maximum number of descriptors kept in memory.
+        The number of cache files is not limited.
+    :param on_evict: see :class:`ReportDescriptorCache`
+
+    .. attribute:: disk_hits
+
+        The number of in-memory misses that were loaded from a cache file
+    """
+    # A file for the kernel's maximum descriptor size of 4096 bytes is
+    # well below this
+    MAX_FILE_SIZE = 1 << 20
+
+    _format = None
+
+    def __init__(self, directory=None, maxsize=128, on_evict=None):
+        super().__init__(maxsize, on_evict)
+        if directory is None:
+            directory = cache_dir()
+        self.directory = os.path.join(directory,
+                                      'rdesc-{}'.format(self._code_digest()))
+        self.disk_hits = 0
+
+    @classmethod
+    def _code_digest(cls):
+        if cls._format is None:
+            with open(__file__, 'rb') as f:
+                cls._format = hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+        return cls._format
+
+    _REPORTS = ('input_reports', 'output_reports', 'feature_reports')
+
+    @classmethod
+    def _dumps(cls, key, rdesc):
+        items = [(i.hid, i.value, i.raw_value, i.index_in_report, i.usage_page)
+                 for i in rdesc.rdesc_items]
+        fields = []
+        reports = []
+        current = None
+        for kind, name in enumerate(cls._REPORTS):
+            for report_ID, r in getattr(rdesc, name).items():
+                indices = []
+                for f in r.fields:
+                    d = dict(f.__dict__)
+                    # HidUsage objects, looked up again when loading
+                    d['_usage_name'] = None
+                    d['_usage_names'] = None
+                    indices.append(len(fields))
+                    fields.append(d)
+                layout = [tuple(l) for l in r.layout]
+                reports.append((kind, report_ID, r.application, r.bitsize, indices, layout))
+                if r is getattr(rdesc, 'current_input_report', None):
+                    current = (kind, report_ID)
+        return marshal.dumps((cls._code_digest(), key, items, fields, reports,
+                              rdesc.win8, current))
+
+    @classmethod
+    def _loads(cls, key, data):
+        fmt, stored_key, items, fields, reports, win8, current = marshal.loads(data)
+        if fmt != cls._code_digest() or stored_key != key:
+            return None
+
+        rdesc = ReportDescriptor.__new__(ReportDescriptor)
+        rdesc_items = []
+        for hid, value, raw_value, index_in_report, usage_page in items:
+            item = _HidRDescItem.__new__(_HidRDescItem)
+            item.__dict__ = {'index_in_report': index_in_report, 'raw_value': raw_value,
+                             'hid': hid, 'value': value, 'usage_page': usage_page}
+            rdesc_items.append(item)
+        rdesc.rdesc_items = rdesc_items
+
+        lookup = HidField._lookup_usage_name
+        hidfields = []
+        for d in fields:
+            f = HidField.__new__(HidField)
+            d['_usage_name'] = lookup(d['_usage'])
+            f.__dict__ = d
+            hidfields.append(f)
+
+        report_dicts = ({}, {}, {})
+        for kind, report_ID, application, bitsize, indices, layout in reports:
+            r = HidReport.__new__(HidReport)
+            r.__dict__ = {'fields': [hidfields[i] for i in indices],
+                          'report_ID': report_ID,
+                          'application': application,
+                          '_application_name': None,
+                          '_layout': tuple(HidFieldLayout._make(l) for l in layout),
+                          '_encoder': None,
+                          '_bitsize': bitsize}
+            report_dicts[kind][report_ID] = r
+        for name, reports in zip(cls._REPORTS, report_dicts):
+            setattr(rdesc, name, reports)
+        rdesc.win8 = win8
+        if current is not None:
+            kind, report_ID = current
+            rdesc.current_input_report = report_dicts[kind][report_ID]
+        return rdesc
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{}.marshal'.format(key.hex()))
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            if not is_private(os.stat(self.directory)):
+                logger.debug('Ignoring cache directory {} owned by somebody else'.format(self.directory))
+                return None
+            fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.debug('Ignoring unreadable cache file: {}'.format(e))
+            return None
+
+        with os.fdopen(fd, 'rb') as f:
+            if not is_private(os.fstat(f.fileno())):
+                logger.debug('Ignoring cache file {path} owned by somebody else'.format(**locals()))
+                return None
+            data = f.read(self.MAX_FILE_SIZE + 1)
+
+        if len(data) > self.MAX_FILE_SIZE:
+            logger.debug('Ignoring oversized cache file {path}'.format(**locals()))
+            return None
+
+        try:
+            rdesc = self._loads(key, data)
+        except Exception as e:
+            logger.debug('Ignoring corrupt cache file {}: {}'.format(path, e))
+            return None
+        if rdesc is None:
+            logger.debug('Ignoring cache file {path} for another descriptor'.format(**locals()))
+        return rdesc
+
+    def get(self, key):
+        rdesc = super().get(key)
+        if rdesc is not None:
+            return rdesc
+
+        rdesc = self._load(key)
+        if rdesc is None:
+            return None
+
+        self.disk_hits += 1
+        super().put(key, rdesc)
+        return rdesc
+
+    def put(self, key, rdesc):
+        super().put(key, rdesc)
+
+        # Failing to write the cache file is not an error, we just parse
+        # again next time. Write to a temporary file first so concurrent
+        # processes never see a partial file.
+        try:
+            data = self._dumps(key, rdesc)
+            if not make_private_dir(self.directory):
+                logger.debug('Not writing to cache directory {} owned by somebody else'.format(self.directory))
+                return
+            fd, tmpname = tempfile.mkstemp(dir=self.directory, prefix='.rdesc-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmpname, self._path(key))
+            except Exception:
+                os.unlink(tmpname)
+                raise
+        except Exception as e:
+            logger.debug('Unable to write cache file: {}'.format(e))
+
+    def clear(self):
+        """
+        Drop all descriptors from memory and reset the statistics. The
+        cache files are kept.
+        """
+        super().clear()
+        self.disk_hits = 0
+
+
 class ReportDescriptor(object):
     """
     Represents a fully parsed HID report descriptor.
@@ -1250,7 +1884,15 @@ class ReportDescriptor(object):
     .. attribute:: feature_reports
 
         All :class:`HidReport` of type ``Feature``, addressable by the report ID
+
+    .. attribute:: cache
+
+        A :class:`ReportDescriptorCache` consulted by :meth:`from_bytes` and
+        :meth:`from_string`, or ``None`` (the default) to always parse the
+        descriptor. This is a class attribute shared by all instances.
     """
+    cache = None
+
     class _Globals(object):
         """
         HID report descriptors uses a stack-based model where some values
@@ -1308,6 +1950,11 @@ class ReportDescriptor(object):
             index_in_report += item.size
             self._parse_item(item)
 
+        # compute the field layouts now so decoding reports doesn't have to
+        for reports in (self.input_reports, self.output_reports, self.feature_reports):
+            for r in reports.values():
+                r.layout
+
         # Drop the parsing-only variables so we don't leak them later
         del self.current_item
         del self.glob
@@ -1343,15 +1990,15 @@ class ReportDescriptor(object):
                 return r
         return None
 
-    def _get_current_report(self, type):
+    def _get_current_report(self, hid):
         report_lists = {
-            'Input': self.input_reports,
-            'Output': self.output_reports,
-            'Feature': self.feature_reports,
+            self._INPUT: self.input_reports,
+            self._OUTPUT: self.output_reports,
+            self._FEATURE: self.feature_reports,
         }
 
         try:
-            cur = self.current_report[type]
+            cur = self.current_report[hid]
         except KeyError:
             cur = None
 
@@ -1360,87 +2007,122 @@ class ReportDescriptor(object):
 
         if cur is None:
             try:
-                cur = report_lists[type][self.local.report_ID]
+                cur = report_lists[hid][self.local.report_ID]
             except KeyError:
                 cur = HidReport(self.local.report_ID, self.glob.application)
-                report_lists[type][self.local.report_ID] = cur
+                report_lists[hid][self.local.report_ID] = cur
         return cur
 
+    def _reset_usages(self):
+        self.local.usages = []
+        self.local.usage_min = 0
+        self.local.usage_max = 0
+
     def _parse_item(self, rdesc_item):
         # store current usage_page in rdesc_item
         rdesc_item.usage_page = self.glob.usage_page
-        item = rdesc_item.item
-        value = rdesc_item.value
+        handler = self._item_handlers.get(rdesc_item.hid)
+        if handler is not None:
+            handler(self, rdesc_item.value, rdesc_item.hid)
 
-        if item == "Report ID":
-            self.local.report_ID = value
-        elif item == "Push":
-            self.global_stack.append(self.glob)
-            self.glob = ReportDescriptor._Globals(self.glob)
-        elif item == "Pop":
-            self.glob = self.global_stack.pop()
-        elif item == "Usage Page":
-            self.glob.usage_page = value << 16
-            # reset the usage list
-            self.local.usages = []
-            self.local.usage_min = 0
-            self.local.usage_max = 0
-        elif item == "Collection":
-            c = INV_COLLECTIONS[value]
-            try:
-                if c == 'PHYSICAL':
-                    self.collection[1] += 1
-                    self.glob.physical = self.local.usages[-1]
-                elif c == 'APPLICATION':
-                    self.collection[0] += 1
-                    self.glob.application = self.local.usages[-1]
-                else:  # 'LOGICAL'
-                    self.collection[2] += 1
-                    self.glob.logical = self.local.usages[-1]
-            except IndexError:
-                pass
-            # reset the usage list
-            self.local.usages = []
-            self.local.usage_min = 0
-            self.local.usage_max = 0
-        elif item == "Usage Minimum":
-            self.local.usage_min = value | self.glob.usage_page
-        elif item == "Usage Maximum":
-            self.local.usage_max = value | self.glob.usage_page
-        elif item == "Logical Minimum":
-            self.glob.logical_min = value
-        elif item == "Logical Maximum":
-            self.glob.logical_max = value
-        elif item == "Usage":
-            self.local.usages.append(value | self.glob.usage_page)
-        elif item == "Report Count":
-            self.glob.count = value
-        elif item == "Report Size":
-            self.glob.item_size = value
-        elif item in ("Input", "Feature", "Output"):
-            self.current_input_report = self._get_current_report(item)
-
-            inputItems = HidField.getHidFields(self.local.report_ID,
-                                               self.glob.logical,
-                                               self.glob.physical,
-                                               self.glob.application,
-                                               tuple(self.collection),
-                                               value,
-                                               self.glob.usage_page,
-                                               self.local.usages,
-                                               self.local.usage_min,
-                                               self.local.usage_max,
-                                               self.glob.logical_min,
-                                               self.glob.logical_max,
-                                               self.glob.item_size,
-                                               self.glob.count)
-            self.current_input_report.extend(inputItems)
-            if item == "Feature" and len(self.local.usages) > 0 and \
-                    self.local.usages[-1] == 0xff0000c5:
-                self.win8 = True
-            self.local.usages = []
-            self.local.usage_min = 0
-            self.local.usage_max = 0
+    def _parse_report_id(self, value, hid):
+        self.local.report_ID = value
+
+    def _parse_push(self, value, hid):
+        self.global_stack.append(self.glob)
+        self.glob = ReportDescriptor._Globals(self.glob)
+
+    def _parse_pop(self, value, hid):
+        self.glob = self.global_stack.pop()
+
+    def _parse_usage_page(self, value, hid):
+        self.glob.usage_page = value << 16
+        self._reset_usages()
+
+    def _parse_collection(self, value, hid):
+        c = INV_COLLECTIONS[value]
+        try:
+            if c == 'PHYSICAL':
+                self.collection[1] += 1
+                self.glob.physical = self.local.usages[-1]
+            elif c == 'APPLICATION':
+                self.collection[0] += 1
+                self.glob.application = self.local.usages[-1]
+            else:  # 'LOGICAL'
+                self.collection[2] += 1
+                self.glob.logical = self.local.usages[-1]
+        except IndexError:
+            pass
+        self._reset_usages()
+
+    def _parse_usage_minimum(self, value, hid):
+        self.local.usage_min = value | self.glob.usage_page
+
+    def _parse_usage_maximum(self, value, hid):
+        self.local.usage_max = value | self.glob.usage_page
+
+    def _parse_logical_minimum(self, value, hid):
+        self.glob.logical_min = value
+
+    def _parse_logical_maximum(self, value, hid):
+        self.glob.logical_max = value
+
+    def _parse_usage(self, value, hid):
+        self.local.usages.append(value | self.glob.usage_page)
+
+    def _parse_report_count(self, value, hid):
+        self.glob.count = value
+
+    def _parse_report_size(self, value, hid):
+        self.glob.item_size = value
+
+    def _parse_main_item(self, value, hid):
+        """Input, Output and Feature items"""
+        self.current_input_report = self._get_current_report(hid)
+
+        inputItems = HidField.getHidFields(self.local.report_ID,
+                                           self.glob.logical,
+                                           self.glob.physical,
+                                           self.glob.application,
+                                           tuple(self.collection),
+                                           value,
+                                           self.glob.usage_page,
+                                           self.local.usages,
+                                           self.local.usage_min,
+                                           self.local.usage_max,
+                                           self.glob.logical_min,
+                                           self.glob.logical_max,
+                                           self.glob.item_size,
+                                           self.glob.count)
+        self.current_input_report.extend(inputItems)
+        if hid == self._FEATURE and len(self.local.usages) > 0 and \
+                self.local.usages[-1] == 0xff0000c5:
+            self.win8 = True
+        self._reset_usages()
+
+    _INPUT = hid_items['Main']['Input']
+    _OUTPUT = hid_items['Main']['Output']
+    _FEATURE = hid_items['Main']['Feature']
+
+    # The item handlers, keyed by the numerical item tag. Items not listed
+    # here (e.g. End Collection, Unit) do not affect the parser state.
+    _item_handlers = {
+        hid_items['Global']['Report ID']: _parse_report_id,
+        hid_items['Global']['Push']: _parse_push,
+        hid_items['Global']['Pop']: _parse_pop,
+        hid_items['Global']['Usage Page']: _parse_usage_page,
+        hid_items['Main']['Collection']: _parse_collection,
+        hid_items['Local']['Usage Minimum']: _parse_usage_minimum,
+        hid_items['Local']['Usage Maximum']: _parse_usage_maximum,
+        hid_items['Global']['Logical Minimum']: _parse_logical_minimum,
+        hid_items['Global']['Logical Maximum']: _parse_logical_maximum,
+        hid_items['Local']['Usage']: _parse_usage,
+        hid_items['Global']['Report Count']: _parse_report_count,
+        hid_items['Global']['Report Size']: _parse_report_size,
+        _INPUT: _parse_main_item,
+        _OUTPUT: _parse_main_item,
+        _FEATURE: _parse_main_item,
+    }
 
     def dump(self, dump_file=sys.stdout, output_type='default'):
         """
@@ -1493,11 +2175,45 @@ class ReportDescriptor(object):
         """
         Parse the given list of 8-bit integers.
 
+        If :attr:`cache` is set, a copy of an identical descriptor parsed
+        earlier is returned from the cache instead.
+
         :param list rdesc: a list of bytes that are this report descriptor
         """
-        items = _HidRDescItem.from_bytes(rdesc)
+        return cls._from_bytes_cached(rdesc)
 
-        return ReportDescriptor(items)
+    @classmethod
+    def _from_bytes_cached(cls, rdesc):
+        cache = cls.cache
+        if cache is None:
+            return ReportDescriptor(_HidRDescItem.from_bytes(rdesc))
+
+        key = cache.key(rdesc)
+        parsed = cache.get(key)
+        if parsed is None:
+            parsed = ReportDescriptor(_HidRDescItem.from_bytes(rdesc))
+            cache.put(key, parsed)
+        # the cached object stays pristine, callers get their own copy
+        return parsed._copy()
+
+    def _copy(self):
+        """
+        Return a copy of this descriptor with copies of its reports, see
+        :meth:`HidReport._copy`. The items and fields are shared.
+        """
+        c = self.__class__.__new__(self.__class__)
+        c.__dict__.update(self.__dict__)
+        c.rdesc_items = self.rdesc_items[:]
+        copies = {}
+        for name in ('input_reports', 'output_reports', 'feature_reports'):
+            reports = {}
+            for report_ID, r in getattr(self, name).items():
+                reports[report_ID] = copies[id(r)] = r._copy()
+            setattr(c, name, reports)
+        current = getattr(self, 'current_input_report', None)
+        if current is not None:
+            c.current_input_report = copies[id(current)]
+        return c
 
     @classmethod
     def from_string(cls, rdesc):
@@ -1511,13 +2227,14 @@ class ReportDescriptor(object):
         ``/dev/hidraw`` event node, so just pass it along.
 
 
+        If :attr:`cache` is set, a copy of an identical descriptor parsed
+        earlier is returned from the cache instead.
+
         :param list rdesc: a string that represents the list of bytes
         """
 
         rdesc = [int(r, 16) for r in rdesc.split()[1:]]
-        items = _HidRDescItem.from_bytes(rdesc)
-
-        return ReportDescriptor(items)
+        return cls._from_bytes_cached(rdesc)
 
     @classmethod
     def from_human_descr(cls, rdesc_str):
@@ -1604,3 +2321,46 @@ class ReportDescriptor(object):
             return None
 
         return report.format_report(data, split_lines)
+
+    def decode(self, data):
+        """
+        Decode the HID Report provided as a list of 8-bit integers or a
+        bytes-like object, see :meth:`HidReport.decode`.
+
+        :param data: the bytes that are this report
+        :returns: a tuple of ``(report, values)`` with the matching
+            :class:`HidReport` and the list of values for each of its
+            fields, or ``None`` if no input report matches
+        """
+        report = self.get(data[0], len(data))
+        if report is None:
+            return None
+
+        return report, report.decode(data)
+
+    def decode_batch(self, data):
+        """
+        Decode many input reports with the same Report ID at once into
+        NumPy arrays, see :meth:`HidReport.decode_batch`. The report is
+        looked up from the first report in ``data``.
+
+        :param data: a 2-dimensional ``uint8`` array with one report per
+            row or a bytes-like object with the reports concatenated
+        :returns: a tuple of ``(report, columns)`` with the matching
+            :class:`HidReport` and the list of arrays for each of its fields,
+            or ``None`` if no input report matches
+        :raises ValueError: if ``data`` is empty, the report cannot be
+            looked up
+        """
+        import numpy
+
+        if not isinstance(data, numpy.ndarray):
+            data = numpy.frombuffer(data, dtype=numpy.uint8)
+        if data.size == 0:
+            raise ValueError('Expected at least one report')
+        report_size = data.shape[1] if data.ndim == 2 else 0
+        report = self.get(int(data.flat[0]), report_size)
+        if report is None:
+            return None
+
+        return report, report.decode_batch(data)
@@ -18,13 +18,27 @@
 #
 
 import array
-import datetime
+import asyncio
+import collections
 import fcntl
-import io
 import os
 import struct
 import sys
+import time
 from hidtools.hid import ReportDescriptor
+from hidtools.recording import RecordingDevice, RecordingEvent, TextRecordingWriter
+
+
+try:
+    _monotonic_ns = time.monotonic_ns
+except AttributeError:  # Python < 3.7
+    def _monotonic_ns():
+        return int(time.monotonic() * 1000000000)
+
+try:
+    _get_running_loop = asyncio.get_running_loop
+except AttributeError:  # Python < 3.7, only called from coroutines
+    _get_running_loop = asyncio.get_event_loop
 
 
 def _ioctl(fd, EVIOC, code, return_type, buf=None):
@@ -126,25 +140,271 @@ def _HIDIOCGRAWNAME(fd):
 
 class HidrawEvent(object):
     """
-    A single event from a hidraw device. The first event always has a timestamp of 0.0,
+    A single event from a hidraw device. The first event always has a timestamp of 0,
     all other events are offset accordingly.
 
-    .. attribute:: sec
-
-        Timestamp seconds
+    .. attribute:: timestamp
 
-    .. attribute:: usec
-
-        Timestamp microseconds
+        The ``CLOCK_MONOTONIC`` time the event was read at in nanoseconds,
+        relative to :attr:`HidrawDevice.time_offset`
 
     .. attribute:: bytes
 
         The data bytes read for this event
     """
-    def __init__(self, sec, usec, bytes):
-        self.sec, self.usec = sec, usec
+    __slots__ = ('timestamp', 'bytes')
+
+    def __init__(self, timestamp, bytes):
+        self.timestamp = timestamp
         self.bytes = bytes
 
+    @property
+    def sec(self):
+        """Timestamp seconds"""
+        return self.timestamp // 1000000000
+
+    @property
+    def usec(self):
+        """Timestamp microseconds"""
+        return self.timestamp // 1000 % 1000000
+
+
+class HidrawRingBuffer(object):
+    """
+    A fixed-capacity ring buffer of hidraw reports, see
+    :meth:`HidrawDevice.capture`. Reports are read straight into
+    preallocated storage, each record is a ``CLOCK_MONOTONIC`` timestamp in
+    nanoseconds and the report bytes. No Python objects are allocated per
+    report until the records are taken out of the buffer with
+    :meth:`pop`. ::
+
+        ring = HidrawRingBuffer(capacity=8192, report_size=64)
+        while ring.read_from(fd):
+            pass
+        for timestamp, data in ring.pop():
+            print(timestamp, data.hex())
+
+    When the buffer is full, new reports are still read from the device so
+    the kernel queue doesn't overrun but they are discarded and counted in
+    :attr:`dropped`.
+
+    :param int capacity: the maximum number of reports held
+    :param int report_size: the maximum size of a single report in bytes,
+        longer reports are truncated
+
+    .. attribute:: dropped
+
+        The number of reports discarded because the buffer was full
+    """
+    def __init__(self, capacity=8192, report_size=4096):
+        if capacity < 1 or report_size < 1:
+            raise ValueError('capacity and report_size must be positive')
+        self.capacity = capacity
+        self.report_size = report_size
+        self.dropped = 0
+        self._data = bytearray(capacity * report_size)
+        self._slots = [memoryview(self._data)[i * report_size:(i + 1) * report_size]
+                       for i in range(capacity)]
+        self._scratch = [memoryview(bytearray(report_size))]
+        self._timestamps = array.array('Q', [0]) * capacity
+        self._lengths = array.array('I', [0]) * capacity
+        self._head = 0  # the next slot to write to
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def full(self):
+        """``True`` if the next report will be dropped"""
+        return self._count == self.capacity
+
+    def read_from(self, fd):
+        """
+        Read one report from the file descriptor into the buffer.
+
+        :param int fd: the file descriptor to read from
+        :returns: the number of bytes read, 0 on EOF. If the buffer is full,
+            the report is dropped but its size is returned anyway.
+        :raises: :class:`BlockingIOError` if ``fd`` is nonblocking and no
+            report is available
+        """
+        if self._count == self.capacity:
+            nbytes = os.readv(fd, self._scratch)
+            if nbytes:
+                self.dropped += 1
+            return nbytes
+
+        head = self._head
+        nbytes = os.readv(fd, [self._slots[head]])
+        if nbytes:
+            self._timestamps[head] = _monotonic_ns()
+            self._lengths[head] = nbytes
+            self._head = (head + 1) % self.capacity
+            self._count += 1
+        return nbytes
+
+    def pop(self, count=None):
+        """
+        Remove the oldest records from the buffer and yield them as tuple of
+        ``(timestamp, bytes)``.
+
+        :param int count: the maximum number of records to remove, or
+            ``None`` for all records in the buffer
+        """
+        if count is None or count > self._count:
+            count = self._count
+        tail = (self._head - self._count) % self.capacity
+        for _ in range(count):
+            data = bytes(self._slots[tail][:self._lengths[tail]])
+            yield self._timestamps[tail], data
+            tail = (tail + 1) % self.capacity
+            self._count -= 1
+
+
+class HidrawAsyncReader(object):
+    """
+    An asynchronous iterator over the events of a :class:`HidrawDevice`,
+    see :meth:`HidrawDevice.async_events`. ::
+
+        async def record(device):
+            async with device.async_events() as events:
+                async for event in events:
+                    print(event.timestamp, event.bytes)
+
+    The device is set nonblocking and read from the event loop with
+    ``loop.add_reader()``. Whenever it becomes readable, the pending
+    reports are read, up to the number of events that fit into the
+    ``maxsize`` buffer. Once ``maxsize`` events are waiting to be consumed,
+    the device is no longer read until the consumer catches up, further
+    reports are queued (and eventually dropped) by the kernel.
+
+    The returned events are not kept in :attr:`HidrawDevice.events`, a
+    device that retains all events is switched to ``retain_events=0``
+    while the reader is open. :meth:`close` restores that setting and the
+    blocking mode of the device.
+
+    The iteration ends when the reader is closed and raises the
+    :class:`OSError` if reading fails, e.g. when the device is removed.
+    Cancelling the task that iterates is safe but the device is read until
+    :meth:`close` is called, use ``async with`` to ensure that.
+
+    :param HidrawDevice device: the device to read from
+    :param int maxsize: the maximum number of events buffered
+    :param loop: the :mod:`asyncio` event loop, or ``None`` to use the
+        running loop once the iteration starts
+    """
+    def __init__(self, device, maxsize=1024, loop=None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        self.device = device
+        self.maxsize = maxsize
+        self._loop = None
+        self._fd = device.device.fileno()
+        self._events = collections.deque()
+        self._waiter = None
+        self._exception = None
+        self._closed = False
+        self._reading = False
+        self._saved = None
+        if loop is not None:
+            self._start(loop)
+
+    def _start(self, loop):
+        self._loop = loop
+        device = self.device
+        self._saved = os.get_blocking(self._fd), device.retain_events
+        os.set_blocking(self._fd, False)
+        if device.retain_events is None:
+            device.retain_events = 0
+        self._resume()
+
+    def _resume(self):
+        if not self._reading and not self._closed:
+            if self._loop is None:
+                self._start(_get_running_loop())
+                return
+            self._loop.add_reader(self._fd, self._on_readable)
+            self._reading = True
+
+    def _pause(self):
+        if self._reading:
+            self._loop.remove_reader(self._fd)
+            self._reading = False
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _on_readable(self):
+        device = self.device
+        limit = self.maxsize - len(self._events)
+        try:
+            if device.ring_buffer is not None:
+                device.capture(limit)
+            else:
+                device.read_events(limit)
+        except OSError as e:
+            self._exception = e
+            self.close()
+            return
+
+        # a spurious wakeup or another reader may leave nothing to read,
+        # only the end of file ends the iteration
+        self._events.extend(device.new_events())
+        if device._eof:
+            self.close()
+            return
+        if len(self._events) >= self.maxsize:
+            self._pause()
+        self._wakeup()
+
+    def close(self):
+        """
+        Stop reading from the device. Events already read are still
+        returned by the iteration.
+        """
+        self._pause()
+        self._closed = True
+        if self._saved is not None:
+            blocking, self.device.retain_events = self._saved
+            self._saved = None
+            try:
+                os.set_blocking(self._fd, blocking)
+            except OSError:
+                # the device is gone or already closed
+                pass
+        self._wakeup()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self._resume()
+        while not self._events:
+            if self._exception is not None:
+                e, self._exception = self._exception, None
+                raise e
+            if self._closed:
+                raise StopAsyncIteration
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        event = self._events.popleft()
+        if len(self._events) < self.maxsize:
+            self._resume()
+        return event
+
+    async def __aenter__(self):
+        self._resume()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 
 class HidrawDevice(object):
     """
@@ -158,6 +418,10 @@ class HidrawDevice(object):
                 print('We received {len(dev.events)} events so far'.format(**locals()))
 
     :param File device: a file-like object pointing to ``/dev/hidrawX``
+    :param int retain_events: the number of already dumped events to keep
+        in :attr:`events`, or ``None`` to keep all events. See :meth:`dump`.
+    :param HidrawDeviceInfo info: the device information, e.g. from
+        :func:`list_devices`, or ``None`` to query ``device`` with ioctls
 
     .. attribute:: name
 
@@ -182,7 +446,14 @@ class HidrawDevice(object):
 
     .. attribute:: events
 
-        All events accumulated so far, a list of :class:`HidrawEvent`
+        All events accumulated so far, a list of :class:`HidrawEvent`. This
+        list is not used in capture mode. If ``retain_events`` is set, events
+        are removed from this list once they have been written by
+        :meth:`dump`.
+
+    .. attribute:: ring_buffer
+
+        The :class:`HidrawRingBuffer` used by :meth:`capture` or ``None``
 
     ... attribute:: time_offset
 
@@ -190,89 +461,204 @@ class HidrawDevice(object):
         the timestamp of the first event. When recording multiple devices,
         the time_offset from the first device to receive an event should be
         copied to the other device to ensure all recordings are in sync.
+        This is a ``CLOCK_MONOTONIC`` timestamp in nanoseconds.
     """
-    def __init__(self, device):
-        fd = device.fileno()
+    def __init__(self, device, retain_events=None, info=None):
         self.device = device
-        self.name = _HIDIOCGRAWNAME(fd)
-        self.bustype, self.vendor_id, self.product_id = _HIDIOCGRAWINFO(fd)
-        self.vendor_id &= 0xFFFF
-        self.product_id &= 0xFFFF
-        size = _HIDIOCGRDESCSIZE(fd)
-        rsize, desc = _HIDIOCGRDESC(fd, size)
-        assert rsize == size
-        assert len(desc) == rsize
-        self.report_descriptor = ReportDescriptor.from_bytes([x for x in desc])
+        if info is None:
+            fd = device.fileno()
+            self.name = _HIDIOCGRAWNAME(fd)
+            self.bustype, self.vendor_id, self.product_id = _HIDIOCGRAWINFO(fd)
+            self.vendor_id &= 0xFFFF
+            self.product_id &= 0xFFFF
+            size = _HIDIOCGRDESCSIZE(fd)
+            rsize, desc = _HIDIOCGRDESC(fd, size)
+            assert rsize == size
+            assert len(desc) == rsize
+            self.report_descriptor = ReportDescriptor.from_bytes(desc)
+        else:
+            self.name = info.name
+            self.bustype = info.bustype
+            self.vendor_id = info.vendor_id
+            self.product_id = info.product_id
+            self.report_descriptor = info.report_descriptor
 
         self.events = []
+        self.ring_buffer = None
+        self.retain_events = retain_events
 
         self._dump_offset = -1
+        self._dropped_reported = 0
+        # set when the last read_events() or capture() hit the end of file
+        self._eof = False
         self.time_offset = None
 
     def __repr__(self):
         return '{self.name} bus: {self.bustype:02x} vendor: {self.vendor_id:04x} product: {self.product_id:04x}'.format(**locals())
 
-    def read_events(self):
+    def read_events(self, limit=None):
         """
         Read events from the device and store them in the device.
 
-        This function simply calls :func:`os.read`, it is the caller's task to
-        either make sure the device is set nonblocking or to handle any
-        :class:`KeyboardInterrupt` if this call does end up blocking.
+        On a blocking file descriptor this reads one event, it is the
+        caller's task to handle any :class:`KeyboardInterrupt` if this call
+        does end up blocking. On a nonblocking file descriptor this reads
+        until no more events are available.
 
+        :param int limit: read at most this many events, ``None`` for no
+            limit
         :returns: a tuple of ``(index, count)`` of the :attr:`events` added.
         """
 
+        self._evict_events()
         index = max(0, len(self.events) - 1)
 
-        loop = True
-        while loop:
-            data = os.read(self.device.fileno(), 4096)
+        fd = self.device.fileno()
+        blocking = os.get_blocking(fd)
+        self._eof = False
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except BlockingIOError:
+                break
             if not data:
+                self._eof = True
                 break
-            if len(data) < 4096:
-                loop = False
 
-            now = datetime.datetime.now()
+            now = _monotonic_ns()
             if self.time_offset is None:
                 self.time_offset = now
-            tdelta = now - self.time_offset
             bytes = struct.unpack('B' * len(data), data)
 
-            self.events.append(HidrawEvent(tdelta.seconds, tdelta.microseconds, bytes))
+            self.events.append(HidrawEvent(now - self.time_offset, bytes))
+            if limit is not None:
+                limit -= 1
+            if blocking or limit == 0:
+                break
 
         count = len(self.events) - index
 
         return index, count
 
-    def _dump_event(self, event, file):
-        report_id = event.bytes[0]
+    def _evict_events(self):
+        # drop the events already returned by new_events() beyond the last
+        # retain_events ones, before new events are appended
+        if self.retain_events is None or self._dump_offset <= 0:
+            return
+        evict = self._dump_offset - self.retain_events
+        if evict > 0:
+            del self.events[:evict]
+            self._dump_offset -= evict
+
+    def async_events(self, maxsize=1024, loop=None):
+        """
+        Return a :class:`HidrawAsyncReader` to iterate over this device's
+        events with ``async for``. The events are taken with
+        :meth:`new_events` and not accumulated in :attr:`events`. Capture
+        mode is supported.
+
+        :param int maxsize: the maximum number of events buffered before
+            the device is no longer read
+        :param loop: the :mod:`asyncio` event loop, or ``None`` to use the
+            running loop once the iteration starts
+        """
+        return HidrawAsyncReader(self, maxsize, loop)
+
+    def enable_capture(self, capacity=8192):
+        """
+        Switch this device to capture mode. In capture mode, reports are
+        read with :meth:`capture` into a preallocated
+        :class:`HidrawRingBuffer` instead of :attr:`events` and
+        :meth:`dump` writes and removes the captured reports.
+
+        :param int capacity: the number of reports the ring buffer holds
+        :returns: the :class:`HidrawRingBuffer`
+        """
+        sizes = [r.size for r in self.report_descriptor.input_reports.values()]
+        report_size = max(sizes + [64])
+        self.ring_buffer = HidrawRingBuffer(capacity, report_size)
+        return self.ring_buffer
 
-        rdesc = self.report_descriptor.get(report_id, len(event.bytes))
-        if rdesc is not None:
-            indent_2nd_line = 2
-            output = rdesc.format_report(event.bytes)
+    def capture(self, limit=None):
+        """
+        Read reports from the device into the :attr:`ring_buffer`, see
+        :meth:`enable_capture`. On a blocking file descriptor this reads one
+        report, on a nonblocking one it reads until no more reports are
+        available.
+
+        :param int limit: read at most this many reports, ``None`` for no
+            limit
+        :returns: the number of reports read, including dropped ones
+        """
+        ring = self.ring_buffer
+        fd = self.device.fileno()
+        blocking = os.get_blocking(fd)
+        count = 0
+        self._eof = False
+        while True:
             try:
-                first_row = output.split('\n')[0]
-            except IndexError:
-                pass
-            else:
-                # we have a multi-line output, find where the fields are split
-                try:
-                    slash = first_row.index('/')
-                except ValueError:
-                    pass
-                else:
-                    # the `+1` below is to make a better visual effect
-                    indent_2nd_line = slash + 1
-            indent = '\n#{" " * indent_2nd_line}'.format(**locals())
-            output = indent.join(output.split('\n'))
-            print('# {output}'.format(**locals()))
-
-        data = map(lambda x: '{x:02x}'.format(**locals()), event.bytes)
-        print('E: {event.sec:06d}.{event.usec:06d} {len(event.bytes)} {" ".join(data)}'.format(**locals()), file=file, flush=True)
-
-    def dump(self, file=sys.stdout, from_the_beginning=False):
+                if not ring.read_from(fd):
+                    self._eof = True
+                    break
+            except BlockingIOError:
+                break
+            count += 1
+            if blocking or count == limit:
+                break
+
+        if count and self.time_offset is None:
+            self.time_offset = ring._timestamps[(ring._head - len(ring)) % ring.capacity]
+        return count
+
+    def _captured_events(self):
+        for timestamp, data in self.ring_buffer.pop():
+            yield HidrawEvent(timestamp - self.time_offset, data)
+
+    def recording_device(self, index=0):
+        """
+        Return this device as :class:`hidtools.recording.RecordingDevice`
+
+        :param int index: the device index in the recording
+        """
+        return RecordingDevice(index, self.name, None, self.bustype,
+                               self.vendor_id, self.product_id,
+                               self.report_descriptor.bytes,
+                               report_descriptor=self.report_descriptor)
+
+    def new_events(self):
+        """
+        Yield the events not yet returned by this function or written by
+        :meth:`dump`, as :class:`HidrawEvent`. In capture mode, the events
+        are removed from the ring buffer. If the device was created with
+        ``retain_events``, all but the last ``retain_events`` of the
+        returned events are removed from :attr:`events` when
+        :meth:`read_events` reads the next events. Stopping the iteration
+        early is fine, the remaining events are returned by the next call.
+        """
+        if self._dump_offset == -1:
+            self._dump_offset = 0
+
+        if self.ring_buffer is not None:
+            yield from self._captured_events()
+            return
+
+        while self._dump_offset < len(self.events):
+            e = self.events[self._dump_offset]
+            self._dump_offset += 1
+            yield e
+
+    def new_drops(self):
+        """
+        Return the number of reports dropped by the ring buffer since the
+        last call to this function or :meth:`dump`.
+        """
+        if self.ring_buffer is None:
+            return 0
+        dropped = self.ring_buffer.dropped - self._dropped_reported
+        self._dropped_reported = self.ring_buffer.dropped
+        return dropped
+
+    def dump(self, file=sys.stdout, from_the_beginning=False, annotate=True, flush=True):
         """
         Format this device in a file format in the form of ::
 
@@ -287,29 +673,177 @@ class HidrawDevice(object):
         new events on each call. To repeat the dump from the beginning, set
         ``from_the_beginning`` to True.
 
+        If the device was created with ``retain_events``, all but the last
+        ``retain_events`` dumped events are removed from :attr:`events`
+        before :meth:`read_events` adds new ones, so memory use does not
+        grow with the length of the recording.
+        Events removed this way are not printed again with
+        ``from_the_beginning``.
+
+        See :class:`hidtools.recording.TextRecordingWriter`, which this
+        function uses, for writing multiple devices or other formats.
+
         :param File file: the output file to write to
         :param bool from_the_beginning: if True, print everything again
              instead of continuing where we left off
+        :param bool annotate: if True, precede each event with a comment
+             line showing the decoded report
+        :param bool flush: if True, flush ``file`` once all events are
+             written. Callers writing many events should set this to False
+             and flush the file themselves.
         """
 
         if from_the_beginning:
             self._dump_offset = -1
 
+        writer = TextRecordingWriter(file, annotate)
+        device = self.recording_device()
         if self._dump_offset == -1:
-            print('# {self.name}'.format(**locals()), file=file)
-            output = io.StringIO()
-            self.report_descriptor.dump(output)
-            for line in output.getvalue().split('\n'):
-                print('# {line}'.format(**locals()), file=file)
-            output.close()
-
-            rd = " ".join(['{b:02x}'.format(**locals()) for b in self.report_descriptor.bytes])
-            sz = len(self.report_descriptor.bytes)
-            print('R: {sz} {rd}'.format(**locals()), file=file)
-            print('N: {self.name}'.format(**locals()), file=file)
-            print('I: {self.bustype:x} {self.vendor_id:04x} {self.product_id:04x}'.format(**locals()), file=file, flush=True)
-            self._dump_offset = 0
+            writer.write_device(device)
+        else:
+            writer.devices[device.index] = device
+
+        for e in self.new_events():
+            writer.write_event(RecordingEvent(0, e.timestamp, bytes(e.bytes)))
+
+        # reports are only dropped once the ring buffer is full, i.e. after
+        # the ones we just printed
+        dropped = self.new_drops()
+        if dropped:
+            writer.write_comment('{dropped} reports dropped, the ring buffer is full'.format(**locals()))
+
+        if flush:
+            file.flush()
+
+
+class HidrawDeviceInfo(object):
+    """
+    Information about a ``hidraw`` device node, read from sysfs without
+    opening the device. The report descriptor is only read and parsed
+    when it is accessed. See :func:`list_devices`.
+
+    .. attribute:: devnode
+
+        The device node, e.g. ``/dev/hidraw0``
+
+    .. attribute:: name
+
+        The device name
+
+    .. attribute:: phys
+
+        The physical path or ``None``
+
+    .. attribute:: bustype
+
+        The numerical bus type
 
-        for e in self.events[self._dump_offset:]:
-            self._dump_event(e, file)
-        self._dump_offset = len(self.events)
+    .. attribute:: vendor_id
+
+        16-bit numerical vendor ID
+
+    .. attribute:: product_id
+
+        16-bit numerical product ID
+
+    .. attribute:: sysfs_path
+
+        The sysfs directory of the HID device or ``None`` if the
+        information was obtained with ioctls
+
+    The report descriptor may be given as ``rdesc`` if it is already
+    known, it is not read from the device then.
+    """
+    def __init__(self, devnode, name, phys=None, bustype=0, vendor_id=0,
+                 product_id=0, sysfs_path=None, rdesc=None):
+        self.devnode = devnode
+        self.name = name
+        self.phys = phys
+        self.bustype = bustype
+        self.vendor_id = vendor_id
+        self.product_id = product_id
+        self.sysfs_path = sysfs_path
+        self._rdesc = None if rdesc is None else bytes(rdesc)
+        self._report_descriptor = None
+
+    @classmethod
+    def from_sysfs(cls, devnode, sysfs_path):
+        """
+        Create the info from the ``uevent`` file in ``sysfs_path``, the
+        HID device's sysfs directory.
+        """
+        properties = {}
+        with open(os.path.join(sysfs_path, 'uevent')) as f:
+            for line in f:
+                key, _, value = line.rstrip('\n').partition('=')
+                properties[key] = value
+
+        bus, vid, pid = [int(x, 16) for x in properties['HID_ID'].split(':')]
+        return cls(devnode, properties.get('HID_NAME', ''),
+                   properties.get('HID_PHYS') or None, bus, vid & 0xFFFF,
+                   pid & 0xFFFF, sysfs_path)
+
+    @classmethod
+    def from_devnode(cls, devnode):
+        """
+        Create the info with the name and info ioctls on ``devnode``. The
+        report descriptor is not read.
+        """
+        with open(devnode) as f:
+            fd = f.fileno()
+            name = _HIDIOCGRAWNAME(fd)
+            bus, vid, pid = _HIDIOCGRAWINFO(fd)
+        return cls(devnode, name, None, bus, vid & 0xFFFF, pid & 0xFFFF)
+
+    @property
+    def rdesc(self):
+        """
+        The report descriptor as ``bytes``
+        """
+        if self._rdesc is None:
+            if self.sysfs_path is not None:
+                with open(os.path.join(self.sysfs_path, 'report_descriptor'), 'rb') as f:
+                    self._rdesc = f.read()
+            else:
+                with open(self.devnode) as f:
+                    fd = f.fileno()
+                    size, desc = _HIDIOCGRDESC(fd, _HIDIOCGRDESCSIZE(fd))
+                    self._rdesc = bytes(desc)
+        return self._rdesc
+
+    @property
+    def report_descriptor(self):
+        """
+        The :class:`hidtools.hid.ReportDescriptor` for this device
+        """
+        if self._report_descriptor is None:
+            self._report_descriptor = ReportDescriptor.from_bytes(self.rdesc)
+        return self._report_descriptor
+
+    def __repr__(self):
+        return '{self.devnode}: {self.name} bus: {self.bustype:02x} vendor: {self.vendor_id:04x} product: {self.product_id:04x}'.format(**locals())
+
+
+def list_devices(sysfs='/sys', dev='/dev'):
+    """
+    Return a :class:`HidrawDeviceInfo` for every ``hidraw`` device,
+    sorted by the device number. The information is read from sysfs, if
+    sysfs is not available each device node is queried with ioctls
+    instead. No report descriptor is parsed.
+
+    :param str sysfs: the sysfs mount point
+    :param str dev: the directory containing the device nodes
+    """
+    def number(name):
+        return int(name[len('hidraw'):])
+
+    classdir = os.path.join(sysfs, 'class', 'hidraw')
+    if os.path.isdir(classdir):
+        names = [n for n in os.listdir(classdir) if n.startswith('hidraw')]
+        return [HidrawDeviceInfo.from_sysfs(os.path.join(dev, n),
+                                            os.path.join(classdir, n, 'device'))
+                for n in sorted(names, key=number)]
+
+    names = [n for n in os.listdir(dev) if n.startswith('hidraw')]
+    return [HidrawDeviceInfo.from_devnode(os.path.join(dev, n))
+            for n in sorted(names, key=number)]
@@ -19,13 +19,25 @@
 #
 
 import os
+import marshal
 import parse
 import functools
+import tempfile
+
+from hidtools.util import cache_dir, is_private, make_private_dir
 
 DATA_DIRNAME = "data"
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 DATA_DIR = os.path.join(SCRIPT_DIR, DATA_DIRNAME)
 
+# Bump whenever the layout of the data stored in the cache file changes
+HUT_CACHE_VERSION = 1
+# The cache file is opt-in, set HID_HUT_CACHE in the environment to use it
+HUT_CACHE_FILE = None
+if os.environ.get('HID_HUT_CACHE'):
+    HUT_CACHE_FILE = os.path.join(cache_dir(),
+                                  'hut-{}.marshal'.format(marshal.version))
+
 
 @functools.total_ordering
 class HidUsage(object):
@@ -121,7 +133,60 @@ class HidUsagePage(object):
     """
 
     def __init__(self):
-        self._usages = {}
+        self._usage_dict = {}
+        self._filename = None
+
+    @classmethod
+    def _from_file(cls, page_id, filename):
+        """
+        Create a Usage Page backed by the given HUT file. Nothing is read
+        from the file until the page name or the Usages are accessed.
+        """
+        usage_page = cls()
+        usage_page.page_id = page_id
+        usage_page._usage_dict = None
+        usage_page._filename = filename
+        return usage_page
+
+    @classmethod
+    def _from_cache(cls, page_id, page_name, usages):
+        """
+        Create a Usage Page from the data stored in the HUT cache file,
+        ``usages`` is a dictionary in the form ``{usage: usage_name}``.
+        The :class:`HidUsage` objects are only created when the Usages
+        are accessed.
+        """
+        usage_page = cls()
+        usage_page.page_id = page_id
+        usage_page.page_name = page_name
+        usage_page._usage_dict = None
+        usage_page._cached_usages = usages
+        return usage_page
+
+    @property
+    def _usages(self):
+        if self._usage_dict is None:
+            self._load()
+        return self._usage_dict
+
+    def _load(self):
+        try:
+            usages = self._cached_usages
+        except AttributeError:
+            pass
+        else:
+            self._usage_dict = {u: HidUsage(self, u, name)
+                                for u, name in usages.items()}
+            del self._cached_usages
+            return
+
+        with open(self._filename, 'r', encoding='utf-8') as f:
+            self._usage_dict = {}
+            try:
+                HidUsageTable._parse_usages(f, self)
+            except (AssertionError, ValueError) as e:
+                self._usage_dict = None
+                raise ValueError('Invalid usage table {}: {}'.format(self._filename, e)) from e
 
     def __setitem__(self, key, value):
         self._usages[key] = value
@@ -173,7 +238,20 @@ class HidUsagePage(object):
         """
         The assigned name for this Usage Page
         """
-        return self._name
+        try:
+            return self._name
+        except AttributeError:
+            if self._filename is None:
+                raise
+            # only read the header line, the Usages are loaded on demand
+            with open(self._filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('('):
+                        r = parse.parse('({idx:x})\t{page_name}', line.strip())
+                        assert r is not None
+                        self._name = r['page_name']
+                        break
+            return self._name
 
     @page_name.setter
     def page_name(self, name):
@@ -208,7 +286,11 @@ class HidUsageTable(object):
     module at least. This object is a singleton, it is available as
     ``hidtools.hut.HUT``.
 
-    Elements of this dictionary are :class:`HidUsagePage` objects.
+    Elements of this dictionary are :class:`HidUsagePage` objects. The
+    Usages of each page are only parsed from the data files when the page
+    is first used. A precompiled copy of all pages is kept in the user's
+    cache directory (``$XDG_CACHE_HOME/hid-tools``) and used instead of the
+    data files while it is up to date.
 
     This object is a dictionary, use like this: ::
 
@@ -230,9 +312,11 @@ class HidUsageTable(object):
     """
     def __init__(self):
         self._pages = {}
+        self._page_names = None
 
     def __setitem__(self, key, value):
         self._pages[key] = value
+        self._page_names = None
 
     def __getitem__(self, key):
         if isinstance(key, str):
@@ -245,6 +329,7 @@ class HidUsageTable(object):
 
     def __delitem__(self, key):
         del self._pages[key]
+        self._page_names = None
 
     def __iter__(self):
         return iter(self._pages)
@@ -280,7 +365,9 @@ class HidUsageTable(object):
             HUT.usage_page_names['Generic Desktop']
 
         """
-        return {v.page_name: v for k, v in self.items()}
+        if self._page_names is None:
+            self._page_names = {v.page_name: v for k, v in self.items()}
+        return self._page_names
 
     def usage_page_from_name(self, page_name):
         """
@@ -315,7 +402,7 @@ class HidUsageTable(object):
             return None
 
     @classmethod
-    def _parse_usages(cls, f):
+    def _parse_usages(cls, f, usage_page=None):
         """
         Parse a single HUT file. The file format is a set of lines in three
         formats: ::
@@ -331,8 +418,10 @@ class HidUsageTable(object):
         Usages are parsed into a dictionary[number] = name.
 
         The return value is a single HidUsagePage where page[idx] = idx-name.
+        If ``usage_page`` is given, the Usages are added to that page
+        instead and its page ID must match the one in the file.
         """
-        usage_page = None
+        header_seen = False
         for line in f:
             line = line.strip()
             if not line or line.startswith('#'):
@@ -340,16 +429,19 @@ class HidUsageTable(object):
 
             # Usage Page, e.g. '(01)	Generic Desktop'
             if line.startswith('('):
-                assert usage_page is None
+                assert not header_seen
+                header_seen = True
 
                 r = parse.parse('({idx:x})\t{page_name}', line)
                 assert(r is not None)
-                usage_page = HidUsagePage()
-                usage_page.page_id = r['idx']
+                if usage_page is None:
+                    usage_page = HidUsagePage()
+                    usage_page.page_id = r['idx']
+                assert usage_page.page_id == r['idx']
                 usage_page.page_name = r['page_name']
                 continue
 
-            assert usage_page is not None
+            assert header_seen
 
             # Reserved ranges, e.g  '0B-1F	Reserved'
             r = parse.parse('{:x}-{:x}\t{name}', line)
@@ -370,16 +462,104 @@ class HidUsageTable(object):
             u = int(r['usage'], 16)
             usage = HidUsage(usage_page, u, r['name'])
 
-            usage_page[u] = usage
+            usage_page._usage_dict[u] = usage
 
         return usage_page
 
     @classmethod
-    def _from_hut_data(cls):
+    def _hut_sources(cls):
+        """
+        Return a dictionary ``{page_id: filename}`` of all HUT files in the
+        data directory. HUT files are named after their page ID, e.g.
+        0001_generic_desktop.hut.
+        """
+        sources = {}
+        for filename in os.listdir(DATA_DIR):
+            if filename.endswith('.hut'):
+                page_id = int(filename.split('_')[0], 16)
+                sources[page_id] = os.path.join(DATA_DIR, filename)
+        return sources
+
+    @classmethod
+    def _sources_stamp(cls, sources):
+        """
+        Return a marshallable value identifying the current state of the
+        HUT files, a cache file is only valid if its stamp matches.
+        """
+        stamp = []
+        for page_id, filename in sorted(sources.items()):
+            st = os.stat(filename)
+            stamp.append((os.path.basename(filename), st.st_mtime_ns, st.st_size))
+        return (HUT_CACHE_VERSION, tuple(stamp))
+
+    @classmethod
+    def _from_cache_file(cls, cache_file, stamp):
+        """
+        Load the HID Usage Tables from the cache file. The file and its
+        directory must be owned by the current user and not writable by
+        anybody else.
+
+        :return: a :class:`hidtools.HidUsageTable` object or ``None`` if the
+            cache file is missing, unreadable, untrusted or out of date
+        """
+        try:
+            if not is_private(os.stat(os.path.dirname(cache_file))):
+                return None
+            fd = os.open(cache_file, os.O_RDONLY | os.O_NOFOLLOW)
+            with os.fdopen(fd, 'rb') as f:
+                if not is_private(os.fstat(f.fileno())):
+                    return None
+                cached_stamp, pages = marshal.load(f)
+
+            if cached_stamp != stamp:
+                return None
+
+            hut = HidUsageTable()
+            for page_id, (page_name, usages) in pages.items():
+                if not isinstance(page_name, str) or not isinstance(usages, dict):
+                    return None
+                hut[page_id] = HidUsagePage._from_cache(page_id, page_name, usages)
+            return hut
+        except Exception:
+            # anything but a valid cache file, the HUT files are parsed
+            return None
+
+    def _write_cache_file(self, cache_file, stamp):
+        """
+        Write all Usage Pages to the cache file. This loads every page, so
+        callers should only do this if the cache file can be written.
+        """
+        pages = {}
+        for page_id, usage_page in self.items():
+            usages = {u: usage.name for u, usage in usage_page.items()}
+            pages[page_id] = (usage_page.page_name, usages)
+
+        # write to a temporary file first so concurrent readers never see
+        # a partial cache file
+        dirname = os.path.dirname(cache_file)
+        fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.hut-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump((stamp, pages), f)
+            os.replace(tmpname, cache_file)
+        except OSError:
+            os.unlink(tmpname)
+            raise
+
+    @classmethod
+    def _from_hut_data(cls, cache_file=HUT_CACHE_FILE):
         """
         Return the HID Usage Tables, the keys are the numeric Usage Page and
         the values are the respective :class:`hidtools.HidUsagePage` object.
 
+        The tables are loaded from ``cache_file`` if it is up to date with
+        the HUT files. Otherwise the HUT files are parsed and the cache file
+        is (re)generated. Like the file, its directory is created private to
+        the current user and neither is used if somebody else owns it. If
+        ``cache_file`` is ``None`` (the default unless ``HID_HUT_CACHE`` is
+        set in the environment), no cache is used and the pages are parsed
+        on demand.
+
         ::
 
             > usages = hidtools.hut.HUT()
@@ -390,19 +570,28 @@ class HidUsageTable(object):
             > print(usages[0x01].page_id)
             1
 
+        :param str cache_file: the path to the cache file or ``None``
         :return: a :class:`hidtools.HidUsageTable` object
         """
+        sources = cls._hut_sources()
+
+        if cache_file is not None:
+            stamp = cls._sources_stamp(sources)
+            hut = cls._from_cache_file(cache_file, stamp)
+            if hut is not None:
+                return hut
+
+        # Pages are only parsed on demand
         hut = HidUsageTable()
-        for filename in os.listdir(DATA_DIR):
-            if filename.endswith('.hut'):
-                with open(os.path.join(DATA_DIR, filename), 'r',
-                          encoding="utf-8") as f:
-                    try:
-                        usage_page = cls._parse_usages(f)
-                        hut[usage_page.page_id] = usage_page
-                    except:
-                        print(filename)
-                        raise
+        for page_id, filename in sources.items():
+            hut[page_id] = HidUsagePage._from_file(page_id, filename)
+
+        if cache_file is not None:
+            try:
+                if make_private_dir(os.path.dirname(cache_file)):
+                    hut._write_cache_file(cache_file, stamp)
+            except Exception:
+                pass
 
         return hut
 
@@ -0,0 +1,951 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Reading and writing HID recordings as produced by ``hid-recorder``.
+
+Two formats are supported. The text format is described in
+**hid-recorder(1)**. The binary format stores the same data in a compact
+form::
+
+    header:  magic "HIDTREC\\0", u16 version, u16 flags, u32 device count
+    device:  u32 index, u16 bus, u16 vendor, u16 product,
+             u16 name length, u16 phys length, u32 report descriptor length,
+             followed by the name (UTF-8), phys (UTF-8) and report descriptor
+    event:   u16 length, u16 device index, u64 timestamp in ns,
+             followed by the report bytes
+
+All integers are little endian. The header and all devices precede the
+events. Converting between the two formats is lossless except for
+comments, the text format only has microsecond timestamps.
+
+Recordings in either format may be compressed with gzip, xz or zstd (the
+latter requires the optional :mod:`zstandard` module), see
+:func:`open_recording_file`.
+"""
+
+import bisect
+import gzip
+import io
+import lzma
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections import namedtuple
+from hidtools.hid import ReportDescriptor
+
+import logging
+logger = logging.getLogger('hidtools.recording')
+
+BINARY_MAGIC = b'HIDTREC\0'
+BINARY_VERSION = 1
+
+_HEADER = struct.Struct('<8sHHI')
+_DEVICE = struct.Struct('<IHHHHHI')
+_EVENT = struct.Struct('<HHQ')
+
+INDEX_MAGIC = b'HIDTIDX\0'
+INDEX_VERSION = 1
+
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+
+_COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'xz': b'\xfd7zXZ\x00',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+# magic, version, byte order, recording size, recording mtime in ns,
+# event count
+_INDEX_HEADER = struct.Struct('<8sHHQQQ')
+
+
+class RecordingError(Exception):
+    """Exception thrown for an invalid recording"""
+    pass
+
+
+class RecordingDevice(object):
+    """
+    A device in a recording.
+
+    .. attribute:: index
+
+        The device index in the recording, used by :class:`RecordingEvent`
+
+    .. attribute:: name
+
+        The device name
+
+    .. attribute:: phys
+
+        The physical path or ``None``
+
+    .. attribute:: bustype
+
+        The numerical bus type
+
+    .. attribute:: vendor_id
+
+        16-bit numerical vendor ID
+
+    .. attribute:: product_id
+
+        16-bit numerical product ID
+
+    .. attribute:: rdesc
+
+        The report descriptor as ``bytes``
+    """
+    def __init__(self, index=0, name='', phys=None, bustype=0, vendor_id=0,
+                 product_id=0, rdesc=b'', report_descriptor=None):
+        self.index = index
+        self.name = name
+        self.phys = phys
+        self.bustype = bustype
+        self.vendor_id = vendor_id
+        self.product_id = product_id
+        self.rdesc = bytes(rdesc)
+        self._report_descriptor = report_descriptor
+
+    @property
+    def report_descriptor(self):
+        """
+        The :class:`hidtools.hid.ReportDescriptor` parsed from :attr:`rdesc`
+        """
+        if self._report_descriptor is None:
+            self._report_descriptor = ReportDescriptor.from_bytes(self.rdesc)
+        return self._report_descriptor
+
+    def __repr__(self):
+        return '{self.index}: {self.name} bus: {self.bustype:02x} vendor: {self.vendor_id:04x} product: {self.product_id:04x}'.format(**locals())
+
+
+class RecordingEvent(namedtuple('RecordingEvent', ['device', 'timestamp', 'data'])):
+    """
+    A single event in a recording.
+
+    .. attribute:: device
+
+        The index of the :class:`RecordingDevice` this event belongs to
+
+    .. attribute:: timestamp
+
+        The timestamp in nanoseconds, relative to the start of the
+        recording
+
+    .. attribute:: data
+
+        The report as ``bytes``
+    """
+    __slots__ = ()
+
+
+class TextRecordingReader(object):
+    """
+    Reads a recording in the text format. ::
+
+        with open('recording.hid') as f:
+            reader = TextRecordingReader(f)
+            print(reader.devices)
+            for event in reader:
+                print(event.timestamp, event.data)
+
+    The devices are read when the reader is created. If the recording
+    describes a device after the first event, that device is only added
+    to :attr:`devices` once the events are read, use
+    :meth:`read_devices` to get all devices up front.
+
+    A recording that was cut off in the middle of its last line, e.g.
+    because the recorder was killed, ends with the last complete line.
+
+    :param File f: the text stream to read from
+
+    .. attribute:: devices
+
+        A dictionary of ``{index: RecordingDevice}``
+    """
+    def __init__(self, f):
+        self.file = f
+        self.devices = {}
+        self._current = 0
+        self._first_event = None
+        for event in self._parse_lines(False):
+            self._first_event = event
+            break
+
+    def _device(self):
+        try:
+            return self.devices[self._current]
+        except KeyError:
+            device = RecordingDevice(self._current)
+            self.devices[self._current] = device
+            return device
+
+    def _parse_line(self, line):
+        tag = line[:2]
+        if tag == 'E:':
+            if self._current not in self.devices:
+                raise RecordingError('Event for unknown device {}'.format(self._current))
+            return self._parse_event(line, self._current)
+        elif tag == 'D:':
+            self._current = int(line[2:])
+        elif tag == 'R:':
+            length, _, rdesc = line[2:].strip().partition(' ')
+            rdesc = bytes.fromhex(rdesc)
+            if len(rdesc) != int(length):
+                raise RecordingError('Invalid report descriptor length')
+            self._device().rdesc = rdesc
+        elif tag == 'N:':
+            self._device().name = line[3:].rstrip('\n')
+        elif tag == 'P:':
+            self._device().phys = line[3:].rstrip('\n')
+        elif tag == 'I:':
+            bus, vid, pid = [int(x, 16) for x in line[2:].split()]
+            device = self._device()
+            device.bustype, device.vendor_id, device.product_id = bus, vid, pid
+        return None
+
+    def read_devices(self):
+        """
+        Read the rest of the recording and return :attr:`devices` with
+        every device the recording describes. The events are skipped, the
+        reader cannot be iterated afterwards.
+        """
+        self._first_event = None
+        for _ in self._parse_lines(True):
+            pass
+        return self.devices
+
+    def _parse_lines(self, skip_events):
+        for line in self.file:
+            if skip_events and line[:2] == 'E:':
+                continue
+            try:
+                event = self._parse_line(line)
+            except (RecordingError, ValueError):
+                if line.endswith('\n'):
+                    raise
+                logger.warning('Ignoring the truncated last line of the recording')
+                break
+            if event is not None:
+                yield event
+
+    @classmethod
+    def _parse_event(cls, line, device):
+        _, timestamp, length, data = (line.split(None, 3) + [''])[:4]
+        data = bytes.fromhex(data.strip())
+        if len(data) != int(length):
+            raise RecordingError('Invalid event length in "{}"'.format(line.strip()))
+        return RecordingEvent(device, cls._parse_timestamp(timestamp), data)
+
+    @staticmethod
+    def _parse_timestamp(timestamp):
+        sec, _, frac = timestamp.partition('.')
+        return int(sec) * 1000000000 + int(frac.ljust(9, '0')[:9])
+
+    def __iter__(self):
+        if self._first_event is not None:
+            event, self._first_event = self._first_event, None
+            yield event
+        yield from self._parse_lines(False)
+
+
+class BinaryRecordingReader(object):
+    """
+    Reads a recording in the binary format, see :class:`TextRecordingReader`
+    for the API. A recording that was cut off in the middle of an event
+    ends with the last complete event.
+
+    :param File f: the binary stream to read from
+    """
+    def __init__(self, f):
+        self.file = f
+        self.devices = {}
+        magic, version, flags, count = _HEADER.unpack(self._read(_HEADER.size))
+        if magic != BINARY_MAGIC:
+            raise RecordingError('Not a binary HID recording')
+        if version > BINARY_VERSION:
+            raise RecordingError('Unsupported recording version {}'.format(version))
+
+        for _ in range(count):
+            index, bus, vid, pid, lname, lphys, lrdesc = _DEVICE.unpack(self._read(_DEVICE.size))
+            name = self._read(lname).decode('utf-8')
+            phys = self._read(lphys).decode('utf-8') if lphys else None
+            rdesc = self._read(lrdesc)
+            self.devices[index] = RecordingDevice(index, name, phys, bus, vid, pid, rdesc)
+
+    def read_devices(self):
+        """
+        Return :attr:`devices`, a binary recording describes all devices
+        in its header.
+        """
+        return self.devices
+
+    def _read(self, size):
+        data = self.file.read(size)
+        if len(data) != size:
+            raise RecordingError('Truncated recording')
+        return data
+
+    def __iter__(self):
+        read = self.file.read
+        unpack = _EVENT.unpack
+        size = _EVENT.size
+        while True:
+            header = read(size)
+            if not header:
+                break
+            if len(header) != size:
+                logger.warning('Ignoring the truncated last event of the recording')
+                break
+            length, device, timestamp = unpack(header)
+            data = read(length)
+            if len(data) != length:
+                logger.warning('Ignoring the truncated last event of the recording')
+                break
+            yield RecordingEvent(device, timestamp, data)
+
+
+def _peek(f, size):
+    try:
+        return f.peek(size)[:size]
+    except AttributeError:
+        pos = f.tell()
+        data = f.read(size)
+        f.seek(pos)
+        return data
+
+
+def is_binary_recording(f):
+    """
+    ``True`` if the binary stream ``f`` is a binary recording. The stream
+    position is not changed.
+
+    :param File f: a binary stream that supports ``peek()`` or ``seek()``
+    """
+    return _peek(f, len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def open_recording(f):
+    """
+    Return a reader for the recording in the binary stream ``f``, the
+    format is detected automatically.
+
+    :param File f: a binary stream that supports ``peek()`` or ``seek()``
+    :returns: a :class:`BinaryRecordingReader` or
+        :class:`TextRecordingReader`
+    """
+    if is_binary_recording(f):
+        return BinaryRecordingReader(f)
+    return TextRecordingReader(io.TextIOWrapper(f, encoding='utf-8'))
+
+
+def compression_for_path(path):
+    """
+    Return the compression used for writing to ``path`` based on its
+    suffix, one of ``'gzip'``, ``'xz'``, ``'zstd'`` or ``None``.
+    """
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1])
+
+
+def detect_compression(f):
+    """
+    Return the compression of the binary stream ``f`` based on its
+    content, one of ``'gzip'``, ``'xz'``, ``'zstd'`` or ``None``. The
+    stream position is not changed.
+
+    :param File f: a binary stream that supports ``peek()`` or ``seek()``
+    """
+    magic = _peek(f, 6)
+    for compression, m in _COMPRESSION_MAGIC.items():
+        if magic.startswith(m):
+            return compression
+    return None
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RecordingError('zstd compressed recordings require the zstandard module')
+    return zstandard
+
+
+class _TruncatedStream(io.RawIOBase):
+    """
+    Wraps a decompressing stream so that a compressed recording that was
+    cut off, e.g. because the recorder was killed, reads up to the last
+    data that can be decompressed instead of raising an exception.
+    """
+    def __init__(self, f, errors):
+        self._f = f
+        self._errors = errors
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        try:
+            data = self._f.read(len(b))
+        except self._errors as e:
+            logger.warning('Ignoring the truncated end of the recording: {}'.format(e))
+            return 0
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+def _decompressor_errors(compression):
+    if compression == 'zstd':
+        return (EOFError, _zstandard().ZstdError)
+    return (EOFError, lzma.LZMAError)
+
+
+def decompress(f):
+    """
+    Return a binary stream that decompresses ``f`` on the fly, or ``f``
+    itself if it is not compressed. Closing the returned stream does not
+    close ``f``. A truncated compressed stream ends with the last data
+    that can be decompressed.
+
+    :param File f: a binary stream that supports ``peek()`` or ``seek()``
+    """
+    compression = detect_compression(f)
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=f, mode='rb')
+    elif compression == 'xz':
+        stream = lzma.LZMAFile(f, 'rb')
+    elif compression == 'zstd':
+        stream = _zstandard().ZstdDecompressor().stream_reader(f, closefd=False)
+    else:
+        return f
+    return io.BufferedReader(_TruncatedStream(stream, _decompressor_errors(compression)))
+
+
+def open_recording_file(path, mode='rb'):
+    """
+    Open the recording file at ``path`` as binary stream, compressed
+    files are decompressed or compressed on the fly. When reading, the
+    compression is detected from the file content and a truncated
+    compressed file ends with the last data that can be decompressed.
+    When writing, the compression is chosen by the suffix of ``path``,
+    see :data:`COMPRESSION_SUFFIXES`.
+
+    :param str path: the path to the recording
+    :param str mode: ``'rb'`` or ``'wb'``
+    """
+    if mode == 'rb':
+        with open(path, 'rb') as f:
+            compression = detect_compression(f)
+    elif mode == 'wb':
+        compression = compression_for_path(path)
+    else:
+        raise ValueError('Invalid mode {}'.format(mode))
+
+    if compression is None:
+        return open(path, mode)
+    elif compression == 'gzip':
+        f = gzip.open(path, mode)
+    elif compression == 'xz':
+        f = lzma.open(path, mode)
+    else:
+        zstandard = _zstandard()
+        raw = open(path, mode)
+        try:
+            if mode == 'rb':
+                f = zstandard.ZstdDecompressor().stream_reader(raw)
+            else:
+                f = zstandard.ZstdCompressor().stream_writer(raw)
+        except Exception:
+            raw.close()
+            raise
+
+    if mode == 'rb':
+        f = io.BufferedReader(_TruncatedStream(f, _decompressor_errors(compression)))
+    return f
+
+
+class Recording(object):
+    """
+    Random access to a recording file in either format. ::
+
+        with Recording('recording.hid') as recording:
+            # all events between 47 and 48 minutes into the recording
+            for event in recording.between(47 * 60 * 10**9, 48 * 60 * 10**9):
+                print(event.timestamp, event.data)
+
+    The file is memory-mapped and only the events that are accessed are
+    read. The offset, timestamp and device of every event are kept in an
+    index that is built when the recording is first opened. That index is
+    stored next to the recording in a sidecar file named ``<path>.idx``
+    and reused as long as the recording does not change. If the sidecar
+    file cannot be written, the index is kept in memory only.
+
+    Compressed recordings cannot be memory-mapped, use
+    :func:`open_recording_file` and :func:`open_recording` to read them.
+
+    Iterating over a :class:`Recording` yields the events from the current
+    position on, see :meth:`seek`.
+
+    :param str path: the path to the recording
+    :param index: ``True`` to use the default sidecar file, a path to use
+        a different index file, or ``False`` to never read or write an
+        index file
+
+    .. attribute:: devices
+
+        A dictionary of ``{index: RecordingDevice}``
+
+    .. attribute:: timestamps
+
+        An ``array`` with the timestamp of every event in nanoseconds
+
+    .. attribute:: position
+
+        The index of the next event returned by iterating
+    """
+    def __init__(self, path, index=True):
+        self.path = path
+        self.position = 0
+        self._file = open(path, 'rb')
+        try:
+            if detect_compression(self._file) is not None:
+                raise RecordingError('Compressed recordings do not support random access')
+            self._binary = is_binary_recording(self._file)
+            try:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise RecordingError('Empty recording')
+
+            if index is True:
+                index = path + '.idx'
+            self._index_file = index or None
+            self._load()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_devices(self):
+        self._file.seek(0)
+        if self._binary:
+            reader = BinaryRecordingReader(self._file)
+            self._events_start = self._file.tell()
+        else:
+            reader = TextRecordingReader(io.TextIOWrapper(self._file, encoding='utf-8'))
+            # the wrapper closes the file once it is garbage collected
+            reader.file.detach()
+        self.devices = reader.devices
+
+    def _stamp(self):
+        st = os.fstat(self._file.fileno())
+        return st.st_size, st.st_mtime_ns
+
+    def _load(self):
+        self._read_devices()
+        stamp = self._stamp()
+        if self._index_file is not None and self._read_index(stamp):
+            # a text recording may describe devices after the first
+            # event, only a full scan finds those
+            if set(self._event_devices).issubset(self.devices):
+                return
+
+        self._build_index()
+        if self._index_file is not None:
+            try:
+                self._write_index(stamp)
+            except OSError as e:
+                logger.debug('Unable to write index file {}: {}'.format(self._index_file, e))
+
+    def _build_index(self):
+        timestamps = array('Q')
+        offsets = array('Q')
+        devices = array('H')
+        mm = self._mmap
+
+        if self._binary:
+            unpack_from = _EVENT.unpack_from
+            size = _EVENT.size
+            end = len(mm)
+            offset = self._events_start
+            while offset + size <= end:
+                length, device, timestamp = unpack_from(mm, offset)
+                if offset + size + length > end:
+                    break
+                timestamps.append(timestamp)
+                offsets.append(offset)
+                devices.append(device)
+                offset += size + length
+            if offset != end:
+                logger.warning('Ignoring the truncated last event of {}'.format(self.path))
+        else:
+            # reuse the reader's parser so devices described after the
+            # first event are picked up too. Events are only parsed as far
+            # as needed for the index, the data is decoded on access.
+            parser = TextRecordingReader([])
+            parse_timestamp = parser._parse_timestamp
+            mm.seek(0)
+            offset = 0
+            for line in iter(mm.readline, b''):
+                if not line.endswith(b'\n'):
+                    # the recording may have been cut off in its last line
+                    try:
+                        parser._parse_line(line.decode('utf-8'))
+                    except (RecordingError, ValueError):
+                        logger.warning('Ignoring the truncated last line of {}'.format(self.path))
+                        break
+                if line.startswith(b'E:'):
+                    if parser._current not in parser.devices:
+                        raise RecordingError('Event for unknown device {}'.format(parser._current))
+                    timestamps.append(parse_timestamp(line.split(None, 2)[1].decode('ascii')))
+                    offsets.append(offset)
+                    devices.append(parser._current)
+                else:
+                    parser._parse_line(line.decode('utf-8'))
+                offset = mm.tell()
+            self.devices = parser.devices
+
+        self.timestamps = timestamps
+        self._offsets = offsets
+        self._event_devices = devices
+
+    def _read_index(self, stamp):
+        try:
+            with open(self._index_file, 'rb') as f:
+                header = f.read(_INDEX_HEADER.size)
+                if len(header) != _INDEX_HEADER.size:
+                    return False
+                magic, version, little, size, mtime, count = _INDEX_HEADER.unpack(header)
+                if (magic != INDEX_MAGIC or version != INDEX_VERSION or
+                        bool(little) != (sys.byteorder == 'little') or
+                        (size, mtime) != stamp):
+                    return False
+
+                arrays = array('Q'), array('Q'), array('H')
+                for a in arrays:
+                    a.fromfile(f, count)
+        except (OSError, EOFError):
+            return False
+
+        self.timestamps, self._offsets, self._event_devices = arrays
+        return True
+
+    def _write_index(self, stamp):
+        size, mtime = stamp
+        little = sys.byteorder == 'little'
+        dirname = os.path.dirname(os.path.abspath(self._index_file))
+        fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.hid-index-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, little,
+                                           size, mtime, len(self.timestamps)))
+                self.timestamps.tofile(f)
+                self._offsets.tofile(f)
+                self._event_devices.tofile(f)
+            os.replace(tmpname, self._index_file)
+        except OSError:
+            os.unlink(tmpname)
+            raise
+
+    def close(self):
+        """
+        Close the recording, no events can be read afterwards.
+        """
+        mm = getattr(self, '_mmap', None)
+        if mm is not None:
+            mm.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _event(self, idx):
+        mm = self._mmap
+        offset = self._offsets[idx]
+        if self._binary:
+            length, device, timestamp = _EVENT.unpack_from(mm, offset)
+            offset += _EVENT.size
+            return RecordingEvent(device, timestamp, mm[offset:offset + length])
+
+        end = mm.find(b'\n', offset)
+        if end < 0:
+            end = len(mm)
+        line = mm[offset:end].decode('utf-8')
+        return TextRecordingReader._parse_event(line, self._event_devices[idx])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._event(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('event index out of range')
+        return self._event(idx)
+
+    def __iter__(self):
+        while self.position < len(self):
+            event = self._event(self.position)
+            self.position += 1
+            yield event
+
+    def index_of(self, timestamp):
+        """
+        Return the index of the first event at or after ``timestamp``.
+
+        :param int timestamp: the timestamp in nanoseconds
+        """
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def seek(self, timestamp):
+        """
+        Move the current position to the first event at or after
+        ``timestamp``.
+
+        :param int timestamp: the timestamp in nanoseconds
+        :returns: the new :attr:`position`
+        """
+        self.position = self.index_of(timestamp)
+        return self.position
+
+    def between(self, start=None, end=None, device=None):
+        """
+        Yield the events with a timestamp in ``[start, end)``. This does not
+        change the current position.
+
+        :param int start: the first timestamp in nanoseconds, or ``None``
+            to start at the first event
+        :param int end: the timestamp in nanoseconds after the last event,
+            or ``None`` to stop at the last event
+        :param int device: only yield events of the device with this
+            index, or ``None`` for all devices
+        """
+        first = 0 if start is None else self.index_of(start)
+        last = len(self) if end is None else self.index_of(end)
+        devices = self._event_devices
+        for idx in range(first, last):
+            if device is None or devices[idx] == device:
+                yield self._event(idx)
+
+
+def format_annotation(rdesc, data, prefix='#'):
+    """
+    Return the human-readable comment for the report ``data`` as written
+    before each event in the text format, or ``None`` if the report does
+    not match the report descriptor.
+
+    :param ReportDescriptor rdesc: the device's report descriptor
+    :param bytes data: the report
+    """
+    report = rdesc.get(data[0], len(data))
+    if report is None:
+        return None
+
+    indent_2nd_line = 2
+    output = report.format_report(data)
+    # we have a multi-line output, find where the fields are split
+    first_row = output.split('\n')[0]
+    try:
+        slash = first_row.index('/')
+    except ValueError:
+        pass
+    else:
+        # the `+1` below is to make a better visual effect
+        indent_2nd_line = slash + 1
+    indent = '\n' + prefix + ' ' * indent_2nd_line
+    output = indent.join(output.split('\n'))
+    return '{prefix} {output}'.format(**locals())
+
+
+class TextRecordingWriter(object):
+    """
+    Writes a recording in the text format. ::
+
+        writer = TextRecordingWriter(sys.stdout)
+        writer.write_header(devices)
+        for event in events:
+            writer.write_event(event)
+
+    :param File f: the text stream to write to
+    :param bool annotate: if True, precede each event with a comment
+         line showing the decoded report
+    """
+    def __init__(self, f, annotate=True):
+        self.file = f
+        self.annotate = annotate
+        self.devices = {}
+        self._multiple = False
+        self._current = None
+
+    def write_header(self, devices):
+        """
+        Write the description of all devices in the recording.
+
+        :param list devices: a list of :class:`RecordingDevice`
+        """
+        self._multiple = len(devices) > 1
+        for device in devices:
+            self.write_device(device)
+
+    def write_device(self, device):
+        """
+        Write the description of a single device.
+
+        :param RecordingDevice device: the device
+        """
+        self.devices[device.index] = device
+        f = self.file
+        if self._multiple:
+            print('D: {device.index}'.format(**locals()), file=f)
+            self._current = device.index
+        print('# {device.name}'.format(**locals()), file=f)
+        output = io.StringIO()
+        device.report_descriptor.dump(output)
+        for line in output.getvalue().split('\n'):
+            print('# {line}'.format(**locals()), file=f)
+        output.close()
+
+        rd = ' '.join(['{:02x}'.format(b) for b in device.rdesc])
+        sz = len(device.rdesc)
+        print('R: {sz} {rd}'.format(**locals()), file=f)
+        print('N: {device.name}'.format(**locals()), file=f)
+        if device.phys is not None:
+            print('P: {device.phys}'.format(**locals()), file=f)
+        print('I: {device.bustype:x} {device.vendor_id:04x} {device.product_id:04x}'.format(**locals()), file=f)
+
+    def write_comment(self, comment):
+        """
+        Write a comment line
+        """
+        print('# {comment}'.format(**locals()), file=self.file)
+
+    def write_event(self, event):
+        """
+        Write a single event.
+
+        :param RecordingEvent event: the event
+        """
+        f = self.file
+        if self._multiple and event.device != self._current:
+            print('D: {event.device}'.format(**locals()), file=f)
+            self._current = event.device
+
+        if self.annotate:
+            annotation = format_annotation(self.devices[event.device].report_descriptor, event.data)
+            if annotation is not None:
+                print(annotation, file=f)
+
+        sec, usec = divmod(event.timestamp // 1000, 1000000)
+        length = len(event.data)
+        data = ' '.join(['{:02x}'.format(x) for x in event.data])
+        print('E: {sec:06d}.{usec:06d} {length} {data}'.format(**locals()), file=f)
+
+
+class BinaryRecordingWriter(object):
+    """
+    Writes a recording in the binary format, see
+    :class:`TextRecordingWriter` for the API. All devices must be written
+    with :meth:`write_header` before the first event.
+
+    :param File f: the binary stream to write to
+    """
+    def __init__(self, f):
+        self.file = f
+        self.devices = {}
+
+    def write_header(self, devices):
+        """
+        Write the header and the description of all devices in the
+        recording.
+
+        :param list devices: a list of :class:`RecordingDevice`
+        """
+        if self.devices:
+            raise RecordingError('Header already written')
+
+        f = self.file
+        f.write(_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, len(devices)))
+        for device in devices:
+            self.devices[device.index] = device
+            name = device.name.encode('utf-8')
+            phys = device.phys.encode('utf-8') if device.phys is not None else b''
+            f.write(_DEVICE.pack(device.index, device.bustype, device.vendor_id,
+                                 device.product_id, len(name), len(phys),
+                                 len(device.rdesc)))
+            f.write(name)
+            f.write(phys)
+            f.write(device.rdesc)
+
+    def write_comment(self, comment):
+        """
+        Comments are not stored in the binary format, this does nothing.
+        """
+        pass
+
+    def write_event(self, event):
+        """
+        Write a single event.
+
+        :param RecordingEvent event: the event
+        """
+        self.file.write(_EVENT.pack(len(event.data), event.device, event.timestamp))
+        self.file.write(event.data)
+
+
+def convert(reader, writer, devices=None):
+    """
+    Copy all devices and events from ``reader`` to ``writer``, e.g. to
+    convert a text recording to the binary format.
+
+    A text recording may describe devices after the first event, the
+    header written only has the devices ``reader`` read before that. Pass
+    the result of :meth:`TextRecordingReader.read_devices` of a first pass
+    over the recording as ``devices`` to convert such recordings.
+
+    :param reader: a :class:`TextRecordingReader` or
+        :class:`BinaryRecordingReader`
+    :param writer: a :class:`TextRecordingWriter` or
+        :class:`BinaryRecordingWriter`
+    :param dict devices: the devices to write, ``{index: RecordingDevice}``,
+        or ``None`` for ``reader.devices``
+    """
+    if devices is None:
+        devices = reader.devices
+    writer.write_header([d for i, d in sorted(devices.items())])
+    for event in reader:
+        if event.device not in writer.devices:
+            raise RecordingError('Device {} is described after the first event'.format(event.device))
+        writer.write_event(event)
@@ -19,15 +19,24 @@
 #
 
 import hidtools.hid
+from hidtools.dispatcher import AsyncioDispatcher, SelectorDispatcher, ThreadDispatcher
+import asyncio
 import os
 import pyudev
 import select
 import struct
+import threading
+import time
 import uuid
 
 import logging
 logger = logging.getLogger('hidtools.hid.uhid')
 
+try:
+    _get_running_loop = asyncio.get_running_loop
+except AttributeError:  # Python < 3.7, only called from coroutines
+    _get_running_loop = asyncio.get_event_loop
+
 
 class UHIDIncompleteException(Exception):
     """
@@ -37,6 +46,105 @@ class UHIDIncompleteException(Exception):
     pass
 
 
+class _DeviceGroup(object):
+    """
+    The devices sharing a dispatcher and the udev monitor serving them.
+
+    udev events are routed to the devices through two indices: the uniq
+    string, to recognize the HID device when udev announces it, and the
+    HID device's sys path, to find the device that any child device
+    (hidraw, input, ...) belongs to.
+
+    Devices are created and destroyed from any thread while the udev
+    events are routed from the dispatcher's thread, the groups and the
+    indices are protected by one lock. The dispatcher is never called with
+    that lock held, a :class:`hidtools.dispatcher.ThreadDispatcher` holds
+    its own lock while it calls the udev callback.
+    """
+    _groups = {}
+    _lock = threading.RLock()
+
+    @classmethod
+    def join(cls, dispatcher, device):
+        """
+        Add ``device`` to the group of ``dispatcher``, the group is
+        created if needed.
+        """
+        with cls._lock:
+            group = cls._groups.get(dispatcher)
+            created = group is None
+            if created:
+                group = cls(dispatcher)
+                cls._groups[dispatcher] = group
+            group.devices.append(device)
+            group._by_uniq[device.uniq] = device
+        if created:
+            dispatcher.add_reader(group.monitor.fileno(), group._udev_event_callback)
+        return group
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+        self.devices = []
+        self._by_uniq = {}
+        self._by_sys_path = {}
+        self.context = pyudev.Context()
+        self.monitor = pyudev.Monitor.from_netlink(self.context)
+        self.monitor.start()
+
+    def remove(self, device):
+        with _DeviceGroup._lock:
+            self.devices.remove(device)
+            self._by_uniq.pop(device.uniq, None)
+            if device._udev_device is not None:
+                self._by_sys_path.pop(device._udev_device.sys_path, None)
+            if self.devices:
+                return
+            del _DeviceGroup._groups[self.dispatcher]
+
+        self.dispatcher.remove_reader(self.monitor.fileno())
+        # pyudev has no close(), the netlink socket is closed once the
+        # monitor is gone
+        self.monitor = None
+
+    def index(self, device, udev_device):
+        """
+        Route the events of ``udev_device`` and its children to
+        ``device``.
+        """
+        with _DeviceGroup._lock:
+            device._udev_device = udev_device
+            self._by_sys_path[udev_device.sys_path] = device
+
+    def find(self, sys_path):
+        """
+        Return the device that ``sys_path`` belongs to or ``None``.
+        """
+        path = sys_path
+        with _DeviceGroup._lock:
+            while len(path) > 1:
+                try:
+                    return self._by_sys_path[path]
+                except KeyError:
+                    path = os.path.dirname(path)
+        return None
+
+    def _udev_event_callback(self):
+        event = self.monitor.poll(0)
+
+        if event is None:
+            return
+
+        with _DeviceGroup._lock:
+            if event.action == 'add' and event.subsystem == 'hid':
+                device = self._by_uniq.get(event.properties.get('HID_UNIQ'))
+                if device is not None and device._udev_device is None:
+                    self.index(device, event)
+
+            device = self.find(event.sys_path)
+        if device is not None:
+            device._udev_event(event)
+
+
 class UHIDDevice(object):
     """
     A uhid device. uhid is a kernel interface to create virtual HID devices
@@ -45,6 +153,19 @@ class UHIDDevice(object):
     This class also acts as context manager for any :class:`UHIDDevice`
     objects. See :meth:`dispatch` for details.
 
+    :param dispatcher: the :class:`hidtools.dispatcher.Dispatcher` that
+        processes the kernel and udev events for this device, or ``None``
+        to use the :meth:`default_dispatcher`. Devices with different
+        dispatchers are independent of each other.
+    :param int fd: a file descriptor to use instead of opening
+        ``/dev/uhid``, e.g. a socket emulating the kernel in tests. The
+        device takes ownership of the file descriptor and closes it in
+        :meth:`destroy`.
+
+    .. attribute:: dispatcher
+
+        The :class:`hidtools.dispatcher.Dispatcher` of this device
+
     .. attribute:: device_nodes
 
         A list of evdev nodes associated with this HID device. Populating
@@ -64,6 +185,17 @@ class UHIDDevice(object):
         A uniq string assigned to this device. This string is autogenerated
         and can be used to reliably identify the device.
 
+    .. attribute:: input_count
+
+        The number of input events sent with :meth:`call_input_event` and
+        :meth:`call_input_events`
+
+    .. attribute:: input_seconds
+
+        The time spent sending those input events, in seconds. Together
+        with :attr:`input_count` this is the injection throughput, see
+        :attr:`input_rate`.
+
     """
     __UHID_LEGACY_CREATE = 0
     _UHID_DESTROY = 1
@@ -85,69 +217,65 @@ class UHIDDevice(object):
     UHID_OUTPUT_REPORT = 1
     UHID_INPUT_REPORT = 2
 
-    _polling_functions = {}
-    _poll = select.poll()
-    _devices = []
+    _UHID_DATA_MAX = 4096
+    # type, size, followed by up to _UHID_DATA_MAX bytes of data
+    _INPUT2 = struct.Struct('< L H')
+    # the number of input events submitted with a single writev()
+    _INPUT_BATCH = 64
 
-    _pyudev_context = None
-    _pyudev_monitor = None
+    # sizeof(struct uhid_event)
+    _EVENT_SIZE = 4380
+    # type, id, rnum, rtype, size, followed by the data
+    _SET_REPORT = struct.Struct('< L L B B H')
+    # type, id, rnum, rtype
+    _GET_REPORT = struct.Struct('< L L B B')
+    # the data is followed by size and rtype
+    _OUTPUT_DATA = 4
+    _OUTPUT = struct.Struct('< H B')
+
+    _default_dispatcher = None
+
+    @classmethod
+    def default_dispatcher(cls):
+        """
+        The :class:`hidtools.dispatcher.SelectorDispatcher` used by all
+        devices created without a dispatcher, see :meth:`dispatch`.
+        """
+        if UHIDDevice._default_dispatcher is None:
+            UHIDDevice._default_dispatcher = SelectorDispatcher()
+        return UHIDDevice._default_dispatcher
 
     @classmethod
     def dispatch(cls, timeout=None):
         """
-        Process any events available on any internally registered file
-        descriptor and deal with the events.
+        Process any events available for the devices using the
+        :meth:`default_dispatcher` and deal with the events.
 
         The caller must call this function regularly to make sure things
         like udev events are processed correctly. There's no indicator of
         when to call :meth:`dispatch` yet, call it whenever you're idle.
 
+        Devices created with a different dispatcher are dispatched through
+        their :attr:`dispatcher`.
+
+        :param int timeout: the timeout in milliseconds or ``None`` to
+            wait forever
         :returns: the number of devices data was available on
         """
-        devices = cls._poll.poll(timeout)
-        for fd, mask in devices:
-            if mask & select.POLLIN:
-                fun = cls._polling_functions[fd]
-                fun()
-        return len(devices)
-
-    @classmethod
-    def _append_fd_to_poll(cls, fd, read_function, mask=select.POLLIN):
-        cls._poll.register(fd, mask)
-        cls._polling_functions[fd] = read_function
-
-    @classmethod
-    def _remove_fd_from_poll(cls, fd):
-        cls._poll.unregister(fd)
+        return cls.default_dispatcher().dispatch(timeout)
 
-    @classmethod
-    def _init_pyudev(cls):
-        if cls._pyudev_context is None:
-            cls._pyudev_context = pyudev.Context()
-            cls._pyudev_monitor = pyudev.Monitor.from_netlink(cls._pyudev_context)
-            cls._pyudev_monitor.start()
-
-            cls._append_fd_to_poll(cls._pyudev_monitor.fileno(),
-                                   cls._cls_udev_event_callback)
-
-    @classmethod
-    def _cls_udev_event_callback(cls):
-        event = cls._pyudev_monitor.poll()
-
-        if event is None:
-            return
-
-        for d in cls._devices:
-            if d.udev_device is not None and d.udev_device.sys_path in event.sys_path:
-                d._udev_event(event)
-
-    def __init__(self):
+    def __init__(self, dispatcher=None, fd=None):
         self._name = None
         self._phys = ''
         self._rdesc = None
         self.parsed_rdesc = None
         self._info = None
-        self._fd = os.open('/dev/uhid', os.O_RDWR)
+        # nonblocking, another thread may have processed the event already
+        if fd is None:
+            fd = os.open('/dev/uhid', os.O_RDWR | os.O_NONBLOCK)
+        else:
+            os.set_blocking(fd, False)
+        self._fd = fd
         self._start = self.start
         self._stop = self.stop
         self._open = self.open
@@ -155,13 +283,22 @@ class UHIDDevice(object):
         self._output_report = self.output_report
         self._udev_device = None
         self._ready = False
+        self._started = False
+        self._ready_waiters = []
         self._is_destroyed = False
         self.device_nodes = []
         self.hidraw_nodes = []
-        self.uniq = 'uhid_{str(uuid.uuid4())}'.format(**locals())
-        self._append_fd_to_poll(self._fd, self._process_one_event)
-        self._init_pyudev()
-        UHIDDevice._devices.append(self)
+        self._input_buffer = None
+        self.input_count = 0
+        self.input_seconds = 0.0
+        self._event_buffer = bytearray(UHIDDevice._EVENT_SIZE)
+        self._event_view = memoryview(self._event_buffer)
+        self.uniq = 'uhid_{}'.format(uuid.uuid4())
+        if dispatcher is None:
+            dispatcher = self.default_dispatcher()
+        self.dispatcher = dispatcher
+        self._group = _DeviceGroup.join(dispatcher, self)
+        dispatcher.add_reader(self._fd, self._process_one_event)
 
     def __enter__(self):
         return self
@@ -195,6 +332,111 @@ class UHIDDevice(object):
                 pass
 
         self.udev_event(event)
+        # after udev_event(), a subclass may track more nodes there
+        if event.action == 'add':
+            self._notify_ready_waiters()
+
+    def _notify_ready_waiters(self):
+        # waiters remove themselves from other threads
+        for notify in list(self._ready_waiters):
+            notify()
+
+    def _is_ready(self, require):
+        nodes = {'hidraw': self.hidraw_nodes, 'evdev': self.device_nodes}
+        return self._started and all(nodes[r] for r in require)
+
+    @staticmethod
+    def _check_require(require):
+        for r in require:
+            if r not in ('hidraw', 'evdev'):
+                raise ValueError('Invalid node type {}'.format(r))
+
+    def wait_ready(self, timeout=None, require=('hidraw', 'evdev')):
+        """
+        Wait until the kernel has started this device and udev has
+        announced its nodes, i.e. :attr:`hidraw_nodes` and/or
+        :attr:`device_nodes` are populated.
+
+        With a :class:`hidtools.dispatcher.SelectorDispatcher`, this
+        dispatches the events of all devices of the dispatcher while
+        waiting. With a :class:`hidtools.dispatcher.ThreadDispatcher`, this
+        waits for the dispatcher thread. Use :meth:`async_wait_ready` with
+        a :class:`hidtools.dispatcher.AsyncioDispatcher`.
+
+        :param float timeout: the timeout in seconds or ``None`` to wait
+            forever
+        :param require: the nodes to wait for, any of ``'hidraw'`` and
+            ``'evdev'``
+        :returns: ``True`` if the device is ready, ``False`` on timeout
+        """
+        self._check_require(require)
+        if isinstance(self.dispatcher, AsyncioDispatcher):
+            raise RuntimeError('Use async_wait_ready() with an asyncio dispatcher')
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else deadline - time.monotonic()
+
+        if not isinstance(self.dispatcher, ThreadDispatcher):
+            while not self._is_ready(require):
+                left = remaining()
+                if left is not None and left <= 0:
+                    return False
+                self.dispatcher.dispatch(None if left is None else left * 1000)
+            return True
+
+        changed = threading.Event()
+        self._ready_waiters.append(changed.set)
+        try:
+            while True:
+                changed.clear()
+                if self._is_ready(require):
+                    return True
+                left = remaining()
+                if left is not None and left <= 0:
+                    return False
+                changed.wait(left)
+        finally:
+            self._ready_waiters.remove(changed.set)
+
+    async def async_wait_ready(self, timeout=None, require=('hidraw', 'evdev')):
+        """
+        The awaitable version of :meth:`wait_ready`, for devices using a
+        :class:`hidtools.dispatcher.AsyncioDispatcher` or
+        :class:`hidtools.dispatcher.ThreadDispatcher`. Nothing dispatches
+        the events of any other dispatcher while waiting, use
+        :meth:`wait_ready` with those.
+
+        :param float timeout: the timeout in seconds or ``None`` to wait
+            forever
+        :param require: the nodes to wait for, any of ``'hidraw'`` and
+            ``'evdev'``
+        :returns: ``True`` if the device is ready, ``False`` on timeout
+        """
+        self._check_require(require)
+        if not isinstance(self.dispatcher, (AsyncioDispatcher, ThreadDispatcher)):
+            raise RuntimeError('Use wait_ready() with a dispatcher pumped by the caller')
+        loop = _get_running_loop()
+        changed = asyncio.Event()
+
+        def notify():
+            # the dispatcher thread may call this
+            loop.call_soon_threadsafe(changed.set)
+
+        async def wait():
+            while not self._is_ready(require):
+                changed.clear()
+                await changed.wait()
+
+        self._ready_waiters.append(notify)
+        try:
+            await asyncio.wait_for(wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._ready_waiters.remove(notify)
 
     @property
     def fd(self):
@@ -300,12 +542,81 @@ class UHIDDevice(object):
         :param list data: a list of 8-bit integers representing the HID
             report for this input event
         """
-        data = bytes(data)
-        buf = struct.pack('< L H 4096s',
-                          UHIDDevice._UHID_INPUT2,
-                          len(data),
-                          data)
-        os.write(self._fd, buf)
+        self.call_input_events([data])
+
+    def call_input_events(self, reports):
+        """
+        Send multiple input events from this device, in order. The events
+        are packed into a preallocated buffer and submitted with one
+        :func:`os.writev` per batch of events, the kernel handles each
+        vector as a separate event.
+
+        :param reports: an iterable of reports, each a list of 8-bit
+            integers or a bytes-like object
+        :returns: the number of events sent
+        """
+        if self._input_buffer is None:
+            stride = UHIDDevice._INPUT2.size + UHIDDevice._UHID_DATA_MAX
+            self._input_buffer = bytearray(UHIDDevice._INPUT_BATCH * stride)
+            self._input_slots = [memoryview(self._input_buffer)[i * stride:(i + 1) * stride]
+                                 for i in range(UHIDDevice._INPUT_BATCH)]
+
+        start = time.monotonic()
+
+        pack_into = UHIDDevice._INPUT2.pack_into
+        header = UHIDDevice._INPUT2.size
+        slots = self._input_slots
+        vectors = []
+        count = 0
+        for data in reports:
+            length = len(data)
+            if length > UHIDDevice._UHID_DATA_MAX:
+                raise ValueError('Report too long: {} bytes'.format(length))
+            slot = slots[len(vectors)]
+            pack_into(slot, 0, UHIDDevice._UHID_INPUT2, length)
+            slot[header:header + length] = bytes(data)
+            vectors.append(slot[:header + length])
+            if len(vectors) == UHIDDevice._INPUT_BATCH:
+                self._write_input_events(vectors)
+                count += len(vectors)
+                vectors = []
+        if vectors:
+            self._write_input_events(vectors)
+            count += len(vectors)
+
+        elapsed = time.monotonic() - start
+        self.input_count += count
+        self.input_seconds += elapsed
+        if count and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('sent {} input events in {:.3f} ms ({:.0f} events/s)'.format(
+                         count, elapsed * 1000, count / elapsed if elapsed else float('inf')))
+        return count
+
+    @property
+    def input_rate(self):
+        """
+        The average number of input events sent per second, see
+        :attr:`input_count` and :attr:`input_seconds`, or ``None`` if no
+        event was sent yet.
+        """
+        if not self.input_count:
+            return None
+        if not self.input_seconds:
+            return float('inf')
+        return self.input_count / self.input_seconds
+
+    def _write_input_events(self, vectors):
+        while vectors:
+            written = os.writev(self._fd, vectors)
+            # a short write means the kernel rejected an event, skip the
+            # ones that went through, retrying raises the error
+            done = 0
+            while done < len(vectors) and written >= len(vectors[done]):
+                written -= len(vectors[done])
+                done += 1
+            if done == 0:
+                raise OSError('Short write to /dev/uhid')
+            vectors = vectors[done:]
 
     @property
     def udev_device(self):
@@ -315,10 +626,11 @@ class UHIDDevice(object):
         The device may be None if udev hasn't processed the device yet.
         """
         if self._udev_device is None:
-            for device in self._pyudev_context.list_devices(subsystem='hid'):
+            # usually set when udev announces the device, see _DeviceGroup
+            for device in self._group.context.list_devices(subsystem='hid'):
                 try:
                     if self.uniq == device.properties['HID_UNIQ']:
-                        self._udev_device = device
+                        self._group.index(self, device)
                         break
                 except KeyError:
                     pass
@@ -370,6 +682,11 @@ class UHIDDevice(object):
         This function is called automatically on __exit__()
         """
 
+        # once remove_reader() returns, the dispatcher no longer processes
+        # events for this device, even from its own thread
+        self.dispatcher.remove_reader(self._fd)
+        self._group.remove(self)
+
         if self._ready:
             buf = struct.pack('< L', UHIDDevice._UHID_DESTROY)
             os.write(self._fd, buf)
@@ -379,11 +696,8 @@ class UHIDDevice(object):
             poll = select.poll()
             poll.register(self._fd, select.POLLIN)
             if poll.poll(100):
-                fun = self._polling_functions[self._fd]
-                fun()
+                self._process_one_event()
 
-        UHIDDevice._devices.remove(self)
-        self._remove_fd_from_poll(self._fd)
         os.close(self._fd)
         self._is_destroyed = True
 
@@ -412,7 +726,8 @@ class UHIDDevice(object):
         This message is sent by the kernel, to receive this message you must
         call :meth:`dispatch`
         """
-        logger.debug('open {}'.format(self.sys_path))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('open {}'.format(self.sys_path))
 
     def close(self):
         """
@@ -438,13 +753,15 @@ class UHIDDevice(object):
         :param req: the request identifier
         :param rnum: ???
         :param rtype: one of :attr:`UHID_FEATURE_REPORT`, :attr:`UHID_INPUT_REPORT`, or :attr:`UHID_OUTPUT_REPORT`
-        :param list data: a byte string with the data
+        :param memoryview data: the data, only valid until this method
+            returns. Copy it with ``bytes(data)`` to keep it.
         """
         return 5  # EIO
 
-    def _set_report(self, req, rnum, rtype, size, data):
-        logger.debug('set report {} {} {} {} {} '.format(req, rnum, rtype, size, ['{d:02x}'.format(**locals()) for d in data[:size]]))
-        error = self.set_report(req, rnum, rtype, [int(x) for x in data[:size]])
+    def _set_report(self, req, rnum, rtype, data):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('set report {} {} {} {} {}'.format(req, rnum, rtype, len(data), data.hex()))
+        error = self.set_report(req, rnum, rtype, data)
         self._call_set_report(req, error)
 
     def get_report(self, req, rnum, rtype):
@@ -464,7 +781,8 @@ class UHIDDevice(object):
         return (5, [])  # EIO
 
     def _get_report(self, req, rnum, rtype):
-        logger.debug('get report {} {} {}'.format(req, rnum, rtype))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('get report {} {} {}'.format(req, rnum, rtype))
         error, data = self.get_report(req, rnum, rtype)
         self._call_get_report(req, data, error)
 
@@ -472,34 +790,48 @@ class UHIDDevice(object):
         """
         Callback invoked when a process sends raw data to the device.
 
-        :param data: the data sent by the kernel
+        :param memoryview data: the data sent by the kernel, only valid
+            until this method returns. Copy it with ``bytes(data)`` to keep
+            it.
         :param size: size of the data
         :param rtype: one of :attr:`UHID_FEATURE_REPORT`, :attr:`UHID_INPUT_REPORT`, or :attr:`UHID_OUTPUT_REPORT`
         """
-        logger.debug('output {} {} {}'.format(rtype, size, ['{d:02x}'.format(**locals()) for d in data[:size]]))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('output {} {} {}'.format(rtype, size, data[:size].hex()))
 
     def _process_one_event(self):
-        buf = os.read(self._fd, 4380)
-        assert len(buf) == 4380
+        # the event is read into the same buffer every time, callbacks get
+        # views into that buffer instead of copies
+        buf = self._event_view
+        try:
+            n = os.readv(self._fd, [buf])
+        except BlockingIOError:
+            return
+        assert n == UHIDDevice._EVENT_SIZE
         evtype = struct.unpack_from('< L', buf)[0]
         if evtype == UHIDDevice._UHID_START:
             ev, flags = struct.unpack_from('< L Q', buf)
+            self._started = True
             self.start(flags)
+            self._notify_ready_waiters()
         elif evtype == UHIDDevice._UHID_OPEN:
             self._open()
         elif evtype == UHIDDevice._UHID_STOP:
+            self._started = False
             self._stop()
         elif evtype == UHIDDevice._UHID_CLOSE:
             self._close()
         elif evtype == UHIDDevice._UHID_SET_REPORT:
-            ev, req, rnum, rtype, size, data = struct.unpack_from('< L L B B H 4096s', buf)
-            self._set_report(req, rnum, rtype, size, data)
+            ev, req, rnum, rtype, size = UHIDDevice._SET_REPORT.unpack_from(buf)
+            offset = UHIDDevice._SET_REPORT.size
+            self._set_report(req, rnum, rtype, buf[offset:offset + size])
         elif evtype == UHIDDevice._UHID_GET_REPORT:
-            ev, req, rnum, rtype = struct.unpack_from('< L L B B', buf)
+            ev, req, rnum, rtype = UHIDDevice._GET_REPORT.unpack_from(buf)
             self._get_report(req, rnum, rtype)
         elif evtype == UHIDDevice._UHID_OUTPUT:
-            ev, data, size, rtype = struct.unpack_from('< L 4096s H B', buf)
-            self._output_report(data, size, rtype)
+            offset = UHIDDevice._OUTPUT_DATA
+            size, rtype = UHIDDevice._OUTPUT.unpack_from(buf, offset + UHIDDevice._UHID_DATA_MAX)
+            self._output_report(buf[offset:offset + size], size, rtype)
 
     def create_report(self, data, global_data=None, reportID=None, application=None):
         """
@@ -18,6 +18,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
+
 
 def twos_comp(val, bits):
     """compute the 2's complement of val.
@@ -35,3 +37,46 @@ def twos_comp(val, bits):
 
 def to_twos_comp(val, bits):
     return val & ((1 << bits) - 1)
+
+
+def cache_dir():
+    """
+    Return the directory hid-tools keeps its cache files in. This is
+    ``$XDG_CACHE_HOME/hid-tools``, or ``~/.cache/hid-tools`` if
+    ``$XDG_CACHE_HOME`` is unset. The directory may not exist yet.
+    """
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'hid-tools')
+
+
+def is_private(st):
+    """
+    ``True`` if the file described by the :func:`os.stat` result ``st`` is
+    owned by the current user and not writable by anybody else. Cache
+    files and directories are only used if this is the case.
+    """
+    return st.st_uid == os.geteuid() and not st.st_mode & 0o022
+
+
+def make_private_dir(path):
+    """
+    Create the directory ``path`` if needed and return ``True`` if it is
+    private, see :func:`is_private`. Missing parent directories are only
+    created below a private directory, so running as root with a user's
+    ``$HOME`` never leaves root-owned directories behind.
+    """
+    try:
+        return is_private(os.stat(path))
+    except FileNotFoundError:
+        pass
+
+    parent = os.path.dirname(path)
+    if parent == path or not make_private_dir(parent):
+        return False
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    return is_private(os.stat(path))
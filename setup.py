@@ -73,6 +73,7 @@ setup(name='hid-tools',
       entry_points={
           'console_scripts': [
               'hid-decode= hidtools.cli.decode:main',
+              'hid-convert = hidtools.cli.convert:main',
               'hid-recorder = hidtools.cli.record:main',
               'hid-replay = hidtools.cli.replay:main',
           ]
@@ -87,6 +88,10 @@ setup(name='hid-tools',
       python_requires='>=3.6',
       include_package_data=True,
       install_requires=['parse', 'pyudev'],
+      extras_require={
+          'numpy': ['numpy'],
+          'zstd': ['zstandard'],
+      },
       cmdclass=dict(
           install=ManPageGenerator,
       )
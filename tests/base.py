@@ -227,8 +227,7 @@ class BaseTestCase:
             with self.create_device() as self.uhdev:
                 self._skip_conditions(self.uhdev)
                 self.uhdev.create_kernel_device()
-                while self.uhdev.application not in self.uhdev.input_nodes:
-                    self.uhdev.dispatch(10)
+                self.assertTrue(self.uhdev.wait_ready(timeout=5, require=('evdev',)))
                 self.assertIsNotNone(self.uhdev.evdev)
                 yield
 
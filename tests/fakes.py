@@ -0,0 +1,74 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Devices backed by sockets instead of ``/dev/uhid`` and ``/dev/hidraw``, so
+the tests do not need the kernel modules. A seqpacket socket keeps the
+message boundaries like the kernel interfaces do.
+"""
+
+import io
+import socket
+from hidtools.hidraw import HidrawDevice, HidrawDeviceInfo
+from hidtools.uhid import UHIDDevice
+from test_rdesc import mouse_rdesc
+
+
+def socketpair():
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+
+def hidraw_device(device, rdesc=mouse_rdesc, retain_events=None):
+    """
+    A :class:`HidrawDevice` reading from ``device``, e.g. a socket or a
+    pipe, instead of ``/dev/hidrawX``.
+    """
+    info = HidrawDeviceInfo('/dev/hidraw0', 'fake hidraw', None, 0x3, 0x1, 0x2,
+                            rdesc=rdesc)
+    return HidrawDevice(device, retain_events=retain_events, info=info)
+
+
+class UHIDKernel(object):
+    """
+    The kernel side of a :class:`UHIDDevice`, create the device with
+    ``fd=kernel.fd``. The device owns that file descriptor.
+    """
+    def __init__(self):
+        self.sock, device = socketpair()
+        self.fd = device.detach()
+
+    def send(self, data):
+        """Send an event, padded to the size of struct uhid_event"""
+        self.sock.send(bytes(data).ljust(UHIDDevice._EVENT_SIZE, b'\0'))
+
+    def recv(self):
+        """Receive what the device wrote with one write() or writev()"""
+        return self.sock.recv(1 << 20)
+
+    def close(self):
+        self.sock.close()
+
+
+class FlushCounter(io.StringIO):
+    """A text output that counts how often it was flushed"""
+    flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
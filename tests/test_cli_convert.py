@@ -0,0 +1,62 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import os
+import tempfile
+import unittest
+import hidtools.cli.convert
+from hidtools.recording import BinaryRecordingReader, TextRecordingWriter, open_recording_file
+from test_recording import make_devices, make_events
+
+import logging
+logger = logging.getLogger('hidtools.test.cli.convert')
+
+
+class TestConvert(unittest.TestCase):
+    def late_device_recording(self):
+        # device 1 is described after the first events of device 0
+        devices, events = make_devices(), make_events()
+        f = io.StringIO()
+        writer = TextRecordingWriter(f)
+        writer.write_header(devices[:1])
+        for e in events[:2]:
+            writer.write_event(e)
+        late = io.StringIO()
+        TextRecordingWriter(late).write_header(devices[1:])
+        text = f.getvalue() + 'D: 1\n' + late.getvalue()
+        text += 'E: 000000.002000 14 01 00 00 00 00 00 00 00 00 00 00 00 00 00\n'
+        text += 'D: 0\nE: 000001.000001 6 02 00 01 00 00 00\n'
+        return text, devices, events
+
+    def test_late_device(self):
+        text, devices, events = self.late_device_recording()
+        with tempfile.TemporaryDirectory() as d:
+            for suffix in ('', '.gz'):
+                path = os.path.join(d, 'recording.hid' + suffix)
+                with open_recording_file(path, 'wb') as f:
+                    f.write(text.encode('utf-8'))
+                output = os.path.join(d, 'recording.bin')
+                hidtools.cli.convert.main(['hid-convert', path, output])
+
+                with open(output, 'rb') as f:
+                    reader = BinaryRecordingReader(f)
+                    self.assertEqual(sorted(reader.devices), [0, 1])
+                    self.assertEqual(reader.devices[1].name, devices[1].name)
+                    self.assertEqual(list(reader), events)
@@ -187,8 +187,7 @@ class TestHidrawSysfsReportDescriptor(BaseTest.HidDecodeBase):
         ]
         self.uhid_device = UHIDTestDevice('hidraw test', 'Mouse', rdesc=self.rdesc)
         self.uhid_device.create_kernel_device()
-        while not self.uhid_device.device_nodes:
-            self.uhid_device.dispatch(10)
+        self.assertTrue(self.uhid_device.wait_ready(timeout=5, require=('evdev',)))
 
         node = self.uhid_device.device_nodes[0]
         self.assertTrue(node.startswith('/dev/input/'))
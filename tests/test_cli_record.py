@@ -0,0 +1,106 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import time
+import unittest
+from hidtools.cli.record import Recorder
+from hidtools.recording import TextRecordingReader, TextRecordingWriter
+from fakes import FlushCounter, hidraw_device, socketpair
+
+import logging
+logger = logging.getLogger('hidtools.test.cli.record')
+
+
+class TestRecorder(unittest.TestCase):
+    def create_recorder(self, count, flush_interval=0, capture=False):
+        devices = []
+        self.peers = []
+        for i in range(count):
+            sock, peer = socketpair()
+            self.addCleanup(sock.close)
+            self.addCleanup(peer.close)
+            sock.setblocking(False)
+            devices.append(hidraw_device(sock, retain_events=0))
+            if capture:
+                devices[-1].enable_capture(16)
+            self.peers.append(peer)
+
+        self.output = FlushCounter()
+        recorder = Recorder(devices, TextRecordingWriter(self.output), self.output, flush_interval)
+        self.addCleanup(recorder.close)
+        recorder.write_header()
+        self.assertEqual(self.output.flushes, 1)
+        return recorder
+
+    def send(self, device, *values):
+        for v in values:
+            self.peers[device].send(bytes([2, 0, v, 0, 0, 0]))
+
+    def test_flush_every_batch(self):
+        recorder = self.create_recorder(1)
+        self.send(0, 1, 2)
+        self.assertEqual(recorder.poll(1), 1)
+        self.assertEqual(self.output.flushes, 2)
+        self.assertEqual(recorder.poll(0), 0)
+        self.assertEqual(self.output.flushes, 2)
+
+    def test_flush_interval(self):
+        # the flush interval starts when the recorder is created
+        start = time.monotonic()
+        recorder = self.create_recorder(1, flush_interval=0.2)
+        self.send(0, 1)
+        self.assertEqual(recorder.poll(1), 1)
+        self.send(0, 2)
+        self.assertEqual(recorder.poll(1), 1)
+        # not due yet, the events are only buffered
+        self.assertEqual(self.output.flushes, 1)
+        self.assertEqual(self.output.getvalue().count('\nE: '), 2)
+
+        # without a timeout, poll() returns when the flush is due
+        self.assertEqual(recorder.poll(), 0)
+        self.assertEqual(self.output.flushes, 2)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+        # nothing pending, nothing to flush
+        self.assertEqual(recorder.poll(0.3), 0)
+        self.assertEqual(self.output.flushes, 2)
+
+    def test_merge_order(self):
+        for capture in (False, True):
+            with self.subTest(capture=capture):
+                self.check_merge_order(capture)
+
+    def check_merge_order(self, capture):
+        recorder = self.create_recorder(2, capture=capture)
+        self.send(0, 1, 2, 3)
+        self.send(1, 11, 12, 13)
+        self.assertEqual(recorder.poll(1), 2)
+        # both devices were drained until EAGAIN
+        self.assertEqual(recorder.poll(0), 0)
+
+        # the ready devices are read in turn, the events of both devices
+        # interleave
+        events = list(TextRecordingReader(io.StringIO(self.output.getvalue())))
+        timestamps = [e.timestamp for e in events]
+        self.assertEqual(timestamps, sorted(timestamps))
+        devices = [e.device for e in events]
+        self.assertIn(devices, ([0, 1] * 3, [1, 0] * 3))
+        self.assertEqual([e.data[2] for e in events if e.device == 0], [1, 2, 3])
+        self.assertEqual([e.data[2] for e in events if e.device == 1], [11, 12, 13])
@@ -0,0 +1,129 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import os
+import threading
+import time
+import unittest
+from hidtools.dispatcher import AsyncioDispatcher, Dispatcher, SelectorDispatcher, ThreadDispatcher
+
+import logging
+logger = logging.getLogger('hidtools.test.dispatcher')
+
+
+class Reader(object):
+    def __init__(self):
+        self.rfd, self.wfd = os.pipe()
+        self.data = []
+        self.threads = []
+        self.event = threading.Event()
+
+    def close(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def __call__(self):
+        self.data.append(os.read(self.rfd, 4096))
+        self.threads.append(threading.current_thread())
+        self.event.set()
+
+
+class TestDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.readers = [Reader(), Reader()]
+
+    def tearDown(self):
+        for r in self.readers:
+            r.close()
+
+    def test_selector(self):
+        dispatcher = SelectorDispatcher()
+        a, b = self.readers
+        dispatcher.add_reader(a.rfd, a)
+        dispatcher.add_reader(b.rfd, b)
+        self.assertEqual(dispatcher.dispatch(0), 0)
+
+        os.write(a.wfd, b'a')
+        os.write(b.wfd, b'b')
+        self.assertEqual(dispatcher.dispatch(100), 2)
+        self.assertEqual((a.data, b.data), ([b'a'], [b'b']))
+
+        dispatcher.remove_reader(a.rfd)
+        dispatcher.remove_reader(a.rfd)
+        os.write(a.wfd, b'a')
+        self.assertEqual(dispatcher.dispatch(0), 0)
+        self.assertEqual(a.data, [b'a'])
+        dispatcher.close()
+
+    def test_asyncio(self):
+        loop = asyncio.new_event_loop()
+        dispatcher = AsyncioDispatcher(loop)
+        a, b = self.readers
+        dispatcher.add_reader(a.rfd, a)
+        os.write(a.wfd, b'a')
+        loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(a.data, [b'a'])
+        with self.assertRaises(RuntimeError):
+            dispatcher.dispatch(0)
+        dispatcher.remove_reader(a.rfd)
+        loop.close()
+
+    def test_thread(self):
+        dispatcher = ThreadDispatcher()
+        a, b = self.readers
+        dispatcher.add_reader(a.rfd, a)
+        os.write(a.wfd, b'a')
+        self.assertTrue(a.event.wait(5))
+        self.assertEqual(a.data, [b'a'])
+        self.assertIsNot(a.threads[0], threading.current_thread())
+        with self.assertRaises(RuntimeError):
+            dispatcher.dispatch(0)
+        dispatcher.close()
+        self.assertFalse(dispatcher._thread.is_alive())
+
+    def test_thread_remove_waits(self):
+        dispatcher = ThreadDispatcher()
+        self.addCleanup(dispatcher.close)
+        a, b = self.readers
+        finished = threading.Event()
+
+        def slow():
+            a()
+            time.sleep(0.2)
+            finished.set()
+
+        dispatcher.add_reader(a.rfd, slow)
+        os.write(a.wfd, b'a')
+        self.assertTrue(a.event.wait(5))
+        # the callback is running, removing the reader waits for it
+        dispatcher.remove_reader(a.rfd)
+        self.assertTrue(finished.is_set())
+
+        os.write(a.wfd, b'a')
+        time.sleep(0.05)
+        self.assertEqual(a.data, [b'a'])
+
+    def test_abstract(self):
+        class Incomplete(Dispatcher):
+            def add_reader(self, fd, callback):
+                pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
@@ -0,0 +1,310 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import io
+import os
+import socket
+import tempfile
+import time
+import unittest
+from hidtools.hidraw import HidrawDevice, HidrawRingBuffer, list_devices
+from fakes import FlushCounter, hidraw_device, socketpair
+from test_rdesc import mouse_rdesc
+
+import logging
+logger = logging.getLogger('hidtools.test.hidraw')
+
+
+class TestRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.rfd, self.wfd = os.pipe()
+        os.set_blocking(self.rfd, False)
+
+    def tearDown(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+    def read_one(self, ring, data):
+        # a pipe doesn't keep message boundaries, so one report at a time
+        os.write(self.wfd, data)
+        return ring.read_from(self.rfd)
+
+    def test_read_pop(self):
+        ring = HidrawRingBuffer(capacity=4, report_size=8)
+        self.assertEqual(self.read_one(ring, b'\x01\x02\x03'), 3)
+        self.assertEqual(self.read_one(ring, b'\x04'), 1)
+        with self.assertRaises(BlockingIOError):
+            ring.read_from(self.rfd)
+        self.assertEqual(len(ring), 2)
+
+        records = list(ring.pop())
+        self.assertEqual([data for ts, data in records], [b'\x01\x02\x03', b'\x04'])
+        # CLOCK_MONOTONIC in nanoseconds
+        self.assertIsInstance(records[0][0], int)
+        self.assertLessEqual(records[0][0], records[1][0])
+        self.assertLessEqual(records[1][0], time.clock_gettime(time.CLOCK_MONOTONIC) * 1000000000 + 1000000)
+        self.assertEqual(len(ring), 0)
+
+    def test_wraparound(self):
+        ring = HidrawRingBuffer(capacity=3, report_size=4)
+        for i in range(10):
+            self.read_one(ring, bytes([i]))
+            if len(ring) == 2:
+                self.assertEqual([d for ts, d in ring.pop(1)], [bytes([i - 1])])
+        self.assertEqual([d for ts, d in ring.pop()], [bytes([9])])
+        self.assertEqual(ring.dropped, 0)
+
+    def test_overflow(self):
+        ring = HidrawRingBuffer(capacity=2, report_size=4)
+        for i in range(5):
+            self.assertEqual(self.read_one(ring, bytes([i, i])), 2)
+        self.assertTrue(ring.full)
+        self.assertEqual(ring.dropped, 3)
+        # the oldest reports are kept, later ones are dropped
+        self.assertEqual([d for ts, d in ring.pop()], [b'\x00\x00', b'\x01\x01'])
+        self.assertFalse(ring.full)
+
+
+class PipeTestCase(unittest.TestCase):
+    def setUp(self):
+        rfd, self.wfd = os.pipe()
+        self.rfile = os.fdopen(rfd, 'rb', buffering=0)
+
+    def tearDown(self):
+        self.rfile.close()
+        os.close(self.wfd)
+
+    def feed(self, device, i):
+        # a blocking pipe, read_events() reads one report at a time
+        os.write(self.wfd, bytes([2, 0, i & 0xff, 0, 0, 0]))
+        device.read_events()
+
+
+class TestRetainEvents(PipeTestCase):
+    def test_bounded(self):
+        device = hidraw_device(self.rfile, retain_events=3)
+        out = io.StringIO()
+        for i in range(1000):
+            self.feed(device, i)
+            # the retained events and the one just read
+            self.assertLessEqual(len(device.events), 4)
+            device.dump(out, annotate=False, flush=False)
+        self.assertEqual(out.getvalue().count('\nE: '), 1000)
+        self.assertEqual([e.bytes[2] for e in device.events[-3:]], [997 & 0xff, 998 & 0xff, 999 & 0xff])
+
+    def test_unbounded(self):
+        device = hidraw_device(self.rfile)
+        for i in range(10):
+            self.feed(device, i)
+            device.dump(io.StringIO())
+        self.assertEqual(len(device.events), 10)
+
+    def test_partial_iteration(self):
+        device = hidraw_device(self.rfile, retain_events=0)
+        for i in range(5):
+            self.feed(device, i)
+        events = device.new_events()
+        self.assertEqual([next(events).bytes[2], next(events).bytes[2]], [0, 1])
+        events.close()
+
+        # the two returned events are evicted, the others are not
+        self.feed(device, 5)
+        self.assertEqual([e.bytes[2] for e in device.events], [2, 3, 4, 5])
+        self.assertEqual([e.bytes[2] for e in device.new_events()], [2, 3, 4, 5])
+
+
+class TestDump(PipeTestCase):
+    def split(self, out):
+        lines = out.getvalue().splitlines()
+        # everything after the I: line of the header is events
+        header = next(i for i, l in enumerate(lines) if l.startswith('I: ')) + 1
+        return lines[:header], lines[header:]
+
+    def test_annotations(self):
+        device = hidraw_device(self.rfile)
+        for i in range(3):
+            self.feed(device, i)
+        out = io.StringIO()
+        device.dump(out)
+        header, events = self.split(out)
+        self.assertEqual([l[0] for l in events], ['#', 'E'] * 3)
+        self.assertTrue(events[0].startswith('# ReportID: 2 / Button: 0  0  0 | # | X:     0 |'))
+
+        out = io.StringIO()
+        device.dump(out, from_the_beginning=True, annotate=False)
+        plain_header, plain_events = self.split(out)
+        self.assertEqual(plain_header, header)
+        self.assertEqual(plain_events, [l for l in events if l.startswith('E: ')])
+
+    def test_flush(self):
+        device = hidraw_device(self.rfile)
+        out = FlushCounter()
+        self.feed(device, 0)
+        device.dump(out, flush=False)
+        self.assertEqual(out.flushes, 0)
+        self.feed(device, 1)
+        device.dump(out)
+        self.assertEqual(out.flushes, 1)
+        self.assertEqual(out.getvalue().count('\nE: '), 2)
+
+
+class TestListDevices(unittest.TestCase):
+    def add_device(self, sysfs, number, uevent, rdesc):
+        path = os.path.join(sysfs, 'devices', 'hid{}'.format(number))
+        os.makedirs(path)
+        with open(os.path.join(path, 'uevent'), 'w') as f:
+            f.write(uevent)
+        with open(os.path.join(path, 'report_descriptor'), 'wb') as f:
+            f.write(bytes(rdesc))
+
+        classdir = os.path.join(sysfs, 'class', 'hidraw', 'hidraw{}'.format(number))
+        os.makedirs(classdir)
+        os.symlink(path, os.path.join(classdir, 'device'))
+
+    def test_sysfs(self):
+        with tempfile.TemporaryDirectory() as sysfs:
+            self.add_device(sysfs, 10, 'DRIVER=hid-generic\n'
+                            'HID_ID=0003:0000046D:0000C52B\n'
+                            'HID_NAME=Logitech USB Receiver\n'
+                            'HID_PHYS=usb-0000:00:14.0-2/input2\n'
+                            'HID_UNIQ=\n', mouse_rdesc)
+            self.add_device(sysfs, 2, 'HID_ID=0018:000004F3:00002A3B\n'
+                            'HID_NAME=ELAN Touchscreen\n'
+                            'HID_PHYS=\n', b'\x05\x01')
+
+            devices = list_devices(sysfs)
+            self.assertEqual([d.devnode for d in devices], ['/dev/hidraw2', '/dev/hidraw10'])
+            touch, mouse = devices
+            self.assertEqual((mouse.name, mouse.phys, mouse.bustype, mouse.vendor_id, mouse.product_id),
+                             ('Logitech USB Receiver', 'usb-0000:00:14.0-2/input2', 0x3, 0x46d, 0xc52b))
+            self.assertEqual((touch.name, touch.phys, touch.bustype), ('ELAN Touchscreen', None, 0x18))
+
+            # the report descriptor is only read on demand
+            self.assertIsNone(mouse._rdesc)
+            self.assertEqual(mouse.rdesc, bytes(mouse_rdesc))
+            self.assertEqual(mouse.report_descriptor.bytes, mouse_rdesc)
+
+            # opening an enumerated device does not query it again, a
+            # socket has no hidraw ioctls
+            sock, peer = socketpair()
+            with sock, peer:
+                device = HidrawDevice(sock, info=mouse)
+                self.assertEqual((device.name, device.bustype, device.vendor_id, device.product_id),
+                                 ('Logitech USB Receiver', 0x3, 0x46d, 0xc52b))
+                self.assertIs(device.report_descriptor, mouse.report_descriptor)
+
+
+class TestAsyncReader(unittest.TestCase):
+    def setUp(self):
+        self.sock, self.peer = socketpair()
+        self.loop = asyncio.new_event_loop()
+        self.device = hidraw_device(self.sock, retain_events=0)
+
+    def tearDown(self):
+        self.loop.close()
+        self.sock.close()
+        self.peer.close()
+
+    def collect(self, reader, count):
+        async def collect():
+            result = []
+            async for event in reader:
+                result.append(bytes(event.bytes))
+                if len(result) == count:
+                    break
+            return result
+        return self.loop.run_until_complete(asyncio.wait_for(collect(), 5))
+
+    def test_read(self):
+        reader = self.device.async_events(loop=self.loop)
+        for i in range(5):
+            self.peer.send(bytes([2, i, 0, 0, 0, 0]))
+        self.assertEqual(self.collect(reader, 5), [bytes([2, i, 0, 0, 0, 0]) for i in range(5)])
+
+        # the peer closing is the end of file
+        self.peer.send(b'\x02\xff')
+        self.peer.shutdown(socket.SHUT_WR)
+        self.assertEqual(self.collect(reader, 10), [b'\x02\xff'])
+        # earlier events were evicted by the following reads, only the
+        # last batch is still there
+        self.assertEqual([bytes(e.bytes) for e in self.device.events], [b'\x02\xff'])
+
+    def test_spurious_wakeup(self):
+        reader = self.device.async_events(loop=self.loop)
+        # readable but drained by somebody else, i.e. EAGAIN
+        reader._on_readable()
+        self.assertFalse(reader._closed)
+        self.peer.send(b'\x02\x01')
+        self.assertEqual(self.collect(reader, 1), [b'\x02\x01'])
+        reader.close()
+
+    def test_backpressure(self):
+        reader = self.device.async_events(maxsize=2, loop=self.loop)
+        for i in range(6):
+            self.peer.send(bytes([2, i]))
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        # only the reports that fit into the buffer are read, then reading
+        # pauses
+        self.assertFalse(reader._reading)
+        self.assertEqual(len(reader._events), 2)
+        self.assertEqual(self.collect(reader, 6), [bytes([2, i]) for i in range(6)])
+        self.assertTrue(reader._reading)
+        reader.close()
+        self.assertEqual(self.collect(reader, 1), [])
+
+    def test_cancel(self):
+        reader = self.device.async_events(loop=self.loop)
+
+        async def wait():
+            async with reader:
+                async for event in reader:
+                    pass
+
+        task = self.loop.create_task(wait())
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            self.loop.run_until_complete(task)
+        self.assertFalse(reader._reading)
+
+    def test_running_loop(self):
+        device = hidraw_device(self.sock)
+        # nothing happens before the iteration starts in a running loop
+        reader = device.async_events(maxsize=4)
+        self.assertIsNone(reader._loop)
+        self.assertTrue(os.get_blocking(self.sock.fileno()))
+
+        async def read():
+            result = []
+            async with reader:
+                self.assertIs(reader._loop, asyncio.get_event_loop())
+                self.assertFalse(os.get_blocking(self.sock.fileno()))
+                for i in range(100):
+                    self.peer.send(bytes([2, i]))
+                    result.append((await reader.__anext__()).bytes[1])
+                    # the returned events are not accumulated
+                    self.assertLessEqual(len(device.events), 4)
+            return result
+
+        result = self.loop.run_until_complete(asyncio.wait_for(read(), 5))
+        self.assertEqual(result, list(range(100)))
+        # close() restored the device settings
+        self.assertTrue(os.get_blocking(self.sock.fileno()))
+        self.assertIsNone(device.retain_events)
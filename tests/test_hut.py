@@ -17,8 +17,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import marshal
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
-from hidtools.hut import HUT
+from hidtools.hut import HUT, HidUsagePage, HidUsageTable
 
 import logging
 logger = logging.getLogger('hidtools.test.hut')
@@ -90,6 +95,87 @@ class TestHUT(unittest.TestCase):
 
             self.assertEqual(HUT[page_id], HUT[page_id << 16])
 
+    def test_lazy_loading(self):
+        hut = HidUsageTable._from_hut_data(cache_file=None)
+        self.assertEqual(sorted(hut), sorted(self.pages))
+        self.assertTrue(all(p._usage_dict is None for p in hut.usage_pages.values()))
+
+        self.assertEqual(hut['Digitizers'].page_id, 0x0d)
+        self.assertTrue(all(p._usage_dict is None for p in hut.usage_pages.values()))
+
+        self.assertEqual(hut[0x01][0x30], 'X')
+        loaded = [k for k, p in hut.items() if p._usage_dict is not None]
+        self.assertEqual(loaded, [0x01])
+
+    def test_lazy_loading_invalid_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'broken.hut')
+            with open(filename, 'w') as f:
+                f.write('(01)\tGeneric Desktop\nzz\tBroken\n')
+            page = HidUsagePage._from_file(0x01, filename)
+            with self.assertRaisesRegex(ValueError, 'broken.hut'):
+                page[0x30]
+            self.assertIsNone(page._usage_dict)
+
+    def test_cache_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache_file = os.path.join(d, 'hut.marshal')
+            hut = HidUsageTable._from_hut_data(cache_file=cache_file)
+            self.assertTrue(os.path.exists(cache_file))
+
+            cached = HidUsageTable._from_hut_data(cache_file=cache_file)
+            self.assertTrue(all(hasattr(p, '_cached_usages') for p in cached.usage_pages.values()))
+            self.assertEqual(sorted(cached), sorted(hut))
+            for page_id, page in hut.items():
+                self.assertEqual(cached[page_id].page_name, page.page_name)
+                self.assertEqual(dict(cached[page_id].items()), dict(page.items()))
+            self.assertEqual(cached[0x01][0x30].usage_page, cached[0x01])
+
+            # a stale cache file is ignored and regenerated
+            with open(cache_file, 'wb') as f:
+                f.write(b'garbage')
+            hut = HidUsageTable._from_hut_data(cache_file=cache_file)
+            self.assertEqual(hut[0x01][0x30], 'X')
+            cached = HidUsageTable._from_hut_data(cache_file=cache_file)
+            self.assertTrue(hasattr(cached[0x01], '_cached_usages'))
+
+            # a corrupt cache file with a matching stamp is ignored too
+            stamp = HidUsageTable._sources_stamp(HidUsageTable._hut_sources())
+            with open(cache_file, 'wb') as f:
+                marshal.dump((stamp, {0x01: 'garbage'}), f)
+            hut = HidUsageTable._from_hut_data(cache_file=cache_file)
+            self.assertEqual(hut[0x01][0x30], 'X')
+
+    def test_cache_file_untrusted(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache_file = os.path.join(d, 'hut.marshal')
+            HidUsageTable._from_hut_data(cache_file=cache_file)
+
+            # writable by others
+            os.chmod(cache_file, 0o666)
+            hut = HidUsageTable._from_hut_data(cache_file=cache_file)
+            self.assertFalse(hasattr(hut[0x01], '_cached_usages'))
+
+            # nothing is created below a directory writable by others
+            os.chmod(d, 0o777)
+            cache_file = os.path.join(d, 'sub', 'hut.marshal')
+            HidUsageTable._from_hut_data(cache_file=cache_file)
+            self.assertFalse(os.path.exists(os.path.dirname(cache_file)))
+
+    def test_cache_opt_in(self):
+        with tempfile.TemporaryDirectory() as d:
+            env = dict(os.environ, HOME=d, XDG_CACHE_HOME=os.path.join(d, 'cache'))
+            env.pop('HID_HUT_CACHE', None)
+            import_hut = [sys.executable, '-c', 'import hidtools.hut']
+            topdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            subprocess.run(import_hut, env=env, cwd=topdir, check=True)
+            self.assertEqual(os.listdir(d), [])
+
+            env['HID_HUT_CACHE'] = '1'
+            subprocess.run(import_hut, env=env, cwd=topdir, check=True)
+            self.assertEqual(os.listdir(os.path.join(d, 'cache', 'hid-tools')),
+                             ['hut-{}.marshal'.format(marshal.version)])
+
     def test_usage_page_names(self):
         self.assertEqual(sorted(self.pages.values()), sorted(HUT.usage_page_names))
         self.assertEqual(HUT.usage_page_names['Generic Desktop'], HUT.usage_pages[0x01])
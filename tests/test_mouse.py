@@ -414,7 +414,7 @@ class ResolutionMultiplierMouse(TwoWheelMouse):
         if rnum != 0x12:
             raise InvalidHIDCommunication('Unexpected report number: {rnum}'.format(**locals()))
 
-        if data != self.set_feature_report:
+        if list(data) != self.set_feature_report:
             raise InvalidHIDCommunication('Unexpected data: {data}, expected {self.set_feature_report}'.format(**locals()))
 
         self.wheel_multiplier = 4
@@ -0,0 +1,454 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import array
+import io
+import os
+import tempfile
+import unittest
+import unittest.mock
+from hidtools.hid import ReportDescriptor, ReportDescriptorCache, PersistentReportDescriptorCache
+from hidtools.hid import ParseError, RangeError, _HidRDescItem
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import logging
+logger = logging.getLogger('hidtools.test.rdesc')
+
+
+mouse_rdesc = [
+    0x05, 0x01,                    # Usage Page (Generic Desktop)
+    0x09, 0x02,                    # Usage (Mouse)
+    0xa1, 0x01,                    # Collection (Application)
+    0x85, 0x02,                    # .Report ID (2)
+    0x09, 0x01,                    # .Usage (Pointer)
+    0xa1, 0x00,                    # .Collection (Physical)
+    0x05, 0x09,                    # ..Usage Page (Button)
+    0x19, 0x01,                    # ..Usage Minimum (1)
+    0x29, 0x03,                    # ..Usage Maximum (3)
+    0x15, 0x00,                    # ..Logical Minimum (0)
+    0x25, 0x01,                    # ..Logical Maximum (1)
+    0x75, 0x01,                    # ..Report Size (1)
+    0x95, 0x03,                    # ..Report Count (3)
+    0x81, 0x02,                    # ..Input (Data,Var,Abs)
+    0x75, 0x05,                    # ..Report Size (5)
+    0x95, 0x01,                    # ..Report Count (1)
+    0x81, 0x03,                    # ..Input (Cnst,Var,Abs)
+    0x05, 0x01,                    # ..Usage Page (Generic Desktop)
+    0x16, 0x01, 0xf8,              # ..Logical Minimum (-2047)
+    0x26, 0xff, 0x07,              # ..Logical Maximum (2047)
+    0x75, 0x0c,                    # ..Report Size (12)
+    0x95, 0x02,                    # ..Report Count (2)
+    0x09, 0x30,                    # ..Usage (X)
+    0x09, 0x31,                    # ..Usage (Y)
+    0x81, 0x06,                    # ..Input (Data,Var,Rel)
+    0x15, 0x81,                    # ..Logical Minimum (-127)
+    0x25, 0x7f,                    # ..Logical Maximum (127)
+    0x75, 0x08,                    # ..Report Size (8)
+    0x95, 0x01,                    # ..Report Count (1)
+    0x09, 0x38,                    # ..Usage (Wheel)
+    0x81, 0x06,                    # ..Input (Data,Var,Rel)
+    0xc0,                          # .End Collection
+    0xc0,                          # End Collection
+]
+
+# a two-finger touchscreen
+mt_rdesc = '05 0d 09 04 a1 01 85 01 09 22 a1 02 09 42 15 00 25 01 75 01 95 01 81 02 09 32 81 02 09 47 81 02 95 05 81 03 09 51 75 08 95 01 81 02 05 01 35 00 55 0e 65 33 75 10 95 01 09 30 26 ff 4d 46 70 03 81 02 09 31 26 ff 2b 46 f1 01 81 02 46 00 00 c0 a1 02 05 0d 09 42 15 00 25 01 75 01 95 01 81 02 09 32 81 02 09 47 81 02 95 05 81 03 09 51 75 08 95 01 81 02 05 01 35 00 55 0e 65 33 75 10 95 01 09 30 26 ff 4d 46 70 03 81 02 09 31 26 ff 2b 46 f1 01 81 02 46 00 00 c0 05 0d 09 54 75 08 95 01 81 02 05 0d 85 02 09 55 25 02 75 08 95 01 b1 02 c0'
+
+
+class Data(object):
+    pass
+
+
+class Touch(object):
+    def __init__(self, id, x, y):
+        self.contactid = id
+        self.x = x
+        self.y = y
+        self.tipswitch = True
+        self.inrange = True
+        self.confidence = True
+
+
+class TestItemParser(unittest.TestCase):
+    def assertItemsEqual(self, items, expected):
+        self.assertEqual(len(items), len(expected))
+        for a, b in zip(items, expected):
+            self.assertEqual(a.index_in_report, b.index_in_report)
+            self.assertEqual(a.hid, b.hid)
+            self.assertEqual(a.value, b.value)
+            self.assertEqual(a.raw_value, b.raw_value)
+            self.assertEqual(a.item, b.item)
+
+    def test_input_types(self):
+        expected = _HidRDescItem.from_bytes(mouse_rdesc)
+        self.assertEqual(sum(i.size for i in expected), len(mouse_rdesc))
+
+        for rdesc in (bytes(mouse_rdesc),
+                      bytearray(mouse_rdesc),
+                      array.array('B', mouse_rdesc),
+                      memoryview(bytes(mouse_rdesc)),
+                      tuple(mouse_rdesc)):
+            items = _HidRDescItem.from_bytes(rdesc)
+            self.assertItemsEqual(items, expected)
+
+    def test_values(self):
+        items = _HidRDescItem.from_bytes(mouse_rdesc)
+        logical_min = [i for i in items if i.item == 'Logical Minimum']
+        self.assertEqual([i.value for i in logical_min], [0, -2047, -127])
+        self.assertEqual(logical_min[1].raw_value, [0x01, 0xf8])
+        self.assertEqual(items[-1].index_in_report, len(mouse_rdesc) - 1)
+
+    def test_roundtrip(self):
+        rdesc = ReportDescriptor.from_bytes(bytes(mouse_rdesc))
+        self.assertEqual(rdesc.bytes, mouse_rdesc)
+        self.assertEqual(rdesc.size, len(mouse_rdesc))
+
+    def test_trailing_zero(self):
+        items = _HidRDescItem.from_bytes(bytes(mouse_rdesc + [0x00]))
+        self.assertEqual(sum(i.size for i in items), len(mouse_rdesc))
+
+    def test_truncated(self):
+        with self.assertRaises(ParseError):
+            _HidRDescItem.from_bytes(bytes(mouse_rdesc + [0x26, 0xff]))
+
+    def test_dump(self):
+        rdesc = ReportDescriptor.from_bytes(mouse_rdesc)
+        output = io.StringIO()
+        rdesc.dump(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), len(rdesc.rdesc_items))
+        self.assertTrue(lines[0].startswith('0x05, 0x01,'))
+        self.assertIn('// Usage Page (Generic Desktop)', lines[0])
+        self.assertIn('Collection (Application)', lines[2])
+        self.assertIn('Logical Minimum (-2047)', output.getvalue())
+        self.assertIn('Input (Data,Var,Rel)', output.getvalue())
+
+
+class TestLayout(unittest.TestCase):
+    def setUp(self):
+        self.rdesc = ReportDescriptor.from_bytes(mouse_rdesc)
+        self.report = self.rdesc.input_reports[2]
+
+    def test_layout(self):
+        layout = self.report.layout
+        self.assertEqual(len(layout), len(self.report.fields))
+        x = layout[4]
+        self.assertEqual(x.byte_offset, 2)
+        self.assertEqual(x.shift, 0)
+        self.assertEqual(x.size, 12)
+        self.assertEqual(x.mask, 0xfff)
+        self.assertTrue(x.signed)
+        y = layout[5]
+        self.assertEqual(y.byte_offset, 3)
+        self.assertEqual(y.shift, 4)
+        self.assertIs(self.report.layout, layout)
+
+    def test_decode(self):
+        reports = [
+            [0x02, 0x00, 0x00, 0x00, 0x00, 0x00],
+            [0x02, 0x05, 0xff, 0xff, 0xff, 0x80],
+            [0x02, 0x03, 0x01, 0xf8, 0x7f, 0x7f],
+            [0x02, 0xff, 0x34, 0x12, 0xab, 0x01],
+        ]
+        for r in reports:
+            expected = [f.get_values(r) for f in self.report.fields]
+            self.assertEqual(self.report.decode(r), expected)
+            self.assertEqual(self.report.decode(bytes(r)), expected)
+
+        report, values = self.rdesc.decode(bytes(reports[2]))
+        self.assertIs(report, self.report)
+        self.assertEqual(values[:3], [[1], [1], [0]])
+        self.assertEqual(values[4:], [[-2047], [2047], [127]])
+
+    def test_decode_short_report(self):
+        r = [0x02, 0x01, 0x02]
+        expected = [f.get_values(r) for f in self.report.fields]
+        self.assertEqual(self.report.decode(r), expected)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not available')
+class TestDecodeBatch(unittest.TestCase):
+    reports = [
+        [0x02, 0x00, 0x00, 0x00, 0x00, 0x00],
+        [0x02, 0x05, 0xff, 0xff, 0xff, 0x80],
+        [0x02, 0x03, 0x01, 0xf8, 0x7f, 0x7f],
+        [0x02, 0xff, 0x34, 0x12, 0xab, 0x01],
+    ]
+
+    def setUp(self):
+        self.rdesc = ReportDescriptor.from_bytes(mouse_rdesc)
+        self.report = self.rdesc.input_reports[2]
+
+    def assertColumnsMatch(self, columns):
+        self.assertEqual(len(columns), len(self.report.fields))
+        for i, r in enumerate(self.reports):
+            expected = self.report.decode(r)
+            for field, column, values in zip(self.report.fields, columns, expected):
+                if field.is_const:
+                    self.assertIsNone(column)
+                else:
+                    self.assertEqual(column[i].tolist(), values)
+
+    def test_array(self):
+        data = numpy.array(self.reports, dtype=numpy.uint8)
+        report, columns = self.rdesc.decode_batch(data)
+        self.assertIs(report, self.report)
+        self.assertEqual(columns[4].shape, (len(self.reports), 1))
+        self.assertEqual(columns[4].dtype, numpy.int16)
+        self.assertColumnsMatch(columns)
+
+    def test_buffer(self):
+        data = b''.join(bytes(r) for r in self.reports)
+        columns = self.report.decode_batch(data)
+        self.assertColumnsMatch(columns)
+
+    def test_wrong_report_id(self):
+        data = numpy.array(self.reports, dtype=numpy.uint8)
+        data[1, 0] = 0x03
+        with self.assertRaises(ValueError):
+            self.report.decode_batch(data)
+
+    def test_empty(self):
+        for data in (b'', numpy.zeros((0, self.report.size), dtype=numpy.uint8)):
+            with self.assertRaises(ValueError):
+                self.rdesc.decode_batch(data)
+            # the report is known, there is just nothing to decode
+            columns = self.report.decode_batch(data)
+            self.assertEqual(len(columns), len(self.report.fields))
+            for field, column in zip(self.report.fields, columns):
+                if field.is_const:
+                    self.assertIsNone(column)
+                else:
+                    self.assertEqual(column.shape[0], 0)
+
+
+class TestEncoder(unittest.TestCase):
+    def test_mouse(self):
+        rdesc = ReportDescriptor.from_bytes(mouse_rdesc)
+        mouse = Data()
+        mouse.b1 = 1
+        mouse.b3 = 1
+        mouse.x = -2
+        mouse.y = 0x123
+        mouse.wheel = -1
+        r = rdesc.create_report(mouse, reportID=2)
+        self.assertEqual(r, [0x02, 0x05, 0xfe, 0x3f, 0x12, 0xff])
+
+        report, values = rdesc.decode(r)
+        self.assertEqual(values[4:], [[-2], [0x123], [-1]])
+
+    def test_range(self):
+        rdesc = ReportDescriptor.from_bytes(mouse_rdesc)
+        mouse = Data()
+        mouse.wheel = 128
+        with self.assertRaises(RangeError):
+            rdesc.create_report(mouse, reportID=2)
+
+    def test_multitouch(self):
+        rdesc = ReportDescriptor.from_string('XX ' + mt_rdesc)
+        global_data = Data()
+        global_data.contactcount = 3
+        touches = [Touch(0, 0x0102, 0x0304), Touch(1, 0x0a0b, 0x0c0d), Touch(2, 5, 6)]
+
+        r = rdesc.create_report(touches, global_data, reportID=1)
+        self.assertEqual(r, [0x01,
+                             0x07, 0x00, 0x02, 0x01, 0x04, 0x03,
+                             0x07, 0x01, 0x0b, 0x0a, 0x0d, 0x0c,
+                             0x03])
+        # the two touches in this report were consumed
+        self.assertEqual(len(touches), 1)
+        self.assertEqual(touches[0].contactid, 2)
+
+    def test_encoder_reuse(self):
+        rdesc = ReportDescriptor.from_string('XX ' + mt_rdesc)
+        encoder = rdesc.input_reports[1].encoder
+        self.assertIs(encoder, rdesc.input_reports[1].encoder)
+
+        global_data = Data()
+        global_data.contactcount = 1
+        buf = encoder.encode([Touch(3, 1, 2)], global_data)
+        self.assertIsInstance(buf, bytearray)
+        self.assertEqual(bytes(buf), bytes([0x01, 0x07, 0x03, 0x01, 0x00, 0x02, 0x00,
+                                            0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01]))
+        self.assertIs(encoder.encode([], None), buf)
+        self.assertEqual(bytes(buf), bytes([0x01] + [0x00] * 13))
+
+
+class TestFieldNames(unittest.TestCase):
+    def test_names(self):
+        rdesc = ReportDescriptor.from_bytes(mouse_rdesc)
+        fields = rdesc.input_reports[2].fields
+        self.assertEqual([f.usage_name for f in fields if not f.is_const],
+                         ['B1', 'B2', 'B3', 'X', 'Y', 'Wheel'])
+        self.assertEqual(fields[0].usage_page_name, 'Button')
+        self.assertEqual(fields[4].usage_page_name, 'Generic Desktop')
+        self.assertFalse(any(f.is_contact_meta for f in fields))
+
+        field = fields[4].copy()
+        field.usage = 0x00010031
+        self.assertEqual(field.usage_name, 'Y')
+        self.assertEqual(fields[4].usage_name, 'X')
+
+    def test_contact_meta(self):
+        rdesc = ReportDescriptor.from_string('XX ' + mt_rdesc)
+        fields = rdesc.input_reports[1].fields
+        meta = [f.usage_name for f in fields if f.is_contact_meta]
+        self.assertEqual(meta, ['Contact Id', 'Contact Id', 'Contact Count'])
+        contact_max = rdesc.feature_reports[2].fields[0]
+        self.assertTrue(contact_max.is_contact_meta)
+
+
+class TestDescriptorCache(unittest.TestCase):
+    def tearDown(self):
+        ReportDescriptor.cache = None
+
+    def test_disabled(self):
+        a = ReportDescriptor.from_bytes(mouse_rdesc)
+        b = ReportDescriptor.from_bytes(mouse_rdesc)
+        self.assertIsNot(a, b)
+
+    def test_hits(self):
+        ReportDescriptor.cache = ReportDescriptorCache(maxsize=4)
+        a = ReportDescriptor.from_bytes(mouse_rdesc)
+        b = ReportDescriptor.from_bytes(bytes(mouse_rdesc))
+        c = ReportDescriptor.from_string('XX ' + ' '.join('{:02x}'.format(b) for b in mouse_rdesc))
+        # every caller gets its own copy sharing the parsed fields
+        self.assertIsNot(a, b)
+        self.assertIsNot(a, c)
+        for r in (b, c):
+            self.assertIsNot(r.input_reports, a.input_reports)
+            for report_ID, report in a.input_reports.items():
+                self.assertIsNot(r.input_reports[report_ID], report)
+                self.assertEqual(r.input_reports[report_ID].fields, report.fields)
+                self.assertIs(r.input_reports[report_ID].layout, report.layout)
+        mt = ReportDescriptor.from_string('XX ' + mt_rdesc)
+        self.assertNotEqual(a.bytes, mt.bytes)
+
+        info = ReportDescriptor.cache.cache_info()
+        self.assertEqual(info, (2, 2, 0, 4, 2))
+
+    def test_eviction(self):
+        evicted = []
+        cache = ReportDescriptorCache(maxsize=1,
+                                      on_evict=lambda k, r: evicted.append((k, r)))
+        ReportDescriptor.cache = cache
+        a = ReportDescriptor.from_bytes(mouse_rdesc)
+        mt = ReportDescriptor.from_string('XX ' + mt_rdesc)
+        self.assertEqual([k for k, r in evicted], [cache.key(mouse_rdesc)])
+        self.assertEqual(evicted[0][1].bytes, a.bytes)
+        self.assertIn(cache.key(mt.bytes), cache)
+        ReportDescriptor.from_bytes(mouse_rdesc)
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(cache.evictions, 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_copies_do_not_share_state(self):
+        ReportDescriptor.cache = ReportDescriptorCache()
+        a = ReportDescriptor.from_string('XX ' + mt_rdesc)
+        b = ReportDescriptor.from_string('XX ' + mt_rdesc)
+        ra, rb = a.input_reports[1], b.input_reports[1]
+        self.assertIsNot(ra.encoder, rb.encoder)
+
+        global_data = Data()
+        global_data.contactcount = 2
+        report_a = ra.create_report([Touch(0, 1, 2), Touch(1, 3, 4)], global_data)
+        expected = bytes(report_a)
+        global_data.contactcount = 1
+        rb.create_report([Touch(0, 5, 6)], global_data)
+        self.assertEqual(bytes(report_a), expected)
+
+        ra.format_report(expected)
+        self.assertIsNot(ra.prev_seen_usages, getattr(rb, 'prev_seen_usages', None))
+        self.assertFalse(hasattr(ReportDescriptor.from_string('XX ' + mt_rdesc).input_reports[1],
+                                 'prev_seen_usages'))
+
+    def test_persistent(self):
+        with tempfile.TemporaryDirectory() as d:
+            ReportDescriptor.cache = PersistentReportDescriptorCache(d)
+            a = ReportDescriptor.from_string('XX ' + mt_rdesc)
+            cache_files = os.listdir(ReportDescriptor.cache.directory)
+            self.assertEqual(len(cache_files), 1)
+            with open(os.path.join(ReportDescriptor.cache.directory, cache_files[0]), 'rb') as f:
+                # the parse result, not the descriptor bytes
+                self.assertNotEqual(f.read(), bytes(a.bytes))
+
+            # a new cache simulates another process, the descriptor is
+            # loaded without parsing it
+            ReportDescriptor.cache = PersistentReportDescriptorCache(d)
+            with unittest.mock.patch.object(ReportDescriptor, '_parse_item',
+                                            side_effect=AssertionError('descriptor parsed')):
+                b = ReportDescriptor.from_string('XX ' + mt_rdesc)
+            self.assertIsNot(a, b)
+            self.assertEqual(ReportDescriptor.cache.disk_hits, 1)
+            self.assertEqual(b.bytes, a.bytes)
+            self.assertEqual(b.input_reports[1].layout, a.input_reports[1].layout)
+            self.assertEqual([f.usage_name for f in b.input_reports[1]],
+                             [f.usage_name for f in a.input_reports[1]])
+            dump_a, dump_b = io.StringIO(), io.StringIO()
+            a.dump(dump_a)
+            b.dump(dump_b)
+            self.assertEqual(dump_b.getvalue(), dump_a.getvalue())
+            ReportDescriptor.from_string('XX ' + mt_rdesc)
+            self.assertEqual(ReportDescriptor.cache.hits, 1)
+
+            global_data = Data()
+            global_data.contactcount = 2
+            self.assertEqual(b.create_report([Touch(0, 1, 2), Touch(1, 3, 4)], global_data, reportID=1),
+                             a.create_report([Touch(0, 1, 2), Touch(1, 3, 4)], global_data, reportID=1))
+
+    def test_persistent_untrusted(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = PersistentReportDescriptorCache(d)
+            ReportDescriptor.cache = cache
+            a = ReportDescriptor.from_string('XX ' + mt_rdesc)
+            path = cache._path(cache.key(a.bytes))
+
+            # writable by others
+            os.chmod(path, 0o666)
+            ReportDescriptor.cache = cache = PersistentReportDescriptorCache(d)
+            ReportDescriptor.from_string('XX ' + mt_rdesc)
+            self.assertEqual(cache.disk_hits, 0)
+            os.chmod(path, 0o600)
+
+            # content does not match the file name
+            ReportDescriptor.from_bytes(mouse_rdesc)
+            os.replace(cache._path(cache.key(mouse_rdesc)), path)
+            ReportDescriptor.cache = cache = PersistentReportDescriptorCache(d)
+            b = ReportDescriptor.from_string('XX ' + mt_rdesc)
+            self.assertEqual(cache.disk_hits, 0)
+            self.assertEqual(b.bytes, a.bytes)
+
+            # not a cache file at all
+            with open(path, 'wb') as f:
+                f.write(bytes(mouse_rdesc))
+            ReportDescriptor.cache = cache = PersistentReportDescriptorCache(d)
+            b = ReportDescriptor.from_string('XX ' + mt_rdesc)
+            self.assertEqual(cache.disk_hits, 0)
+            self.assertEqual(b.bytes, a.bytes)
+
+            # directory writable by others, nothing is read or written
+            os.unlink(path)
+            os.chmod(cache.directory, 0o777)
+            ReportDescriptor.cache = cache = PersistentReportDescriptorCache(d)
+            ReportDescriptor.from_string('XX ' + mt_rdesc)
+            self.assertEqual(os.listdir(cache.directory), [])
@@ -0,0 +1,248 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import os
+import tempfile
+import unittest
+from hidtools.recording import BinaryRecordingReader, BinaryRecordingWriter
+from hidtools.recording import TextRecordingReader, TextRecordingWriter
+from hidtools.recording import RecordingDevice, RecordingEvent, RecordingError
+from hidtools.recording import Recording, convert, open_recording, open_recording_file
+from hidtools.recording import decompress, detect_compression
+from test_rdesc import mouse_rdesc, mt_rdesc
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import logging
+logger = logging.getLogger('hidtools.test.recording')
+
+
+def make_devices():
+    return [RecordingDevice(0, 'Test Mouse', None, 0x3, 0x1234, 0x5678, mouse_rdesc),
+            RecordingDevice(1, 'Test Touch', 'usb-0000:00:14.0-1/input0', 0x18, 0x1, 0xabcd,
+                            bytes.fromhex(mt_rdesc))]
+
+
+def make_events():
+    return [RecordingEvent(0, 0, bytes([0x02, 0x01, 0x10, 0x20, 0x30, 0xff])),
+            RecordingEvent(0, 1500000, bytes([0x02, 0x00, 0x00, 0x00, 0x00, 0x00])),
+            RecordingEvent(1, 2000000, bytes([0x01] + [0x00] * 13)),
+            RecordingEvent(0, 1000001000, bytes([0x02, 0x00, 0x01, 0x00, 0x00, 0x00]))]
+
+
+class TestRecording(unittest.TestCase):
+    def write(self, writer_class, f, devices, events, *args):
+        writer = writer_class(f, *args)
+        writer.write_header(devices)
+        for e in events:
+            writer.write_event(e)
+
+    def assertDevicesEqual(self, devices, expected):
+        self.assertEqual(sorted(devices), [d.index for d in expected])
+        for d in expected:
+            other = devices[d.index]
+            self.assertEqual((other.name, other.phys, other.bustype, other.vendor_id, other.product_id, other.rdesc),
+                             (d.name, d.phys, d.bustype, d.vendor_id, d.product_id, d.rdesc))
+
+    def test_text(self):
+        devices, events = make_devices(), make_events()
+        f = io.StringIO()
+        self.write(TextRecordingWriter, f, devices, events)
+        text = f.getvalue()
+        self.assertIn('D: 1\n', text)
+        self.assertIn('P: usb-0000:00:14.0-1/input0\n', text)
+        self.assertIn('E: 000001.000001 6 02 00 01 00 00 00\n', text)
+        self.assertIn('# ReportID: 2 / Button: 1  0  0 | # | X:    16 | Y:   770 | Wheel:   -1', text)
+
+        reader = TextRecordingReader(io.StringIO(text))
+        self.assertDevicesEqual(reader.devices, devices)
+        self.assertEqual(list(reader), events)
+
+    def test_text_single_device(self):
+        devices, events = make_devices()[:1], make_events()[:2]
+        f = io.StringIO()
+        self.write(TextRecordingWriter, f, devices, events, False)
+        self.assertNotIn('D:', f.getvalue())
+        self.assertNotIn('# ReportID', f.getvalue())
+        self.assertEqual(list(TextRecordingReader(io.StringIO(f.getvalue()))), events)
+
+    def test_text_device_after_events(self):
+        devices, events = make_devices(), make_events()
+        first = io.StringIO()
+        self.write(TextRecordingWriter, first, devices[:1], events[:2])
+        second = io.StringIO()
+        self.write(TextRecordingWriter, second, devices[1:], [])
+        # a device block in the middle of the events
+        text = first.getvalue() + 'D: 1\n' + second.getvalue() + \
+            'E: 000000.002000 14 01 00 00 00 00 00 00 00 00 00 00 00 00 00\n' + \
+            'D: 0\nE: 000001.000001 6 02 00 01 00 00 00\n'
+
+        reader = TextRecordingReader(io.StringIO(text))
+        self.assertEqual(sorted(reader.devices), [0])
+        self.assertEqual(list(reader), events)
+        self.assertDevicesEqual(reader.devices, devices)
+
+        reader = TextRecordingReader(io.StringIO(text))
+        self.assertDevicesEqual(reader.read_devices(), devices)
+
+        f = io.BytesIO()
+        self.write(BinaryRecordingWriter, f, devices, events)
+        f.seek(0)
+        self.assertDevicesEqual(open_recording(f).read_devices(), devices)
+
+    def test_binary(self):
+        devices, events = make_devices(), make_events()
+        f = io.BytesIO()
+        self.write(BinaryRecordingWriter, f, devices, events)
+
+        f.seek(0)
+        reader = open_recording(f)
+        self.assertIsInstance(reader, BinaryRecordingReader)
+        self.assertDevicesEqual(reader.devices, devices)
+        self.assertEqual(list(reader), events)
+
+        # a truncated recording ends with the last complete event
+        self.assertEqual(list(BinaryRecordingReader(io.BytesIO(f.getvalue()[:-1]))), events[:-1])
+        with self.assertRaises(RecordingError):
+            BinaryRecordingReader(io.BytesIO(f.getvalue()[:10]))
+
+    def test_text_truncated(self):
+        devices, events = make_devices(), make_events()
+        f = io.StringIO()
+        self.write(TextRecordingWriter, f, devices, events)
+        text = f.getvalue()
+        self.assertEqual(list(TextRecordingReader(io.StringIO(text[:-5]))), events[:-1])
+        # the last line is complete, only the newline is missing
+        self.assertEqual(list(TextRecordingReader(io.StringIO(text[:-1]))), events)
+        # a broken line that is not the last one is still an error
+        with self.assertRaises(ValueError):
+            list(TextRecordingReader(io.StringIO(text[:-5] + '\n')))
+
+    def test_convert(self):
+        devices, events = make_devices(), make_events()
+        text = io.StringIO()
+        self.write(TextRecordingWriter, text, devices, events)
+
+        binary = io.BytesIO()
+        convert(open_recording(io.BytesIO(text.getvalue().encode('utf-8'))),
+                BinaryRecordingWriter(binary))
+        self.assertLess(len(binary.getvalue()), len(text.getvalue()) / 4)
+
+        binary.seek(0)
+        text2 = io.StringIO()
+        convert(open_recording(binary), TextRecordingWriter(text2))
+        self.assertEqual(text2.getvalue(), text.getvalue())
+
+    def test_random_access(self):
+        devices, events = make_devices(), make_events()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for writer_class, mode in ((TextRecordingWriter, 'w'), (BinaryRecordingWriter, 'wb')):
+                path = os.path.join(tmpdir, 'recording.' + mode)
+                with open(path, mode) as f:
+                    self.write(writer_class, f, devices, events)
+
+                with Recording(path) as recording:
+                    self.assertDevicesEqual(recording.devices, devices)
+                    self.assertEqual(len(recording), len(events))
+                    self.assertEqual(recording[2], events[2])
+                    self.assertEqual(recording[-1], events[-1])
+                    self.assertEqual(recording[1:3], events[1:3])
+                    self.assertEqual(list(recording.between(1000000, 2000001)), events[1:3])
+                    self.assertEqual(list(recording.between(device=1)), events[2:3])
+                    self.assertEqual(recording.seek(1500001), 2)
+                    self.assertEqual(list(recording), events[2:])
+                    self.assertEqual(list(recording), [])
+                self.assertTrue(os.path.exists(path + '.idx'))
+
+                # the second time around the index is read from the sidecar
+                with Recording(path) as recording:
+                    self.assertEqual(list(recording), events)
+
+                with Recording(path, index=False) as recording:
+                    self.assertEqual(list(recording.between(end=1)), events[:1])
+
+    def test_compression(self):
+        devices, events = make_devices(), make_events()
+        suffixes = ['', '.gz', '.xz']
+        if zstandard is not None:
+            suffixes.append('.zst')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for suffix in suffixes:
+                path = os.path.join(tmpdir, 'recording.hid' + suffix)
+                with open_recording_file(path, 'wb') as f:
+                    self.write(BinaryRecordingWriter, f, devices, events)
+
+                with open(path, 'rb') as f:
+                    compression = detect_compression(f)
+                    self.assertEqual(compression is None, suffix == '')
+                    self.assertEqual(list(open_recording(decompress(f))), events)
+
+                with open_recording_file(path) as f:
+                    self.assertEqual(list(open_recording(f)), events)
+
+                if suffix:
+                    with self.assertRaises(RecordingError):
+                        Recording(path)
+
+    def test_compression_truncated(self):
+        devices, events = make_devices(), make_events()
+        suffixes = ['.gz', '.xz']
+        if zstandard is not None:
+            suffixes.append('.zst')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for suffix in suffixes:
+                for writer_class in (BinaryRecordingWriter, TextRecordingWriter):
+                    path = os.path.join(tmpdir, 'recording.hid' + suffix)
+                    f = open_recording_file(path, 'wb')
+                    if writer_class is TextRecordingWriter:
+                        f = io.TextIOWrapper(f, encoding='utf-8')
+                    self.write(writer_class, f, devices, events)
+                    f.close()
+
+                    # a recorder that was killed leaves an unfinished stream
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    with open(path, 'wb') as f:
+                        f.write(data[:-10])
+
+                    with open_recording_file(path) as f:
+                        truncated = list(open_recording(f))
+                    self.assertEqual(truncated, events[:len(truncated)])
+
+                    with open(path, 'rb') as f:
+                        self.assertEqual(list(open_recording(decompress(f))), truncated)
+
+    def test_random_access_truncated(self):
+        devices, events = make_devices(), make_events()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for writer_class, mode in ((BinaryRecordingWriter, 'wb'), (TextRecordingWriter, 'w')):
+                path = os.path.join(tmpdir, 'recording.' + mode)
+                with open(path, mode) as f:
+                    self.write(writer_class, f, devices, events)
+                with open(path, 'r+b') as f:
+                    f.truncate(os.fstat(f.fileno()).st_size - 3)
+
+                with Recording(path, index=False) as recording:
+                    self.assertEqual(list(recording), events[:-1])
@@ -0,0 +1,297 @@
+#!/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import os
+import struct
+import threading
+import unittest
+from hidtools.dispatcher import AsyncioDispatcher, SelectorDispatcher, ThreadDispatcher
+from hidtools.uhid import UHIDDevice, _DeviceGroup
+from fakes import UHIDKernel
+from test_rdesc import mouse_rdesc
+
+import logging
+logger = logging.getLogger('hidtools.test.uhid')
+
+
+class TestInputEvents(unittest.TestCase):
+    def setUp(self):
+        self.kernel = UHIDKernel()
+        self.dispatcher = SelectorDispatcher()
+        self.uhdev = UHIDDevice(self.dispatcher, fd=self.kernel.fd)
+
+    def tearDown(self):
+        self.uhdev.destroy()
+        self.kernel.close()
+        self.dispatcher.close()
+
+    def read_events(self):
+        # the socket receives a writev() as one message, uhid handles each
+        # vector as one event
+        data = self.kernel.recv()
+        events = []
+        while data:
+            evtype, size = struct.unpack_from('< L H', data)
+            self.assertEqual(evtype, UHIDDevice._UHID_INPUT2)
+            events.append(data[6:6 + size])
+            data = data[6 + size:]
+        return events
+
+    def test_single(self):
+        self.uhdev.call_input_event([1, 2, 3])
+        self.assertEqual(self.read_events(), [b'\x01\x02\x03'])
+
+    def test_batch(self):
+        reports = [bytes([i, i + 1]) for i in range(100)] + [[0xff] * 4096, b'']
+        self.assertEqual(self.uhdev.call_input_events(reports), 102)
+        events = []
+        while len(events) < 102:
+            events.extend(self.read_events())
+        self.assertEqual(events, [bytes(r) for r in reports])
+
+    def test_too_long(self):
+        with self.assertRaises(ValueError):
+            self.uhdev.call_input_events([[0] * 4097])
+
+    def test_stats(self):
+        self.assertEqual((self.uhdev.input_count, self.uhdev.input_rate), (0, None))
+        self.uhdev.call_input_event([1])
+        self.assertEqual(self.uhdev.call_input_events([[2], [3]] * 5), 10)
+        self.assertEqual(self.uhdev.input_count, 11)
+        self.assertGreater(self.uhdev.input_seconds, 0)
+        self.assertAlmostEqual(self.uhdev.input_rate, 11 / self.uhdev.input_seconds)
+
+
+class OutputDevice(UHIDDevice):
+    def __init__(self, dispatcher, fd):
+        super().__init__(dispatcher, fd=fd)
+        self.reports = []
+
+    def set_report(self, req, rnum, rtype, data):
+        self.reports.append(('set', req, rnum, rtype, bytes(data)))
+        return 0
+
+    def output_report(self, data, size, rtype):
+        self.reports.append(('output', rtype, bytes(data)))
+
+
+class TestOutputEvents(unittest.TestCase):
+    def setUp(self):
+        self.kernel = UHIDKernel()
+        self.dispatcher = SelectorDispatcher()
+        self.uhdev = OutputDevice(self.dispatcher, self.kernel.fd)
+
+    def tearDown(self):
+        self.uhdev.destroy()
+        self.kernel.close()
+        self.dispatcher.close()
+
+    def send(self, data):
+        self.kernel.send(data)
+        self.assertEqual(self.dispatcher.dispatch(1000), 1)
+
+    def test_set_report(self):
+        self.send(struct.pack('< L L B B H 3s', UHIDDevice._UHID_SET_REPORT, 42, 0x12, 0, 3, b'\x12\x01\x02'))
+        self.assertEqual(self.uhdev.reports, [('set', 42, 0x12, 0, b'\x12\x01\x02')])
+        self.assertEqual(self.kernel.recv(), struct.pack('< L L H', UHIDDevice._UHID_SET_REPORT_REPLY, 42, 0))
+
+    def test_output(self):
+        self.send(struct.pack('< L 4096s H B', UHIDDevice._UHID_OUTPUT, b'\x01\x07', 2, 1))
+        self.send(struct.pack('< L 4096s H B', UHIDDevice._UHID_OUTPUT, b'\x02', 1, 1))
+        self.assertEqual(self.uhdev.reports, [('output', 1, b'\x01\x07'), ('output', 1, b'\x02')])
+
+
+class FakeUdevEvent(object):
+    def __init__(self, action, subsystem, sys_path, **properties):
+        self.action = action
+        self.subsystem = subsystem
+        self.sys_path = sys_path
+        self.properties = properties
+
+
+class FakeMonitor(object):
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.events = []
+
+    def fileno(self):
+        return self.monitor.fileno()
+
+    def poll(self, timeout=None):
+        return self.events.pop(0) if self.events else None
+
+
+class RoutedDevice(object):
+    def __init__(self, uniq):
+        self.uniq = uniq
+        self._udev_device = None
+        self.events = []
+
+    def _udev_event(self, event):
+        self.events.append(event)
+
+
+class TestUdevRouting(unittest.TestCase):
+    def test_routing(self):
+        dispatcher = SelectorDispatcher()
+        self.addCleanup(dispatcher.close)
+        devices = [RoutedDevice('uhid_{}'.format(i)) for i in range(100)]
+        group = _DeviceGroup.join(dispatcher, devices[0])
+        for d in devices[1:]:
+            self.assertIs(_DeviceGroup.join(dispatcher, d), group)
+        group.monitor = FakeMonitor(group.monitor)
+
+        def send(event):
+            group.monitor.events.append(event)
+            group._udev_event_callback()
+
+        uhid = '/sys/devices/virtual/misc/uhid'
+        for i in (3, 42):
+            path = '{}/0003:0001:0002.{:04X}'.format(uhid, i)
+            send(FakeUdevEvent('add', 'hid', path, HID_UNIQ='uhid_{}'.format(i)))
+            send(FakeUdevEvent('add', 'hidraw', path + '/hidraw/hidraw{}'.format(i)))
+        # not one of our devices
+        send(FakeUdevEvent('add', 'hid', uhid + '/0003:0001:0002.00FF', HID_UNIQ='other'))
+        send(FakeUdevEvent('add', 'hidraw', uhid + '/0003:0001:0002.00FF/hidraw/hidraw0'))
+
+        self.assertEqual([d for d in devices if d.events], [devices[3], devices[42]])
+        self.assertEqual([e.subsystem for e in devices[42].events], ['hid', 'hidraw'])
+        self.assertEqual(devices[42]._udev_device.sys_path, uhid + '/0003:0001:0002.002A')
+
+        fd = group.monitor.fileno()
+        for d in devices:
+            group.remove(d)
+        self.assertEqual(group._by_sys_path, {})
+        self.assertNotIn(group.dispatcher, _DeviceGroup._groups)
+        # the udev monitor is unregistered and closed
+        self.assertEqual(dispatcher._selector.get_map().get(fd), None)
+        self.assertIsNone(group.monitor)
+        with self.assertRaises(OSError):
+            os.fstat(fd)
+
+    def test_threads(self):
+        dispatcher = ThreadDispatcher()
+        self.addCleanup(dispatcher.close)
+        errors = []
+
+        def run(i):
+            try:
+                for j in range(50):
+                    d = RoutedDevice('uhid_{}_{}'.format(i, j))
+                    _DeviceGroup.join(dispatcher, d).remove(d)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertNotIn(dispatcher, _DeviceGroup._groups)
+
+
+class ReadyDevice(UHIDDevice):
+    def __init__(self, dispatcher, fd):
+        super().__init__(dispatcher, fd=fd)
+        self.name = 'uhid test ready'
+        self.info = (3, 1, 2)
+        self.rdesc = mouse_rdesc
+
+
+class TestWaitReady(unittest.TestCase):
+    def setUp(self):
+        # cleanups run in reverse order, i.e. after the device is destroyed
+        self.kernel = UHIDKernel()
+        self.addCleanup(self.kernel.close)
+        # udev events are triggered by writing to this pipe
+        self.udev_r, self.udev_w = os.pipe()
+        self.addCleanup(os.close, self.udev_r)
+        self.addCleanup(os.close, self.udev_w)
+
+    def create_device(self, dispatcher):
+        self.addCleanup(dispatcher.close)
+        device = ReadyDevice(dispatcher, self.kernel.fd)
+        self.addCleanup(device.destroy)
+        device.create_kernel_device()
+        self.assertEqual(struct.unpack_from('< L', self.kernel.recv())[0], UHIDDevice._UHID_CREATE2)
+
+        def udev_event():
+            devname = os.read(self.udev_r, 4096).decode()
+            device._udev_event(FakeUdevEvent('add', 'input', '/sys/devices/test', DEVNAME=devname))
+        dispatcher.add_reader(self.udev_r, udev_event)
+        return device
+
+    def start(self):
+        self.kernel.send(struct.pack('< L Q', UHIDDevice._UHID_START, 0))
+
+    def announce(self, devname):
+        os.write(self.udev_w, devname.encode())
+
+    def test_selector(self):
+        device = self.create_device(SelectorDispatcher())
+        self.assertFalse(device.wait_ready(timeout=0.01, require=('evdev',)))
+        self.start()
+        self.assertFalse(device.wait_ready(timeout=0.01, require=('evdev',)))
+        self.announce('/dev/input/event5')
+        self.assertTrue(device.wait_ready(timeout=5, require=('evdev',)))
+        self.assertEqual(device.device_nodes, ['/dev/input/event5'])
+        self.assertFalse(device.wait_ready(timeout=0.01))
+
+        with self.assertRaises(ValueError):
+            device.wait_ready(require=('mouse',))
+
+        # nothing would dispatch the events while waiting
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with self.assertRaises(RuntimeError):
+            loop.run_until_complete(device.async_wait_ready(0.01))
+
+    def test_thread(self):
+        device = self.create_device(ThreadDispatcher())
+        threading.Timer(0.05, self.start).start()
+        threading.Timer(0.1, self.announce, ['/dev/hidraw3']).start()
+        self.assertTrue(device.wait_ready(timeout=5, require=('hidraw',)))
+        self.assertEqual(device.hidraw_nodes, ['/dev/hidraw3'])
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        device = self.create_device(ThreadDispatcher())
+        self.assertFalse(loop.run_until_complete(device.async_wait_ready(0.01)))
+        self.start()
+        self.announce('/dev/input/event5')
+        self.assertTrue(loop.run_until_complete(device.async_wait_ready(5, ('evdev',))))
+        self.assertEqual(device._ready_waiters, [])
+
+    def test_asyncio(self):
+        loop = asyncio.new_event_loop()
+        # closed after the device is destroyed
+        self.addCleanup(loop.close)
+        device = self.create_device(AsyncioDispatcher(loop))
+        with self.assertRaises(RuntimeError):
+            device.wait_ready(0.01)
+
+        self.assertFalse(loop.run_until_complete(device.async_wait_ready(0.01)))
+        loop.call_later(0.05, self.start)
+        loop.call_later(0.1, self.announce, '/dev/hidraw3')
+        self.assertTrue(loop.run_until_complete(device.async_wait_ready(5, ('hidraw',))))
+        self.assertEqual(device.hidraw_nodes, ['/dev/hidraw3'])
+        self.assertEqual(device._ready_waiters, [])